@@ -0,0 +1,209 @@
+"""CSC110 Fall 2020 Final Project: Running Aggregates
+
+Information
+===============================
+This Python module contains the classes that will be used to keep running aggregates of
+the data inside the dataset. Running aggregates can be updated one row at a time, so the
+results of my project can be computed without ever holding every row of the dataset in
+memory at once.
+
+Copyright Information
+===============================
+This file is Copyright (c) 2020 Anis Singh.
+"""
+from typing import Dict, List, Optional
+from regression import RegressionStats, stats_from_list
+
+
+class RunningStats:
+    """The count, sum and sum of squares of a collection of numbers that is being read one
+    number at a time.
+
+    Instance Attributes:
+        - count: the number of numbers that have been added
+        - total: the sum of the numbers that have been added
+        - total_sq: the sum of the squares of the numbers that have been added
+
+    Representation Invariants:
+        - self.count >= 0
+        - self.total_sq >= 0
+
+    >>> stats = RunningStats()
+    >>> stats.add(2.0)
+    >>> stats.add(4.0)
+    >>> stats.mean()
+    3.0
+    >>> stats.variance()
+    1.0
+    """
+    count: int
+    total: float
+    total_sq: float
+
+    def __init__(self, count: int = 0, total: float = 0.0, total_sq: float = 0.0) -> None:
+        """Initialize new running stats from the given count, sum and sum of squares."""
+        self.count = count
+        self.total = total
+        self.total_sq = total_sq
+
+    def add(self, x: float) -> None:
+        """Add x to the collection of numbers these stats describe."""
+        self.count += 1
+        self.total += x
+        self.total_sq += x * x
+
+    def merge(self, other: 'RunningStats') -> None:
+        """Add every number described by other to the collection of numbers these stats
+        describe.
+
+        >>> stats = RunningStats(2, 6.0, 20.0)
+        >>> stats.merge(RunningStats(1, 1.0, 1.0))
+        >>> (stats.count, stats.total, stats.total_sq)
+        (3, 7.0, 21.0)
+        """
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+
+    def mean(self) -> float:
+        """Return the mean of the numbers that have been added.
+
+        Preconditions:
+            - self.count > 0
+        """
+        return self.total / self.count
+
+    def variance(self) -> float:
+        """Return the (population) variance of the numbers that have been added.
+
+        Preconditions:
+            - self.count > 0
+        """
+        mean = self.mean()
+        return max(self.total_sq / self.count - mean * mean, 0.0)
+
+
+class BleachingAggregates:
+    """Running aggregates of the rows of a coral bleaching dataset, which contain everything
+    that is needed to compute the results of determine_average_sstas and get_freq_and_severity
+    from the compute_on_data module.
+
+    Instance Attributes:
+        - ssta: a dictionary mapping the severity of a coral bleaching event to the running
+          stats of the SSTAs that were present when such a severe bleaching event occurred
+        - severities: a dictionary mapping each year to the running stats of the severities
+          of every row recorded that year
+        - events: a dictionary mapping each year to the running stats of the severities of
+          the coral bleaching events (the rows with a severity strictly greater than 0) that
+          occurred that year
+        - regression: the running sums of the points (SSTA, severity) of every row that has
+          SSTA data, which are used to fit a line of best fit to every row
+
+    Representation Invariants:
+        - all(year in self.events for year in self.severities)
+        - all(self.events[year].count <= self.severities[year].count for year in self.events)
+    """
+    ssta: Dict[float, RunningStats]
+    severities: Dict[int, RunningStats]
+    events: Dict[int, RunningStats]
+    regression: RegressionStats
+
+    def __init__(self) -> None:
+        """Initialize new, empty running aggregates."""
+        self.ssta = {}
+        self.severities = {}
+        self.events = {}
+        self.regression = RegressionStats()
+
+    def add_row(self, year: int, severity: float, ssta: Optional[float]) -> None:
+        """Add a single row of the dataset to these aggregates. ssta is None if there is no
+        SSTA data for the row.
+        """
+        if ssta is not None:
+            if severity not in self.ssta:
+                self.ssta[severity] = RunningStats()
+            self.ssta[severity].add(ssta)
+            self.regression.add(ssta, severity)
+
+        if year not in self.severities:
+            self.severities[year] = RunningStats()
+            self.events[year] = RunningStats()
+        self.severities[year].add(severity)
+        if severity > 0:
+            self.events[year].add(severity)
+
+    def merge(self, other: 'BleachingAggregates') -> None:
+        """Add every row described by other to these aggregates."""
+        for severity in other.ssta:
+            if severity not in self.ssta:
+                self.ssta[severity] = RunningStats()
+            self.ssta[severity].merge(other.ssta[severity])
+
+        for year in other.severities:
+            if year not in self.severities:
+                self.severities[year] = RunningStats()
+                self.events[year] = RunningStats()
+            self.severities[year].merge(other.severities[year])
+            self.events[year].merge(other.events[year])
+
+        self.regression.merge(other.regression)
+
+    def to_dict(self) -> dict:
+        """Return a dictionary describing these aggregates that can be written as json.
+
+        Each running stats is stored as a list [key, count, total, total_sq], and the lists
+        are kept in the same order as the keys of these aggregates.
+        """
+        return {'ssta': _stats_to_lists(self.ssta),
+                'severities': _stats_to_lists(self.severities),
+                'events': _stats_to_lists(self.events),
+                'regression': self.regression.to_list()}
+
+
+def aggregates_from_dict(data: dict) -> BleachingAggregates:
+    """Return the aggregates described by data.
+
+    Preconditions:
+        - data was returned by the to_dict method of a BleachingAggregates object
+
+    >>> aggregates = BleachingAggregates()
+    >>> aggregates.add_row(2005, 12.5, 0.25)
+    >>> aggregates_from_dict(aggregates.to_dict()).to_dict() == aggregates.to_dict()
+    True
+    """
+    aggregates = BleachingAggregates()
+    for key, count, total, total_sq in data['ssta']:
+        aggregates.ssta[float(key)] = RunningStats(count, total, total_sq)
+    for key, count, total, total_sq in data['severities']:
+        aggregates.severities[int(key)] = RunningStats(count, total, total_sq)
+    for key, count, total, total_sq in data['events']:
+        aggregates.events[int(key)] = RunningStats(count, total, total_sq)
+    aggregates.regression = stats_from_list(data['regression'])
+    return aggregates
+
+
+def _stats_to_lists(stats: Dict[float, RunningStats]) -> List[list]:
+    """Return a list containing a list [key, count, total, total_sq] for each key in stats.
+
+    >>> _stats_to_lists({2005: RunningStats(2, 3.0, 5.0)})
+    [[2005, 2, 3.0, 5.0]]
+    """
+    return [[key, stats[key].count, stats[key].total, stats[key].total_sq] for key in stats]
+
+
+if __name__ == '__main__':
+    import python_ta
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    python_ta.check_all(config={
+        'extra-imports': ['python_ta.contracts', 'regression'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,418 @@
+"""CSC110 Fall 2020 Final Project: Benchmarking
+
+Information
+===============================
+This Python module contains the functions that will be used to measure how long each stage of
+reading, computing on and visualizing the data takes, on synthetic datasets (generated by the
+synthetic_data module) of different sizes. For example, running
+
+    python benchmark.py --rows 10000 1000000 --output results.json --baseline baseline.json
+
+benchmarks every stage on datasets with 10 000 and 1 000 000 rows, writes the results to
+results.json, and compares them to the results that were previously written to baseline.json.
+
+Every stage is run in a new process, so that the peak memory usage (resident set size) that is
+reported for a stage is not affected by the stages that ran before it. The peak memory usage
+of a stage is how far running it raised the peak of its process above the peak reached while
+importing the modules and setting up the data of the stage, which is reported separately.
+Measuring the peak memory usage requires the resource module, which is only available on
+Unix.
+
+Copyright Information
+===============================
+This file is Copyright (c) 2020 Anis Singh.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+import read_data
+import compute_on_data
+import synthetic_data
+import visualize_results
+import rollup
+from grouped_values import GroupedValues
+
+
+BENCHMARK_DATA_DIR = 'data/synthetic'
+DATASET_SIZES = [10000, 1000000, 10000000]
+
+
+# Functions that set up and run each stage. The setup function of a stage is given the path
+# of the synthetic csv file and returns the input of the stage, and the run function of a stage
+# is given that input and returns the number of rows it processed. Only the run function of a
+# stage is timed.
+
+def _setup_nothing(filepath: str) -> str:
+    """Return filepath, for the stages that start from the csv file itself."""
+    return filepath
+
+
+def _setup_ssta_data(filepath: str) -> dict:
+    """Return the dictionary returned by read_csv_data_ssta for filepath."""
+    return read_data.read_csv_data_ssta(filepath)
+
+
+def _setup_frequency_data(filepath: str) -> dict:
+    """Return the dictionary returned by read_csv_data_frequency for filepath."""
+    return read_data.read_csv_data_frequency(filepath)
+
+
+def _setup_dataset(filepath: str) -> read_data.BleachingDataset:
+    """Return the dataset returned by load_dataset for filepath, with the columns that the
+    vectorized stages use already loaded.
+    """
+    dataset = read_data.load_dataset(filepath)
+    for name in ['Date2', 'Average_Bleaching', 'SSTA']:
+        dataset.column(name)
+    return dataset
+
+
+def _setup_map(filepath: str) -> tuple:
+    """Return a tuple containing the DataFrame that generate_map is given for filepath at
+    index 0, and a new temporary directory to write the map to at index 1.
+    """
+    df = compute_on_data.convert_dates(read_data.csv_to_dataframe(filepath))
+    return (df, tempfile.mkdtemp())
+
+
+def _setup_compact_ssta_data(filepath: str) -> GroupedValues:
+    """Return the compact mapping returned by read_csv_data_ssta for filepath."""
+    return read_data.read_csv_data_ssta(filepath, compact=True)
+
+
+def _setup_compact_frequency_data(filepath: str) -> GroupedValues:
+    """Return the compact mapping returned by read_csv_data_frequency for filepath."""
+    return read_data.read_csv_data_frequency(filepath, compact=True)
+
+
+def _setup_cube(filepath: str) -> rollup.RollupCube:
+    """Return the cube returned by load_cube for filepath."""
+    return rollup.load_cube(filepath)
+
+
+def _count_values(data: dict) -> int:
+    """Return the total number of values in the lists of data.
+
+    >>> _count_values({1: [1.0, 2.0], 2: [3.0]})
+    3
+    """
+    return sum(len(data[key]) for key in data)
+
+
+def _run_parse_csv(filepath: str) -> int:
+    """Parse every column of filepath without using or writing a column cache."""
+    return len(read_data.parse_csv_columns(filepath)[1]['ID'])
+
+
+def _run_parse_used_columns(filepath: str) -> int:
+    """Parse only the columns of filepath that the readers use, without using or writing a
+    column cache.
+    """
+    columns = read_data.parse_csv_columns(filepath, ['Date2', 'Average_Bleaching', 'SSTA'])[1]
+    return len(columns['Date2'])
+
+
+def _run_write_cache(filepath: str) -> int:
+    """Parse every column of filepath and write its column cache."""
+    shutil.rmtree(filepath + '.cache', ignore_errors=True)
+    dataset = read_data.load_dataset(filepath)
+    dataset.load_columns(dataset.column_names)
+    return dataset.num_rows()
+
+
+def _run_load_cached(filepath: str) -> int:
+    """Load the columns that the readers use from the column cache of filepath."""
+    return _setup_dataset(filepath).num_rows()
+
+
+def _run_read_ssta(filepath: str) -> int:
+    """Run read_csv_data_ssta on filepath."""
+    return _count_values(read_data.read_csv_data_ssta(filepath))
+
+
+def _run_read_frequency(filepath: str) -> int:
+    """Run read_csv_data_frequency on filepath."""
+    return _count_values(read_data.read_csv_data_frequency(filepath))
+
+
+def _run_read_ssta_compact(filepath: str) -> int:
+    """Run read_csv_data_ssta on filepath, returning a compact mapping."""
+    return read_data.read_csv_data_ssta(filepath, compact=True).num_rows()
+
+
+def _run_read_frequency_compact(filepath: str) -> int:
+    """Run read_csv_data_frequency on filepath, returning a compact mapping."""
+    return read_data.read_csv_data_frequency(filepath, compact=True).num_rows()
+
+
+def _run_csv_to_dataframe(filepath: str) -> int:
+    """Run csv_to_dataframe on filepath."""
+    return len(read_data.csv_to_dataframe(filepath))
+
+
+def _run_stream_aggregates(filepath: str) -> int:
+    """Run stream_aggregates on filepath."""
+    aggregates = read_data.stream_aggregates(filepath)
+    return sum(stats.count for stats in aggregates.severities.values())
+
+
+def _run_average_sstas(data: dict) -> int:
+    """Run determine_average_sstas on data."""
+    compute_on_data.determine_average_sstas(data)
+    return _count_values(data)
+
+
+def _run_freq_and_severity(data: dict) -> int:
+    """Run get_freq_and_severity on data."""
+    compute_on_data.get_freq_and_severity(data)
+    return _count_values(data)
+
+
+def _run_average_sstas_vectorized(dataset: read_data.BleachingDataset) -> int:
+    """Run determine_average_sstas_vectorized on the columns of dataset."""
+    compute_on_data.determine_average_sstas_vectorized(dataset.column('Average_Bleaching'),
+                                                       dataset.column('SSTA'))
+    return dataset.num_rows()
+
+
+def _run_freq_and_severity_vectorized(dataset: read_data.BleachingDataset) -> int:
+    """Run get_freq_and_severity_vectorized on the columns of dataset."""
+    compute_on_data.get_freq_and_severity_vectorized(dataset.years(),
+                                                     dataset.column('Average_Bleaching'))
+    return dataset.num_rows()
+
+
+def _run_build_cube(filepath: str) -> int:
+    """Parse the columns of filepath that its cube uses and build the cube, without using or
+    writing any cache.
+    """
+    return rollup.load_cube(filepath, use_cache=False).num_rows()
+
+
+def _run_rollup_queries(cube: rollup.RollupCube) -> int:
+    """Answer a few typical roll-up and drill-down queries from cube."""
+    compute_on_data.freq_and_severity_from_cube(cube)
+    cube.rollup(['Country_Name', 'Year']).totals()
+    cube.where({'Ocean': ['Pacific']}).rollup(['Realm', 'Ecoregion']).totals()
+    return cube.num_rows()
+
+
+def _run_map(data: tuple) -> int:
+    """Generate the map of data[0] and write it to the directory data[1]."""
+    df, output_dir = data
+    try:
+        visualize_results.generate_map(df, output_dir=output_dir, output_format='json')
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return len(df)
+
+
+def _run_map_frames(data: tuple) -> int:
+    """Generate the animated map of data[0] and write it to the directory data[1]."""
+    df, output_dir = data
+    try:
+        visualize_results.generate_animated_map(df, output_dir=output_dir,
+                                                output_format='json')
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return len(df)
+
+
+def _run_map_lazy(data: tuple) -> int:
+    """Generate the lazily loaded map of data[0], along with the files of the points of each
+    year, and write them to the directory data[1].
+    """
+    df, output_dir = data
+    try:
+        visualize_results.generate_animated_map(df, output_dir=output_dir,
+                                                output_format='html', lazy=True)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return len(df)
+
+
+# A dictionary mapping the name of each stage to its setup and run functions, in the order the
+# stages are run in. The write_cache stage must run before the stages that use the cache.
+STAGES = {
+    'parse_csv': (_setup_nothing, _run_parse_csv),
+    'parse_used_columns': (_setup_nothing, _run_parse_used_columns),
+    'write_cache': (_setup_nothing, _run_write_cache),
+    'load_cached': (_setup_nothing, _run_load_cached),
+    'read_csv_data_ssta': (_setup_nothing, _run_read_ssta),
+    'read_csv_data_frequency': (_setup_nothing, _run_read_frequency),
+    'read_csv_data_ssta_compact': (_setup_nothing, _run_read_ssta_compact),
+    'read_csv_data_frequency_compact': (_setup_nothing, _run_read_frequency_compact),
+    'csv_to_dataframe': (_setup_nothing, _run_csv_to_dataframe),
+    'stream_aggregates': (_setup_nothing, _run_stream_aggregates),
+    'determine_average_sstas': (_setup_ssta_data, _run_average_sstas),
+    'get_freq_and_severity': (_setup_frequency_data, _run_freq_and_severity),
+    'determine_average_sstas_compact': (_setup_compact_ssta_data, _run_average_sstas),
+    'get_freq_and_severity_compact': (_setup_compact_frequency_data, _run_freq_and_severity),
+    'determine_average_sstas_vectorized': (_setup_dataset, _run_average_sstas_vectorized),
+    'get_freq_and_severity_vectorized': (_setup_dataset, _run_freq_and_severity_vectorized),
+    'build_cube': (_setup_nothing, _run_build_cube),
+    'rollup_queries': (_setup_cube, _run_rollup_queries),
+    'generate_map': (_setup_map, _run_map),
+    'generate_map_frames': (_setup_map, _run_map_frames),
+    'generate_map_lazy': (_setup_map, _run_map_lazy)
+}
+
+
+def run_stage(name: str, filepath: str) -> Dict[str, float]:
+    """Run the stage called name on the csv file that filepath refers to, in the current
+    process, and return a dictionary containing its wall time (in seconds), how much it raised
+    the peak resident set size of the process (in megabytes), the peak resident set size of the
+    process before it ran (in megabytes), and the number of rows it processed per second.
+
+    Preconditions:
+        - name in STAGES
+        - filepath refers to a csv file in the format of data/coral_bleaching_data.csv
+    """
+    setup, run = STAGES[name]
+    data = setup(filepath)
+    setup_rss = _peak_rss_mb()
+
+    start = time.perf_counter()
+    rows = run(data)
+    wall_time = time.perf_counter() - start
+
+    return {'wall_time': wall_time,
+            'peak_rss_mb': _peak_rss_mb() - setup_rss,
+            'setup_rss_mb': setup_rss,
+            'rows': rows,
+            'rows_per_sec': rows / wall_time if wall_time > 0 else float('inf')}
+
+
+def _peak_rss_mb() -> float:
+    """Return the peak resident set size of the current process so far, in megabytes."""
+    # Note: ru_maxrss is measured in kilobytes on Linux, but in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak_rss /= 1024
+    return peak_rss / 1024
+
+
+def run_benchmarks(sizes: List[int], stages: List[str], data_dir: str = BENCHMARK_DATA_DIR,
+                   seed: int = 0) -> dict:
+    """Return the results of running every stage in stages on a synthetic dataset of each size
+    in sizes, where each stage is run in a new process.
+
+    The synthetic datasets are generated in data_dir with the given seed, unless they have
+    already been generated there.
+
+    Preconditions:
+        - all(size >= 0 for size in sizes)
+        - all(name in STAGES for name in stages)
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    context = multiprocessing.get_context('spawn')
+
+    results = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'datasets': {}}
+
+    for size in sizes:
+        filepath = os.path.join(data_dir, f'synthetic_{size}_{seed}.csv')
+        if not os.path.exists(filepath):
+            print(f'Generating {filepath}', file=sys.stderr)
+            synthetic_data.generate_csv(filepath, size, seed)
+
+        results['datasets'][str(size)] = {}
+        for name in [name for name in STAGES if name in stages]:
+            with context.Pool(1) as pool:
+                stage_results = pool.apply(run_stage, (name, filepath))
+            results['datasets'][str(size)][name] = stage_results
+            print(f'{size:>10} rows  {name:<36} {stage_results["wall_time"]:9.3f}s  '
+                  f'{stage_results["peak_rss_mb"]:9.1f} MB  '
+                  f'(setup {stage_results["setup_rss_mb"]:.1f} MB)  '
+                  f'{stage_results["rows_per_sec"]:14.0f} rows/s', file=sys.stderr)
+    return results
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float) \
+        -> Tuple[List[str], bool]:
+    """Return a tuple containing a line of text comparing the wall time of each stage in
+    results to its wall time in baseline at index 0, and whether any stage was more than
+    tolerance (as a fraction) slower than in baseline at index 1.
+
+    >>> old = {'datasets': {'10': {'parse_csv': {'wall_time': 1.0}}}}
+    >>> new = {'datasets': {'10': {'parse_csv': {'wall_time': 1.5}}}}
+    >>> lines, regressed = compare_to_baseline(new, old, 0.1)
+    >>> lines[0].split()
+    ['10', 'rows', 'parse_csv', '1.000s', '->', '1.500s', 'x1.50', 'SLOWER']
+    >>> regressed
+    True
+    """
+    lines = []
+    regressed = False
+    for size in results['datasets']:
+        for name in results['datasets'][size]:
+            if size not in baseline['datasets'] or name not in baseline['datasets'][size]:
+                continue
+
+            old_time = baseline['datasets'][size][name]['wall_time']
+            new_time = results['datasets'][size][name]['wall_time']
+            ratio = new_time / old_time if old_time > 0 else float('inf')
+
+            line = (f'{size:>10} rows  {name:<36} {old_time:9.3f}s -> {new_time:9.3f}s  '
+                    f'x{ratio:.2f}')
+            if ratio > 1 + tolerance:
+                line += '  SLOWER'
+                regressed = True
+            elif ratio < 1 - tolerance:
+                line += '  FASTER'
+            lines.append(line)
+    return (lines, regressed)
+
+
+def run_cli(argv: Optional[List[str]] = None) -> int:
+    """Run the command line interface of this module with the arguments in argv (or the
+    arguments this program was run with, if argv is None). Return the exit status, which is 1
+    if any stage was slower than in the baseline, or 0 otherwise.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark each stage of the project.')
+    parser.add_argument('--rows', nargs='+', type=int, default=DATASET_SIZES,
+                        help='the number of rows of each synthetic dataset to benchmark')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES),
+                        help='the stages to benchmark')
+    parser.add_argument('--data-dir', default=BENCHMARK_DATA_DIR,
+                        help='the directory the synthetic datasets are generated in')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='the seed the synthetic datasets are generated with')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='the json file to write the results to')
+    parser.add_argument('--baseline', default=None,
+                        help='a json file written by a previous run to compare the results to')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='how much slower (as a fraction) a stage can be than in the '
+                             'baseline before it is reported as slower')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.rows, args.stages, args.data_dir, args.seed)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    if args.baseline is None:
+        return 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    lines, regressed = compare_to_baseline(results, baseline, args.tolerance)
+    print('\n'.join(lines))
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    sys.exit(run_cli())
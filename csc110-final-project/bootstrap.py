@@ -0,0 +1,372 @@
+"""CSC110 Fall 2020 Final Project: Bootstrap Confidence Intervals
+
+Information
+===============================
+This Python module contains the functions that will be used to compute bootstrap confidence
+intervals for the results of my project: the frequency and average severity of the coral
+bleaching events of each year, the average SSTA of each severity, and the line of best fit of
+the SSTA of every row.
+
+The rows of each group (each year, or each severity) are resampled with replacement within
+that group. Instead of resampling one Python list at a time, a whole batch of resamples of
+every group is drawn at once as a matrix of row indices, whose statistics are then reduced
+group by group with numpy. The batches are spread over a pool of processes, and each batch is
+seeded with its own child of a single numpy SeedSequence. Since the size of each batch only
+depends on the number of rows, the intervals are the same no matter how many processes are
+used.
+
+Copyright Information
+===============================
+This file is Copyright (c) 2020 Anis Singh.
+"""
+import math
+import multiprocessing
+import os
+import warnings
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+import numpy as np
+from compute_on_data import MIN_ENTRIES_PER_YEAR
+import instrumentation
+
+
+# The default number of resamples that are drawn, and the default confidence level of the
+# intervals
+DEFAULT_RESAMPLES = 2000
+DEFAULT_CONFIDENCE = 0.95
+
+# The most row indices in the matrix of a single batch of resamples, which bounds the memory
+# used by each process to a few arrays of this many floats. Since a batch has at least one
+# resample, a dataset with more rows than this is resampled one resample per batch, so the
+# memory used by each process is instead a few arrays of as many floats as it has rows (a few
+# times the memory of the columns being resampled).
+_BATCH_ELEMENTS = 1 << 21
+
+# The statistic, columns and offsets that the batches of resamples are drawn from, which are
+# set once in each process of the pool by _set_worker_data rather than sent with every batch
+_WORKER_DATA = {}
+
+
+# Functions to compute the confidence intervals of the results of my project
+
+@instrumentation.stage
+def freq_and_severity_intervals(data: Mapping[int, Sequence[float]],
+                                num_resamples: int = DEFAULT_RESAMPLES,
+                                confidence: float = DEFAULT_CONFIDENCE, seed: int = 0,
+                                processes: Optional[int] = None) \
+        -> Dict[int, Tuple[Tuple[float, float], Tuple[float, float]]]:
+    """Return a dictionary mapping each year of the dictionary returned by
+    get_freq_and_severity for data to a tuple containing the confidence interval (low, high)
+    of its frequency at index 0, and of its average severity at index 1.
+
+    The severities of each year are resampled within that year. If processes is None, one
+    process is used per core.
+
+    Preconditions:
+        - data is the return value of the function read_csv_data_frequency from the
+          read_data module
+        - num_resamples > 0
+        - 0 < confidence < 1
+        - processes is None or processes > 0
+
+    >>> intervals = freq_and_severity_intervals({2005: [0.0] * 50 + [10.0] * 50}, 200,
+    ...                                         processes=1)
+    >>> low, high = intervals[2005][0]
+    >>> 40 <= low < 50 < high <= 60
+    True
+    >>> intervals[2005][1]
+    (10.0, 10.0)
+    """
+    years = [year for year in data if len(data[year]) > MIN_ENTRIES_PER_YEAR]
+    if years == []:
+        return {}
+
+    columns, offsets = _to_groups(data, years)
+    samples = bootstrap(_events_statistic, columns, offsets, num_resamples, seed, processes)
+    low, high = percentile_interval(samples, confidence)
+
+    return {years[i]: ((low[i][0], high[i][0]), (low[i][1], high[i][1]))
+            for i in range(len(years))}
+
+
+@instrumentation.stage
+def average_ssta_intervals(data: Mapping[float, Sequence[float]],
+                           num_resamples: int = DEFAULT_RESAMPLES,
+                           confidence: float = DEFAULT_CONFIDENCE, seed: int = 0,
+                           processes: Optional[int] = None) -> Dict[float, Tuple[float, float]]:
+    """Return a dictionary mapping each severity in data to the confidence interval
+    (low, high) of the average of its SSTAs, which is the average SSTA returned by
+    determine_average_sstas.
+
+    The SSTAs of each severity are resampled within that severity. If processes is None, one
+    process is used per core.
+
+    Preconditions:
+        - data is the return value of the function read_csv_data_ssta from the read_data
+          module
+        - num_resamples > 0
+        - 0 < confidence < 1
+        - processes is None or processes > 0
+
+    >>> average_ssta_intervals({2.0: [1.5], 0.0: [1.0, 1.0]}, 100, processes=1)
+    {2.0: (1.5, 1.5), 0.0: (1.0, 1.0)}
+    """
+    severities = list(data)
+    if severities == []:
+        return {}
+
+    columns, offsets = _to_groups(data, severities)
+    samples = bootstrap(_mean_statistic, columns, offsets, num_resamples, seed, processes)
+    low, high = percentile_interval(samples, confidence)
+
+    return {severities[i]: (low[i], high[i]) for i in range(len(severities))}
+
+
+@instrumentation.stage
+def line_fit_intervals(data: Mapping[float, Sequence[float]],
+                       num_resamples: int = DEFAULT_RESAMPLES,
+                       confidence: float = DEFAULT_CONFIDENCE, seed: int = 0,
+                       processes: Optional[int] = None) -> Dict[str, Tuple[float, float]]:
+    """Return a dictionary mapping 'slope', 'intercept' and 'r_squared' to the confidence
+    interval (low, high) of that property of the line of best fit of the SSTA of every row in
+    data, which is the line returned by stats_from_ssta_data(data).fit() from the regression
+    module.
+
+    The points (SSTA, severity) of every row are resampled together. If processes is None,
+    one process is used per core.
+
+    Preconditions:
+        - data is the return value of the function read_csv_data_ssta from the read_data
+          module
+        - num_resamples > 0
+        - 0 < confidence < 1
+        - processes is None or processes > 0
+
+    >>> intervals = line_fit_intervals({1.0: [1.0, 2.0], 3.0: [2.0, 3.0]}, 100, processes=1)
+    >>> intervals['r_squared'][1]
+    1.0
+    """
+    keys = list(data)
+    if sum(len(data[key]) for key in keys) == 0:
+        return {name: (math.nan, math.nan) for name in ['slope', 'intercept', 'r_squared']}
+
+    sstas = _to_groups(data, keys)[0][0]
+    severities = np.repeat(np.array(keys, dtype=np.float64), [len(data[key]) for key in keys])
+    samples = bootstrap(_line_fit_statistic, [sstas, severities],
+                        np.array([0, len(sstas)]), num_resamples, seed, processes)
+    low, high = percentile_interval(samples, confidence)
+
+    names = ['slope', 'intercept', 'r_squared']
+    return {names[i]: (low[0][i], high[0][i]) for i in range(len(names))}
+
+
+def percentile_interval(samples: np.ndarray, confidence: float = DEFAULT_CONFIDENCE) \
+        -> Tuple[list, list]:
+    """Return a tuple containing the lower and upper bounds of the percentile confidence
+    interval of each statistic in samples, whose first axis is the resamples, at the given
+    confidence level. The bounds are lists, nested like the statistics of a single resample.
+
+    Resamples whose statistic is undefined (NaN) are left out, and the bounds of a statistic
+    that is undefined in every resample (such as the average severity of a year without any
+    bleaching events) are NaN.
+
+    Preconditions:
+        - 0 < confidence < 1
+
+    >>> percentile_interval(np.arange(101.0), 0.5)
+    (25.0, 75.0)
+    >>> percentile_interval(np.array([[1.0, np.nan], [3.0, np.nan]]), 0.5)
+    ([1.5, nan], [2.5, nan])
+    """
+    tail = (1 - confidence) / 2 * 100
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        low, high = np.nanpercentile(samples, [tail, 100 - tail], axis=0)
+    return (low.tolist(), high.tolist())
+
+
+# Functions to draw the resamples, and to compute the statistics of a batch of resamples
+
+@instrumentation.stage
+def bootstrap(statistic: Callable[[List[np.ndarray], np.ndarray], np.ndarray],
+              columns: List[np.ndarray], offsets: np.ndarray,
+              num_resamples: int = DEFAULT_RESAMPLES, seed: int = 0,
+              processes: Optional[int] = None) -> np.ndarray:
+    """Return an array containing the statistic of each of num_resamples resamples of the
+    rows of columns, stacked along its first axis.
+
+    The rows of columns are split into groups, where the rows of group i are the rows from
+    offsets[i] (inclusive) to offsets[i + 1] (exclusive), and each group is resampled with
+    replacement within itself. The statistic of a batch of resamples is
+    statistic(resampled, offsets), where resampled contains a matrix of each column, with one
+    resample per row of the matrix.
+
+    The resamples are drawn from seed in batches, which are spread over a pool of processes
+    (or one process per core, if processes is None), and the result is the same no matter
+    how many processes are used. The processes are spawned rather than forked, since this
+    function may be called by a thread (such as a stage of a pipeline), and forking a process
+    with several threads can deadlock the child on a lock held by another thread.
+
+    Preconditions:
+        - statistic is a function defined at the top level of a module, so that it can be
+          sent to other processes
+        - all(len(column) == offsets[-1] for column in columns)
+        - offsets[0] == 0 and all(offsets[i] < offsets[i + 1] for i in range(len(offsets) - 1))
+        - num_resamples > 0
+        - processes is None or processes > 0
+
+    >>> bootstrap(_mean_statistic, [np.array([3.0, 3.0, 5.0])], np.array([0, 2, 3]), 4,
+    ...           processes=1).tolist()
+    [[3.0, 5.0], [3.0, 5.0], [3.0, 5.0], [3.0, 5.0]]
+    """
+    num_rows = int(offsets[-1])
+    batch_size = max(1, _BATCH_ELEMENTS // max(num_rows, 1))
+    sizes = [min(batch_size, num_resamples - start)
+             for start in range(0, num_resamples, batch_size)]
+    batches = list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = min(processes, len(batches))
+
+    if processes == 1:
+        results = [_resample_batch(statistic, columns, offsets, size, seed_sequence)
+                   for size, seed_sequence in batches]
+    else:
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(processes, initializer=_set_worker_data,
+                          initargs=(statistic, columns, offsets)) as pool:
+            results = pool.map(_resample_worker_batch, batches)
+    return np.concatenate(results)
+
+
+def _resample_batch(statistic: Callable[[List[np.ndarray], np.ndarray], np.ndarray],
+                    columns: List[np.ndarray], offsets: np.ndarray, size: int,
+                    seed_sequence: np.random.SeedSequence) -> np.ndarray:
+    """Return the statistic of each of size resamples of the groups of columns, drawn from
+    seed_sequence.
+
+    Preconditions:
+        - This function is only meant to be called by bootstrap as a helper function.
+    """
+    rng = np.random.default_rng(seed_sequence)
+    group_sizes = np.diff(offsets)
+
+    # The index of each row of a resample is drawn from the rows of the group it belongs to
+    starts = np.repeat(offsets[:-1], group_sizes)
+    indices = rng.integers(0, np.repeat(group_sizes, group_sizes), size=(size, len(starts)))
+    indices += starts
+    return statistic([column[indices] for column in columns], offsets)
+
+
+def _set_worker_data(statistic: Callable[[List[np.ndarray], np.ndarray], np.ndarray],
+                     columns: List[np.ndarray], offsets: np.ndarray) -> None:
+    """Set the statistic, columns and offsets that the batches of resamples of this process
+    are drawn from.
+
+    Preconditions:
+        - This function is only meant to be called by bootstrap to initialize the processes
+          of its pool.
+    """
+    _WORKER_DATA['statistic'] = statistic
+    _WORKER_DATA['columns'] = columns
+    _WORKER_DATA['offsets'] = offsets
+
+
+def _resample_worker_batch(batch: Tuple[int, np.random.SeedSequence]) -> np.ndarray:
+    """Return the statistics of batch, a tuple containing the number of resamples of the batch
+    and the seed sequence they are drawn from, in a process of the pool of bootstrap.
+
+    Preconditions:
+        - This function is only meant to be called by bootstrap as a helper function.
+    """
+    size, seed_sequence = batch
+    return _resample_batch(_WORKER_DATA['statistic'], _WORKER_DATA['columns'],
+                           _WORKER_DATA['offsets'], size, seed_sequence)
+
+
+def _mean_statistic(resampled: List[np.ndarray], offsets: np.ndarray) -> np.ndarray:
+    """Return the mean of each group of each resample of the single column in resampled.
+
+    >>> _mean_statistic([np.array([[1.0, 3.0, 5.0]])], np.array([0, 2, 3])).tolist()
+    [[2.0, 5.0]]
+    """
+    sums = np.add.reduceat(resampled[0], offsets[:-1], axis=1)
+    return sums / np.diff(offsets)
+
+
+def _events_statistic(resampled: List[np.ndarray], offsets: np.ndarray) -> np.ndarray:
+    """Return the number of coral bleaching events (severities strictly greater than 0) and
+    their average severity (or NaN if there are none) of each group of each resample of the
+    single column of severities in resampled.
+
+    >>> _events_statistic([np.array([[0.0, 4.0, 2.0, 0.0]])], np.array([0, 3, 4])).tolist()
+    [[[2.0, 3.0], [0.0, nan]]]
+    """
+    severities = resampled[0]
+    is_event = severities > 0.0
+    counts = np.add.reduceat(is_event.astype(np.float64), offsets[:-1], axis=1)
+    totals = np.add.reduceat(np.where(is_event, severities, 0.0), offsets[:-1], axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.stack([counts, totals / counts], axis=-1)
+
+
+def _line_fit_statistic(resampled: List[np.ndarray], offsets: np.ndarray) -> np.ndarray:
+    """Return the slope, intercept and coefficient of determination of the line of best fit
+    of the points (x, y) of each resample, where resampled contains the x and y coordinates,
+    computed in the same way as RegressionStats.fit from the regression module. The points
+    of each resample are a single group.
+
+    >>> _line_fit_statistic([np.array([[1.0, 2.0, 3.0]]), np.array([[3.0, 5.0, 7.0]])],
+    ...                     np.array([0, 3])).tolist()
+    [[[2.0, 1.0, 1.0]]]
+    """
+    x_coords, y_coords = resampled
+    n = int(offsets[-1])
+    sum_x = x_coords.sum(axis=1)
+    sum_y = y_coords.sum(axis=1)
+
+    # The sums of squares and products of the deviations of the points from their means
+    s_xx = np.einsum('ij,ij->i', x_coords, x_coords) - sum_x * sum_x / n
+    s_yy = np.einsum('ij,ij->i', y_coords, y_coords) - sum_y * sum_y / n
+    s_xy = np.einsum('ij,ij->i', x_coords, y_coords) - sum_x * sum_y / n
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = s_xy / s_xx
+        intercept = (sum_y - slope * sum_x) / n
+        r_squared = np.where(s_yy > 0, np.clip(s_xy * s_xy / (s_xx * s_yy), 0.0, 1.0), 1.0)
+    return np.stack([slope, intercept, r_squared], axis=-1)[:, np.newaxis, :]
+
+
+def _to_groups(data: Mapping, keys: list) -> Tuple[List[np.ndarray], np.ndarray]:
+    """Return a tuple containing a list with a single column of the values of every key in
+    keys, one key after another, at index 0, and the offsets of the values of each key in
+    that column at index 1.
+
+    >>> columns, offsets = _to_groups({1: [2.0, 3.0], 2: [4.0]}, [2, 1])
+    >>> (columns[0].tolist(), offsets.tolist())
+    ([4.0, 2.0, 3.0], [0, 1, 3])
+    """
+    groups = [np.asarray(data[key], dtype=np.float64) for key in keys]
+    offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+    np.cumsum([len(group) for group in groups], out=offsets[1:])
+    values = np.concatenate(groups) if groups != [] else np.array([], dtype=np.float64)
+    return ([values], offsets)
+
+
+if __name__ == '__main__':
+    import python_ta
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    python_ta.check_all(config={
+        'extra-imports': ['math', 'multiprocessing', 'os', 'warnings', 'python_ta.contracts',
+                          'numpy', 'compute_on_data', 'instrumentation'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import doctest
+    doctest.testmod(verbose=True)
@@ -15,14 +15,31 @@ Copyright Information
 ===============================
 This file is Copyright (c) 2020 Anis Singh.
 """
+from __future__ import annotations
 
-from typing import List, Dict, Tuple
-import pandas as pd
+import math
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
+import numpy as np
+from aggregates import BleachingAggregates
+from grouped_values import group_by_first_appearance
+import instrumentation
+
+# Note: pandas takes a long time to import, so it is only imported by the functions that
+# create a DataFrame, rather than every time this module is imported.
+if TYPE_CHECKING:
+    import pandas as pd
+    from rollup import RollupCube
+
+
+# Years with this many data entries or fewer are filtered out of the frequency and average
+# severity results to reduce outliers.
+MIN_ENTRIES_PER_YEAR = 70
 
 
 # Functions to process the data about the severity of a coral bleaching event and the SSTAs
 # that were present at the times of those bleaching events.
 
+@instrumentation.stage
 def determine_average_sstas(data: Dict[float, List[float]]) -> Dict[float, float]:
     """Return a dictionary mapping the severity of the coral bleaching events (each key
     in data) to the average of all the SSTAs that were present when such an event occurred (the
@@ -41,6 +58,7 @@ def determine_average_sstas(data: Dict[float, List[float]]) -> Dict[float, float
     return data_containing_averages
 
 
+@instrumentation.stage
 def convert_to_points(data: Dict[float, float]) -> Tuple[List[float], List[float]]:
     """Convert the values and the keys in data into x and y coordinates
     respectively. Return a tuple of two lists, where the first list contains the x
@@ -58,6 +76,18 @@ def convert_to_points(data: Dict[float, float]) -> Tuple[List[float], List[float
     return (list(data.values()), list(data.keys()))
 
 
+@instrumentation.stage
+def average_sstas_from_aggregates(aggregates: BleachingAggregates) -> Dict[float, float]:
+    """Return the same dictionary as determine_average_sstas, computed from the running
+    aggregates of a dataset instead of from lists of every SSTA.
+
+    Preconditions:
+        - aggregates is the return value of the function stream_aggregates from the
+          read_data module
+    """
+    return {key: round(aggregates.ssta[key].mean(), 3) for key in aggregates.ssta}
+
+
 def calculate_average(collection: list) -> float:
     """Return the mean value of the collection of numbers stored in collection.
 
@@ -75,12 +105,16 @@ def calculate_average(collection: list) -> float:
 # Functions to determine the frequency and average severity of all the coral bleaching events
 # per year.
 
+@instrumentation.stage
 def get_freq_and_severity(data: Dict[int, List[float]]) -> Dict[int, Tuple[int, float]]:
     """Return a dictionary mapping each year (each key in data) to a Tuple containing the frequency
     of coral bleaching events that year at index 0, and the average severity of all the bleaching
     events that happened that year at index 1. The values for the frequency and average severity
     are obtained by performing operations on the values of data.
 
+    The average severity of a year without any bleaching events (which can happen for the rows
+    of a region) is NaN, since it is undefined.
+
     Implementation Notes:
         - This function filters out any years where little data (<= 70 data entries) was recorded to
           reduce outliers.
@@ -91,7 +125,7 @@ def get_freq_and_severity(data: Dict[int, List[float]]) -> Dict[int, Tuple[int,
         - data is the return value of the function read_csv_data_frequency from the
           read_data module
     """
-    filtered_data = {key: data[key] for key in data if len(data[key]) > 70}
+    filtered_data = {key: data[key] for key in data if len(data[key]) > MIN_ENTRIES_PER_YEAR}
     return {year: (_count_occurrences(filtered_data[year], 0),
                    _get_average_severity(filtered_data[year], 0.0)) for year in filtered_data}
 
@@ -112,7 +146,8 @@ def _count_occurrences(collection: List[float], n: int) -> int:
 
 
 def _get_average_severity(collection: List[float], n: float) -> float:
-    """Return the average severity of all the items in collection that are greater than n.
+    """Return the average severity of all the items in collection that are greater than n, or
+    NaN if there are none.
 
     Preconditions:
         - This function is only meant to be called by get_freq_and_severity as a helper
@@ -123,14 +158,130 @@ def _get_average_severity(collection: List[float], n: float) -> float:
     8.0
     >>> _get_average_severity([6.0, 7.2, 4.8, 3.8], 4.3)
     6.0
+    >>> _get_average_severity([0.0, 0.0], 0.0)
+    nan
     """
     severities = [num for num in collection if num > n]
-    return sum(severities) / len(severities)
+    return _average_severity(sum(severities), len(severities))
+
+
+def _average_severity(total: float, num_events: int) -> float:
+    """Return the average severity of num_events bleaching events whose severities add up to
+    total, or NaN if there were no events.
+
+    >>> _average_severity(12.0, 3)
+    4.0
+    >>> _average_severity(0.0, 0)
+    nan
+    """
+    return total / num_events if num_events > 0 else math.nan
+
+
+@instrumentation.stage
+def freq_and_severity_from_aggregates(aggregates: BleachingAggregates) \
+        -> Dict[int, Tuple[int, float]]:
+    """Return the same dictionary as get_freq_and_severity, computed from the running
+    aggregates of a dataset instead of from lists of every severity.
+
+    Preconditions:
+        - aggregates is the return value of the function stream_aggregates from the
+          read_data module
+    """
+    return {year: (aggregates.events[year].count,
+                   _average_severity(aggregates.events[year].total, aggregates.events[year].count))
+            for year in aggregates.severities
+            if aggregates.severities[year].count > MIN_ENTRIES_PER_YEAR}
+
+
+@instrumentation.stage
+def freq_and_severity_from_cube(cube: RollupCube) -> Dict[int, Tuple[int, float]]:
+    """Return the same dictionary as get_freq_and_severity, computed by rolling up the cells of
+    a cube by year instead of from lists of every severity.
+
+    The average severities are the same as those returned by get_freq_and_severity up to
+    rounding in their last digits, since the severities of a year are summed cell by cell.
+
+    Preconditions:
+        - 'Year' in cube.dimensions
+        - cube was built from a whole dataset by the rollup module
+    """
+    years = cube.rollup(['Year'])
+    keys = years.labels['Year'][years.codes['Year']].tolist()
+    row_counts = years.measures['count'].tolist()
+    event_counts = years.measures['events'].tolist()
+    severity_totals = years.measures['severity_sum'].tolist()
+
+    return {int(keys[i]): (event_counts[i], _average_severity(severity_totals[i], event_counts[i]))
+            for i in range(len(keys)) if row_counts[i] > MIN_ENTRIES_PER_YEAR}
+
+
+# Functions that compute the same results as determine_average_sstas and get_freq_and_severity
+# as grouped reductions over the typed columns of a dataset, instead of walking Python lists.
+#
+# Note: np.bincount adds the weights of each group in the order they appear, which is the
+# same order that sum adds the items of a list in. This is what makes the results of these
+# functions identical to the results of the functions that walk Python lists, rather than
+# just very close to them.
+
+@instrumentation.stage
+def determine_average_sstas_vectorized(severities: np.ndarray, sstas: np.ndarray) \
+        -> Dict[float, float]:
+    """Return the same dictionary as determine_average_sstas, where severities[i] and sstas[i]
+    are the severity and the SSTA of the i-th row of a dataset. An SSTA of NaN means there
+    is no SSTA data for that row.
+
+    Preconditions:
+        - severities and sstas are columns of a dataset returned by the function
+          load_dataset from the read_data module
+        - len(severities) == len(sstas)
+
+    >>> determine_average_sstas_vectorized(np.array([2.0, 1.0, 2.0, 1.0]),
+    ...                                    np.array([1.0, 0.5, 2.0, np.nan]))
+    {2.0: 1.5, 1.0: 0.5}
+    """
+    sstas = np.asarray(sstas, dtype=np.float64)
+    has_ssta = ~np.isnan(sstas)
+    keys, codes = group_by_first_appearance(np.asarray(severities)[has_ssta])
+
+    counts = np.bincount(codes, minlength=len(keys)).tolist()
+    totals = np.bincount(codes, weights=sstas[has_ssta], minlength=len(keys)).tolist()
+
+    return {float(keys[i]): round(totals[i] / counts[i], 3) for i in range(len(keys))}
+
+
+@instrumentation.stage
+def get_freq_and_severity_vectorized(years: np.ndarray, severities: np.ndarray) \
+        -> Dict[int, Tuple[int, float]]:
+    """Return the same dictionary as get_freq_and_severity, where years[i] and severities[i]
+    are the year and the severity of the i-th row of a dataset.
+
+    Preconditions:
+        - years and severities are columns of a dataset returned by the function
+          load_dataset from the read_data module
+        - len(years) == len(severities)
+
+    >>> years = np.array([2006] * 71 + [2007] * 71)
+    >>> severities = np.array([0.0] * 71 + [0.0] * 70 + [5.0])
+    >>> get_freq_and_severity_vectorized(years, severities)
+    {2006: (0, nan), 2007: (1, 5.0)}
+    """
+    severities = np.asarray(severities, dtype=np.float64)
+    keys, codes = group_by_first_appearance(np.asarray(years))
+
+    row_counts = np.bincount(codes, minlength=len(keys)).tolist()
+    is_event = severities > 0.0
+    event_counts = np.bincount(codes[is_event], minlength=len(keys)).tolist()
+    event_totals = np.bincount(codes[is_event], weights=severities[is_event],
+                               minlength=len(keys)).tolist()
+
+    return {int(keys[i]): (event_counts[i], _average_severity(event_totals[i], event_counts[i]))
+            for i in range(len(keys)) if row_counts[i] > MIN_ENTRIES_PER_YEAR}
 
 
 # Function to convert the date of a bleaching event that is in the form of yyyymmdd
 # into a date that is in the form of yyyy in a DataFrame.
 
+@instrumentation.stage
 def convert_dates(df: pd.DataFrame) -> pd.DataFrame:
     """Return a DataFrame that contains dates in the form of yyyy instead of
     in the form of yyyymmdd.
@@ -145,6 +296,310 @@ def convert_dates(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+# Class that indexes the rows of a DataFrame by year, so that the rows of any year can be
+# selected without scanning the whole DataFrame.
+
+class YearIndex:
+    """The rows of a DataFrame sorted once by year and then by severity, along with the
+    offsets of the contiguous slice of rows that belongs to each year.
+
+    Instance Attributes:
+        - df: the rows of the indexed DataFrame, sorted by the Date2 column and then by the
+          Average_Bleaching column
+        - offsets: a dictionary mapping each year to a tuple containing the index of the first
+          row of that year in df at index 0, and the index after the last row of that year in
+          df at index 1
+
+    Representation Invariants:
+        - all(start < end for start, end in self.offsets.values())
+    """
+    df: pd.DataFrame
+    offsets: Dict[int, Tuple[int, int]]
+
+    def __init__(self, df: pd.DataFrame) -> None:
+        """Initialize a new index of the rows of df.
+
+        Preconditions:
+            - df is a DataFrame returned by the function convert_dates
+        """
+        # A stable sort keeps the rows with the same year and severity in their original order
+        self.df = df.sort_values(['Date2', 'Average_Bleaching'], kind='mergesort',
+                                 ignore_index=True)
+
+        years = self.df['Date2'].to_numpy()
+        distinct_years, starts = np.unique(years, return_index=True)
+        ends = starts[1:].tolist() + [len(years)]
+        self.offsets = {int(distinct_years[i]): (int(starts[i]), ends[i])
+                        for i in range(len(distinct_years))}
+
+    def years(self) -> List[int]:
+        """Return every year that has rows in this index, in ascending order."""
+        return list(self.offsets)
+
+    def rows_in_year(self, year: int) -> pd.DataFrame:
+        """Return the rows of the given year, sorted in ascending order of severity.
+
+        Preconditions:
+            - year in self.offsets
+        """
+        start, end = self.offsets[year]
+        return self.df.iloc[start:end]
+
+    def events_in_year(self, year: int) -> pd.DataFrame:
+        """Return the rows of the given year that are coral bleaching events (the rows with a
+        severity strictly greater than 0), sorted in ascending order of severity.
+
+        Preconditions:
+            - year in self.offsets
+        """
+        start, end = self.offsets[year]
+
+        # The rows of a year are sorted by severity, so the bleaching events of that year are
+        # the rows after the last row with a severity of 0 (or less)
+        severities = self.df['Average_Bleaching'].to_numpy()[start:end]
+        first_event = start + int(np.searchsorted(severities, 0.0, side='right'))
+        return self.df.iloc[first_event:end]
+
+
+# Class that indexes the rows of a DataFrame by location (and year), so that the rows inside a
+# bounding box or within a distance of a point can be selected without scanning every row.
+
+# The mean radius of the Earth, in kilometres
+EARTH_RADIUS_KM = 6371.0088
+
+# The number of distinct years that the key of a row in a SpatialIndex can hold per cell
+_YEARS_PER_CELL = 10000
+
+
+class SpatialIndex:
+    """The rows of a DataFrame grouped into the cells of a latitude/longitude grid, and sorted
+    by cell and then by year, so that the rows of any cell (and year) are a contiguous slice.
+
+    A query only looks at the rows of the cells that overlap the area being queried, and then
+    checks the exact location of just those rows, so it takes time proportional to the number
+    of rows near the area rather than to the number of rows of the DataFrame.
+
+    Instance Attributes:
+        - df: the indexed DataFrame, whose rows are returned by the queries
+        - cell_size: how many degrees wide and high each cell of the grid is
+        - order: the positions of the rows of df, sorted by their key
+        - keys: the key of each row in order, which is the index of its cell multiplied by
+          _YEARS_PER_CELL plus its year
+
+    Representation Invariants:
+        - self.cell_size > 0
+        - len(self.order) == len(self.keys) == len(self.df)
+        - all(self.keys[i] <= self.keys[i + 1] for i in range(len(self.keys) - 1))
+
+    >>> import pandas as pd
+    >>> df = pd.DataFrame({'Date2': [2005, 2006, 2005],
+    ...                    'Latitude_Degrees': [-18.0, -18.5, 40.0],
+    ...                    'Longitude_Degrees': [147.0, 147.5, -70.0],
+    ...                    'Average_Bleaching': [10.0, 0.0, 5.0]})
+    >>> index = SpatialIndex(df)
+    >>> index.bbox_positions(140.0, -30.0, 155.0, -10.0).tolist()
+    [0, 1]
+    >>> index.bbox_positions(140.0, -30.0, 155.0, -10.0, year=2006).tolist()
+    [1]
+    >>> index.radius_positions(-18.0, 147.0, 100.0).tolist()
+    [0, 1]
+    >>> index.radius_positions(-18.0, 147.0, 10.0).tolist()
+    [0]
+    """
+    df: pd.DataFrame
+    cell_size: float
+    order: np.ndarray
+    keys: np.ndarray
+    _lats: np.ndarray
+    _lons: np.ndarray
+
+    def __init__(self, df: pd.DataFrame, cell_size: float = 1.0) -> None:
+        """Initialize a new index of the rows of df, with cells that are cell_size degrees wide
+        and high.
+
+        Preconditions:
+            - df is a DataFrame returned by the function convert_dates (or a DataFrame with
+              its Date2, Latitude_Degrees and Longitude_Degrees columns)
+            - cell_size > 0
+        """
+        self.df = df
+        self.cell_size = cell_size
+        self._lats = df['Latitude_Degrees'].to_numpy(dtype=np.float64)
+        self._lons = df['Longitude_Degrees'].to_numpy(dtype=np.float64)
+
+        cells = self._lat_cells(self._lats) * self._num_lon_cells() + self._lon_cells(self._lons)
+        keys = cells * _YEARS_PER_CELL + df['Date2'].to_numpy(dtype=np.int64)
+
+        # A stable sort keeps the rows with the same key in their original order
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    def bbox_positions(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float,
+                       year: Optional[int] = None) -> np.ndarray:
+        """Return the positions (in ascending order) of the rows of df inside the bounding
+        box from (min_lon, min_lat) to (max_lon, max_lat), only of the given year if year is
+        not None. The bounding box crosses the antimeridian if min_lon > max_lon.
+
+        Preconditions:
+            - min_lat <= max_lat
+        """
+        candidates = self._candidates(min_lon, min_lat, max_lon, max_lat, year)
+        lats = self._lats[candidates]
+        lons = self._lons[candidates]
+        if min_lon <= max_lon:
+            in_lons = (lons >= min_lon) & (lons <= max_lon)
+        else:
+            in_lons = (lons >= min_lon) | (lons <= max_lon)
+        return np.sort(candidates[in_lons & (lats >= min_lat) & (lats <= max_lat)])
+
+    def radius_positions(self, lat: float, lon: float, radius_km: float,
+                         year: Optional[int] = None) -> np.ndarray:
+        """Return the positions (in ascending order) of the rows of df whose great-circle
+        distance from (lat, lon) is at most radius_km kilometres, only of the given year if
+        year is not None.
+
+        Preconditions:
+            - -90 <= lat <= 90
+            - radius_km >= 0
+        """
+        # The bounding box of the circle, which contains a pole if the circle does
+        angle = radius_km / EARTH_RADIUS_KM
+        min_lat = lat - math.degrees(angle)
+        max_lat = lat + math.degrees(angle)
+        if min_lat <= -90.0 or max_lat >= 90.0 \
+                or math.sin(angle) >= math.cos(math.radians(lat)):
+            min_lon, max_lon = -180.0, 180.0
+        else:
+            width = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(lat))))
+            min_lon = lon - width if lon - width >= -180.0 else lon - width + 360.0
+            max_lon = lon + width if lon + width <= 180.0 else lon + width - 360.0
+
+        candidates = self._candidates(min_lon, max(min_lat, -90.0), max_lon,
+                                      min(max_lat, 90.0), year)
+        distances = haversine_km(lat, lon, self._lats[candidates], self._lons[candidates])
+        return np.sort(candidates[distances <= radius_km])
+
+    def bbox(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float,
+             year: Optional[int] = None) -> pd.DataFrame:
+        """Return the rows of df inside the bounding box, in their original order. See
+        bbox_positions for the meaning of the arguments.
+        """
+        return self.df.iloc[self.bbox_positions(min_lon, min_lat, max_lon, max_lat, year)]
+
+    def radius(self, lat: float, lon: float, radius_km: float,
+               year: Optional[int] = None) -> pd.DataFrame:
+        """Return the rows of df within radius_km kilometres of (lat, lon), in their original
+        order. See radius_positions for the meaning of the arguments.
+        """
+        return self.df.iloc[self.radius_positions(lat, lon, radius_km, year)]
+
+    def _candidates(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float,
+                    year: Optional[int]) -> np.ndarray:
+        """Return the positions of the rows of df in every cell that overlaps the bounding box
+        (and of the given year, if year is not None).
+        """
+        lat_cells = np.arange(self._lat_cells(np.array([min_lat]))[0],
+                              self._lat_cells(np.array([max_lat]))[0] + 1)
+        first_lon, last_lon = self._lon_cells(np.array([min_lon, max_lon])).tolist()
+        if min_lon <= max_lon:
+            lon_cells = np.arange(first_lon, last_lon + 1)
+        else:
+            lon_cells = np.concatenate([np.arange(first_lon, self._num_lon_cells()),
+                                        np.arange(0, last_lon + 1)])
+
+        cells = (lat_cells[:, np.newaxis] * self._num_lon_cells() + lon_cells).ravel()
+        if year is None:
+            starts = np.searchsorted(self.keys, cells * _YEARS_PER_CELL, side='left')
+            ends = np.searchsorted(self.keys, (cells + 1) * _YEARS_PER_CELL, side='left')
+        else:
+            starts = np.searchsorted(self.keys, cells * _YEARS_PER_CELL + year, side='left')
+            ends = np.searchsorted(self.keys, cells * _YEARS_PER_CELL + year, side='right')
+
+        # Concatenate the slices of order from each start to each end
+        lengths = ends - starts
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return self.order[np.arange(int(lengths.sum())) + offsets]
+
+    def _num_lon_cells(self) -> int:
+        """Return the number of cells in each row of the grid."""
+        return int(math.ceil(360.0 / self.cell_size))
+
+    def _lat_cells(self, lats: np.ndarray) -> np.ndarray:
+        """Return the index of the row of the grid that each latitude in lats is in."""
+        num_lat_cells = int(math.ceil(180.0 / self.cell_size))
+        cells = np.floor((lats + 90.0) / self.cell_size).astype(np.int64)
+        return np.clip(cells, 0, num_lat_cells - 1)
+
+    def _lon_cells(self, lons: np.ndarray) -> np.ndarray:
+        """Return the index of the column of the grid that each longitude in lons is in."""
+        cells = np.floor((lons + 180.0) / self.cell_size).astype(np.int64)
+        return np.clip(cells, 0, self._num_lon_cells() - 1)
+
+
+@instrumentation.stage
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Return the great-circle distance (in kilometres) from (lat, lon) to each point
+    (lats[i], lons[i]), where every latitude and longitude is in degrees.
+
+    >>> haversine_km(0.0, 0.0, np.array([0.0, 0.0]), np.array([0.0, 1.0])).round(1).tolist()
+    [0.0, 111.2]
+    """
+    lat1 = math.radians(lat)
+    lat2 = np.radians(lats)
+    half_dlat = (lat2 - lat1) / 2
+    half_dlon = np.radians(lons - lon) / 2
+    a = np.sin(half_dlat) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(half_dlon) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+# Function to aggregate the rows of a DataFrame into the cells of a latitude/longitude grid,
+# so that a map only needs one marker per cell instead of one marker per row.
+
+@instrumentation.stage
+def bin_by_location(df: pd.DataFrame, resolution: float) -> pd.DataFrame:
+    """Return a DataFrame containing a row for each cell of a latitude/longitude grid, whose
+    cells are resolution degrees wide and high, that contains at least one row of df.
+
+    Each row of the returned DataFrame contains the latitude (Latitude_Degrees) and longitude
+    (Longitude_Degrees) of the centre of its cell, along with the number of rows of df in the
+    cell (Count), and the maximum (Max_Bleaching) and mean (Mean_Bleaching) severity of those
+    rows. The rows are sorted in ascending order of their maximum severity.
+
+    Preconditions:
+        - df has the Latitude_Degrees, Longitude_Degrees and Average_Bleaching columns of a
+          DataFrame returned by the function csv_to_dataframe from the read_data module
+        - resolution > 0
+
+    >>> import pandas as pd
+    >>> df = pd.DataFrame({'Latitude_Degrees': [0.2, 0.7, 5.5],
+    ...                    'Longitude_Degrees': [10.1, 10.9, 20.0],
+    ...                    'Average_Bleaching': [20.0, 40.0, 5.0]})
+    >>> cells = bin_by_location(df, 1.0)
+    >>> cells['Count'].tolist(), cells['Max_Bleaching'].tolist(), cells['Mean_Bleaching'].tolist()
+    ([1, 2], [5.0, 40.0], [5.0, 30.0])
+    >>> cells['Latitude_Degrees'].tolist(), cells['Longitude_Degrees'].tolist()
+    ([5.5, 0.5], [20.5, 10.5])
+    """
+    import pandas as pd
+
+    lat_cells = np.floor(df['Latitude_Degrees'].to_numpy(dtype=np.float64) / resolution)
+    lon_cells = np.floor(df['Longitude_Degrees'].to_numpy(dtype=np.float64) / resolution)
+
+    severities = df['Average_Bleaching'].to_numpy(dtype=np.float64)
+    grouped = pd.Series(severities).groupby([lat_cells, lon_cells], sort=False)
+    cells = grouped.agg(['count', 'max', 'mean'])
+
+    lat_centres = (cells.index.get_level_values(0).to_numpy() + 0.5) * resolution
+    lon_centres = (cells.index.get_level_values(1).to_numpy() + 0.5) * resolution
+
+    binned = pd.DataFrame({'Latitude_Degrees': np.clip(lat_centres, -90.0, 90.0),
+                           'Longitude_Degrees': lon_centres,
+                           'Count': cells['count'].to_numpy(),
+                           'Max_Bleaching': cells['max'].to_numpy(),
+                           'Mean_Bleaching': cells['mean'].to_numpy()})
+    return binned.sort_values(['Max_Bleaching'], kind='mergesort', ignore_index=True)
+
+
 if __name__ == '__main__':
     import python_ta
     import python_ta.contracts
@@ -153,7 +608,8 @@ if __name__ == '__main__':
     python_ta.contracts.check_all_contracts()
 
     python_ta.check_all(config={
-        'extra-imports': ['python_ta.contracts', 'pandas'],
+        'extra-imports': ['math', 'python_ta.contracts', 'numpy', 'pandas', 'aggregates',
+                          'grouped_values', 'instrumentation'],
         'allowed-io': [],
         'max-line-length': 100,
         'disable': ['R1705', 'C0200']
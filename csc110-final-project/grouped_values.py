@@ -0,0 +1,172 @@
+"""CSC110 Fall 2020 Final Project: Compact Grouped Values
+
+Information
+===============================
+This Python module contains the class that will be used to store the values of the dataset
+grouped by a key (such as the SSTAs grouped by severity, or the severities grouped by year)
+compactly. Instead of a dictionary mapping each key to a list of boxed Python floats, every
+value is stored once in a single contiguous numpy array of floats, sorted by key, along with
+the offset of the first value of each key (this is known as a CSR, or compressed sparse row,
+layout).
+
+A GroupedValues object can be read just like the dictionaries returned by read_csv_data_ssta
+and read_csv_data_frequency, so the functions that compute on those dictionaries work on it
+unchanged. The values of a key are a read-only memoryview of the values array, so they are
+never copied, but iterating over them still gives Python floats.
+
+Copyright Information
+===============================
+This file is Copyright (c) 2020 Anis Singh.
+"""
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Tuple, Union
+import numpy as np
+
+
+class GroupedValues(Mapping):
+    """A read-only mapping from each key to the values in its group, stored in a CSR layout.
+
+    Instance Attributes:
+        - group_keys: the keys, in the order they first appear in the dataset
+        - values: the values of every key, where the values of group_keys[i] are
+          values[offsets[i]:offsets[i + 1]], in the order they appear in the dataset
+        - offsets: the offset of the first value of each key in values, followed by the
+          number of values
+
+    Representation Invariants:
+        - len(self.offsets) == len(self.group_keys) + 1
+        - self.offsets[0] == 0 and self.offsets[-1] == len(self.values)
+        - all(self.offsets[i] <= self.offsets[i + 1] for i in range(len(self.group_keys)))
+        - not self.values.flags.writeable
+
+    >>> grouped = GroupedValues([2005, 2006], np.array([1.0, 2.0, 3.0]), np.array([0, 2, 3]))
+    >>> list(grouped[2005])
+    [1.0, 2.0]
+    >>> {key: sum(grouped[key]) / len(grouped[key]) for key in grouped}
+    {2005: 1.5, 2006: 3.0}
+    """
+    group_keys: List[Union[int, float]]
+    values: np.ndarray
+    offsets: np.ndarray
+    _index: Dict[Union[int, float], int]
+
+    def __init__(self, group_keys: List[Union[int, float]], values: np.ndarray,
+                 offsets: np.ndarray) -> None:
+        """Initialize a new mapping from each key in group_keys to its values in values.
+
+        Preconditions:
+            - len(offsets) == len(group_keys) + 1
+            - offsets[0] == 0 and offsets[-1] == len(values)
+        """
+        self.group_keys = group_keys
+        self.values = np.ascontiguousarray(values, dtype=np.float64)
+        self.values.flags.writeable = False
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self._index = {group_keys[i]: i for i in range(len(group_keys))}
+
+    def __getitem__(self, key: Union[int, float]) -> memoryview:
+        """Return a read-only view of the values of key, without copying them."""
+        i = self._index[key]
+        return memoryview(self.values)[int(self.offsets[i]):int(self.offsets[i + 1])]
+
+    def __iter__(self) -> Iterator[Union[int, float]]:
+        """Return an iterator over the keys of this mapping, in the order they first appear."""
+        return iter(self.group_keys)
+
+    def __len__(self) -> int:
+        """Return the number of keys in this mapping."""
+        return len(self.group_keys)
+
+    def num_rows(self) -> int:
+        """Return the total number of values of every key in this mapping."""
+        return len(self.values)
+
+    def array(self, key: Union[int, float]) -> np.ndarray:
+        """Return the values of key as a read-only numpy array that shares its memory with
+        this mapping, which can be handed to plotly or numpy without copying.
+
+        >>> grouped = GroupedValues([1.0], np.array([4.0, 5.0]), np.array([0, 2]))
+        >>> grouped.array(1.0).tolist()
+        [4.0, 5.0]
+        """
+        i = self._index[key]
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+    def key_per_value(self) -> np.ndarray:
+        """Return an array containing the key of each item of values, so that the points
+        (key_per_value()[i], values[i]) are every (key, value) pair of this mapping.
+
+        >>> grouped = GroupedValues([3.0, 1.0], np.array([4.0, 5.0, 6.0]), np.array([0, 1, 3]))
+        >>> grouped.key_per_value().tolist()
+        [3.0, 1.0, 1.0]
+        """
+        return np.repeat(np.array(self.group_keys), np.diff(self.offsets))
+
+    def to_dict(self) -> Dict[Union[int, float], List[float]]:
+        """Return this mapping as a dictionary mapping each key to a list of its values, which
+        is what read_csv_data_ssta and read_csv_data_frequency return by default.
+        """
+        values = self.values.tolist()
+        return {self.group_keys[i]: values[self.offsets[i]:self.offsets[i + 1]]
+                for i in range(len(self.group_keys))}
+
+
+def group_values(keys: np.ndarray, values: np.ndarray) -> GroupedValues:
+    """Return a GroupedValues object mapping each distinct item of keys to the list of values[i]
+    for every i where keys[i] is that item.
+
+    The keys are in the order they first appear in keys, and the values of each key are in the
+    order they appear in values, which is the same order the readers of the read_data module
+    append them to their dictionaries in.
+
+    Preconditions:
+        - len(keys) == len(values)
+
+    >>> grouped = group_values(np.array([2006, 2005, 2006]), np.array([1.0, 2.0, 3.0]))
+    >>> grouped.to_dict()
+    {2006: [1.0, 3.0], 2005: [2.0]}
+    """
+    unique, codes = group_by_first_appearance(np.asarray(keys))
+
+    # A stable sort keeps the values of each key in the order they appear
+    order = np.argsort(codes, kind='stable')
+    offsets = np.zeros(len(unique) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes, minlength=len(unique)), out=offsets[1:])
+
+    return GroupedValues(unique.tolist(), np.asarray(values, dtype=np.float64)[order], offsets)
+
+
+def group_by_first_appearance(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return a tuple containing the distinct items of values at index 0, in the order they
+    first appear in values, and an array mapping each item of values to the index of that
+    item in the distinct items at index 1.
+
+    >>> keys, codes = group_by_first_appearance(np.array([5, 3, 5, 7, 3]))
+    >>> keys.tolist(), codes.tolist()
+    ([5, 3, 7], [0, 1, 0, 2, 1])
+    """
+    unique, first_index, inverse = np.unique(values, return_index=True, return_inverse=True)
+
+    # np.unique sorts the distinct items, so they are put back in order of first appearance
+    order = np.argsort(first_index)
+    rank = np.empty(len(order), dtype=np.intp)
+    rank[order] = np.arange(len(order))
+    return unique[order], rank[inverse.ravel()]
+
+
+if __name__ == '__main__':
+    import python_ta
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    python_ta.check_all(config={
+        'extra-imports': ['collections.abc', 'python_ta.contracts', 'numpy'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,361 @@
+"""CSC110 Fall 2020 Final Project: Instrumenting the Stages of the Project
+
+Information
+===============================
+This Python module contains the functions that will be used to measure where the time (and
+memory) is spent when the results of my project are produced. Every public function of the
+read_data, compute_on_data and visualize_results modules that reads, computes on or visualizes
+a whole dataset is a stage that is decorated with the stage decorator in this module (helpers
+that are called once per key, such as calculate_average, are not, so that the overhead of
+recording them is not paid in a loop), and other blocks of code can be measured with the
+measure context manager.
+
+The stages are recorded as though they run one at a time: the depth of each record and the
+peak memory traced by tracemalloc are shared by every thread. So a pipeline runs its stages
+one at a time while instrumentation is enabled (see build_pipeline in the main module).
+
+Instrumentation is off by default, in which case a stage only checks a single flag before
+calling its function. It can be turned on by setting the CORAL_PROFILE environment variable
+(or by calling enable, which the --profile option of main.py does):
+    - CORAL_PROFILE=1 records the duration, and the number of rows in and out, of every stage
+    - CORAL_PROFILE=memory also records the peak memory allocated by every stage, using
+      tracemalloc (which makes everything much slower)
+
+Setting the CORAL_PROFILE_STAGE environment variable to the name of a stage (such as
+read_csv_data_ssta or read_data.read_csv_data_ssta) also dumps a cProfile profile and a
+tracemalloc snapshot of every call to that stage into the directory named by the
+CORAL_PROFILE_DIR environment variable (or the current directory).
+
+Copyright Information
+===============================
+This file is Copyright (c) 2020 Anis Singh.
+"""
+import cProfile
+import functools
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+class StageRecord:
+    """A record of a single call to a stage.
+
+    Instance Attributes:
+        - name: the name of the stage
+        - duration: how long the call took (in seconds)
+        - rows_in: the number of rows the stage was given, or None if it is unknown
+        - rows_out: the number of rows the stage returned, or None if it is unknown
+        - memory_allocated: the peak memory (in bytes) allocated during the call, or None if
+          memory was not being traced
+        - depth: the number of stages that were running when this call started
+
+    Representation Invariants:
+        - self.duration >= 0
+        - self.depth >= 0
+    """
+    name: str
+    duration: float
+    rows_in: Optional[int]
+    rows_out: Optional[int]
+    memory_allocated: Optional[int]
+    depth: int
+
+    def __init__(self, name: str, depth: int, rows_in: Optional[int] = None) -> None:
+        """Initialize a new record of a call to the stage called name."""
+        self.name = name
+        self.duration = 0.0
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.memory_allocated = None
+        self.depth = depth
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return a dictionary describing this record that can be written as json."""
+        return {'name': self.name, 'duration': self.duration, 'rows_in': self.rows_in,
+                'rows_out': self.rows_out, 'memory_allocated': self.memory_allocated,
+                'depth': self.depth}
+
+
+# Whether stages are instrumented, whether their memory is traced, and the name of the stage
+# that is profiled (if any)
+_ENABLED = os.environ.get('CORAL_PROFILE', '') not in {'', '0'}
+_TRACE_MEMORY = os.environ.get('CORAL_PROFILE', '') == 'memory'
+_PROFILE_STAGE = os.environ.get('CORAL_PROFILE_STAGE') or None
+_PROFILE_DIR = os.environ.get('CORAL_PROFILE_DIR', '.')
+
+# The records of every call to a stage, in the order the calls finished
+RECORDS = []
+
+# The number of stages that are currently running
+_depth = 0
+
+# The memory traced when each stage that is currently running started, and the peak memory
+# traced so far by each of them (which the stages it calls raise), from the outermost to the
+# innermost stage
+_running_starts = []
+_running_peaks = []
+
+# The number of profiles that have been dumped, which is used to give each dump a unique name
+_dump_count = 0
+
+
+def enable(trace_memory: bool = False, profile_stage: Optional[str] = None,
+           profile_dir: str = '.') -> None:
+    """Start recording every call to a stage. If trace_memory is True, also record the peak
+    memory allocated by each call. If profile_stage is not None, dump a cProfile profile and a
+    tracemalloc snapshot of every call to the stage called profile_stage into profile_dir.
+    """
+    global _ENABLED, _TRACE_MEMORY, _PROFILE_STAGE, _PROFILE_DIR
+    _ENABLED = True
+    _TRACE_MEMORY = trace_memory
+    _PROFILE_STAGE = profile_stage
+    _PROFILE_DIR = profile_dir
+
+
+def disable() -> None:
+    """Stop recording calls to stages."""
+    global _ENABLED
+    _ENABLED = False
+
+
+def is_enabled() -> bool:
+    """Return whether calls to stages are being recorded."""
+    return _ENABLED
+
+
+def stage(func: Callable) -> Callable:
+    """Return func decorated so that each call to it is recorded as a call to a stage, whenever
+    instrumentation is enabled.
+    """
+    name = f'{func.__module__}.{func.__name__}'
+
+    @functools.wraps(func)
+    def instrumented(*args: Any, **kwargs: Any) -> Any:
+        # Note: This check is the only cost of a stage when instrumentation is off
+        if not _ENABLED:
+            return func(*args, **kwargs)
+
+        rows_in = None
+        for arg in list(args) + list(kwargs.values()):
+            rows_in = count_rows(arg)
+            if rows_in is not None:
+                break
+
+        with measure(name, rows_in) as record:
+            if _is_profiled(name):
+                result = _profile_call(name, func, args, kwargs)
+            else:
+                result = func(*args, **kwargs)
+            record.rows_out = count_rows(result)
+        return result
+
+    return instrumented
+
+
+@contextmanager
+def measure(name: str, rows_in: Optional[int] = None) -> Iterator[StageRecord]:
+    """Record the block of code inside this context manager as a call to the stage called name,
+    if instrumentation is enabled. The record is yielded, so that the block can set the number
+    of rows it returns.
+
+    >>> enable(trace_memory=True)
+    >>> with measure('outer') as outer:
+    ...     data = [0.0] * 1000000
+    ...     with measure('inner') as inner:
+    ...         pass
+    >>> disable()
+    >>> (outer.depth, inner.depth)
+    (0, 1)
+    >>> outer.memory_allocated >= 8000000 > inner.memory_allocated
+    True
+    >>> RECORDS.clear()
+    """
+    global _depth
+    record = StageRecord(name, _depth, rows_in)
+    if not _ENABLED:
+        yield record
+        return
+
+    if _TRACE_MEMORY:
+        _start_tracing()
+
+    _depth += 1
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.duration = time.perf_counter() - start
+        _depth -= 1
+        if _TRACE_MEMORY:
+            record.memory_allocated = _stop_tracing()
+        RECORDS.append(record)
+
+
+def count_rows(data: Any) -> Optional[int]:
+    """Return the number of rows in data, or None if data does not have rows.
+
+    The rows of a dictionary whose values are lists (such as the dictionaries returned by
+    read_csv_data_ssta) are the items of those lists, and the rows of a tuple are the rows of
+    its first item.
+
+    >>> count_rows({2005: [1.0, 2.0], 2006: [3.0]})
+    3
+    >>> count_rows(([1.0, 2.0], [3.0, 4.0]))
+    2
+    >>> count_rows('data/coral_bleaching_data.csv') is None
+    True
+    """
+    if isinstance(data, str) or data is None:
+        return None
+    elif isinstance(data, tuple):
+        return count_rows(data[0]) if len(data) > 0 else 0
+    elif isinstance(data, dict):
+        if all(isinstance(value, list) for value in data.values()):
+            return sum(len(value) for value in data.values())
+        return len(data)
+    elif hasattr(data, 'num_rows'):
+        return data.num_rows()
+    elif hasattr(data, '__len__'):
+        return len(data)
+    else:
+        return None
+
+
+def report() -> str:
+    """Return a table of the total duration, number of calls, rows and memory of each stage
+    that has been recorded, sorted in descending order of total duration.
+    """
+    totals = {}
+    for record in RECORDS:
+        if record.name not in totals:
+            totals[record.name] = {'calls': 0, 'duration': 0.0, 'rows_in': None,
+                                   'rows_out': None, 'memory': None}
+        total = totals[record.name]
+        total['calls'] += 1
+        total['duration'] += record.duration
+        for key, rows in [('rows_in', record.rows_in), ('rows_out', record.rows_out)]:
+            if rows is not None:
+                total[key] = (total[key] or 0) + rows
+        if record.memory_allocated is not None:
+            total['memory'] = max(total['memory'] or 0, record.memory_allocated)
+
+    lines = [f'{"stage":<55} {"calls":>6} {"seconds":>9} {"rows in":>11} {"rows out":>11} '
+             f'{"peak MB":>9}']
+    for name in sorted(totals, key=lambda stage_name: -totals[stage_name]['duration']):
+        total = totals[name]
+        lines.append(f'{name:<55} {total["calls"]:>6} {total["duration"]:>9.4f} '
+                     f'{_format_rows(total["rows_in"]):>11} '
+                     f'{_format_rows(total["rows_out"]):>11} '
+                     f'{_format_megabytes(total["memory"]):>9}')
+    return '\n'.join(lines)
+
+
+def dump_records(filepath: str) -> None:
+    """Write every record that has been recorded to the json file that filepath refers to."""
+    with open(filepath, 'w') as file:
+        json.dump([record.to_dict() for record in RECORDS], file, indent=2)
+
+
+def _format_rows(rows: Optional[int]) -> str:
+    """Return rows as a string for the report, where an unknown number of rows is shown as -.
+
+    >>> _format_rows(None)
+    '-'
+    """
+    return '-' if rows is None else str(rows)
+
+
+def _format_megabytes(num_bytes: Optional[int]) -> str:
+    """Return num_bytes in megabytes as a string for the report, where an unknown number of
+    bytes is shown as -.
+
+    >>> _format_megabytes(3 * 2 ** 20)
+    '3.0'
+    """
+    return '-' if num_bytes is None else f'{num_bytes / 2 ** 20:.1f}'
+
+
+def _is_profiled(name: str) -> bool:
+    """Return whether the stage called name is the stage being profiled.
+
+    Preconditions:
+        - name is the full name (module.function) of a stage
+    """
+    return _PROFILE_STAGE is not None and \
+        (name == _PROFILE_STAGE or name.rsplit('.', 1)[-1] == _PROFILE_STAGE)
+
+
+def _profile_call(name: str, func: Callable, args: tuple, kwargs: dict) -> Any:
+    """Return func(*args, **kwargs), and dump a cProfile profile and a tracemalloc snapshot of
+    the call into the profile directory.
+    """
+    global _dump_count
+    _dump_count += 1
+    prefix = os.path.join(_PROFILE_DIR, f'{name}-{_dump_count}')
+    os.makedirs(_PROFILE_DIR, exist_ok=True)
+
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+
+    profiler = cProfile.Profile()
+    try:
+        result = profiler.runcall(func, *args, **kwargs)
+    finally:
+        profiler.dump_stats(prefix + '.prof')
+        tracemalloc.take_snapshot().dump(prefix + '.tracemalloc')
+        if not was_tracing:
+            tracemalloc.stop()
+    return result
+
+
+def _start_tracing() -> None:
+    """Start measuring the peak memory allocated by a stage that is starting.
+
+    Since tracemalloc only keeps a single peak, the peak traced so far by the stage that is
+    running (if any) is saved before the peak is reset for the new stage.
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    current, peak = tracemalloc.get_traced_memory()
+    if _running_peaks != []:
+        _running_peaks[-1] = max(_running_peaks[-1], peak)
+    tracemalloc.reset_peak()
+    _running_starts.append(current)
+    _running_peaks.append(current)
+
+
+def _stop_tracing() -> int:
+    """Return the peak memory allocated by the stage that is ending (above the memory traced
+    when it started), and add its peak to the peak of the stage that called it (if any).
+    """
+    start = _running_starts.pop()
+    peak = max(_running_peaks.pop(), tracemalloc.get_traced_memory()[1])
+    if _running_peaks != []:
+        _running_peaks[-1] = max(_running_peaks[-1], peak)
+    else:
+        tracemalloc.stop()
+    return max(peak - start, 0)
+
+
+if __name__ == '__main__':
+    import python_ta
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    python_ta.check_all(config={
+        'extra-imports': ['cProfile', 'contextlib', 'functools', 'json', 'os', 'time',
+                          'tracemalloc', 'python_ta.contracts'],
+        'allowed-io': ['dump_records'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200', 'W0603']
+    })
+
+    import doctest
+    doctest.testmod(verbose=True)
@@ -3,54 +3,813 @@
 Information
 ===============================
 This Python module is the main module. It contains a function that can be called to produce
-the results of my project in a visual way.
+the results of my project in a visual way, along with a command line interface to it. For
+example, running
+
+    python main.py --result fs --format json
+
+prints the frequency and average severity of the coral bleaching events per year as json.
+Run python main.py --help to see every option.
+
+The modules that take a long time to import (such as pandas and plotly) are only imported
+when the requested results need them, so the time spent importing modules is measured, and
+can be checked against a budget with the --import-budget option. The --profile option reports
+how long each stage of reading, computing on and visualizing the data took (see the
+instrumentation module).
+
+The results are produced by a pipeline of stages (see the pipeline module), where the stages
+that read and compute on the data are memoized in the directory given by the --memo-dir
+option. Running main.py again after changing only how a result is drawn only draws it again.
+The results that were least recently used are deleted from that directory once it holds
+more than MAX_MEMO_BYTES of results (see the pipeline module).
+
+The correlation and frequency and severity results are drawn with error bars, which are
+bootstrap confidence intervals computed from the number of resamples given by the --resamples
+option (see the bootstrap module).
 
 Copyright Information
 ===============================
 This file is Copyright (c) 2020 Anis Singh.
 """
-import read_data
-import compute_on_data
-import visualize_results
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from pipeline import Pipeline
+
+
+DATA_FILE = 'data/coral_bleaching_data.csv'
+MEMO_DIR = '.memo'
+
+# The modules whose code the stages that read and compute on the data use
+_DATA_MODULES = ['read_data', 'compute_on_data', 'regression', 'aggregates', 'grouped_values',
+                 'rollup', 'validation']
+
+# The modules whose code the stages that compute confidence intervals use
+_INTERVAL_MODULES = ['bootstrap', 'compute_on_data']
+
+# A dictionary mapping the name of each module imported by _load_module to the time (in
+# seconds) it took to import that module, including the modules it imported
+IMPORT_TIMES = {}
+
+
+def _load_module(name: str) -> ModuleType:
+    """Return the module called name, importing it (and measuring how long that takes) if it
+    has not been imported yet.
+    """
+    # Note: import_module is called even if the module has been imported, since the stages of
+    # a pipeline run in threads, and another thread may still be importing the module. In that
+    # case, import_module waits for that thread to finish importing it.
+    imported = name in sys.modules
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    if not imported:
+        IMPORT_TIMES[name] = time.perf_counter() - start
+    return module
+
+
+def state_file(data_file: str) -> str:
+    """Return the path of the json file that the running aggregates of the csv file that
+    data_file refers to are saved in by the 'incremental' engine.
+
+    >>> state_file('data/coral_bleaching_data.csv')
+    'data/coral_bleaching_data.state.json'
+    """
+    return os.path.splitext(data_file)[0] + '.state.json'
+
+
+def compute_result(result: str, engine: str = 'python', data_file: str = DATA_FILE,
+                   region: Optional[Tuple[str, List[float]]] = None) -> object:
+    """Return the data that is shown by result, computed from the csv file that data_file
+    refers to:
+        - for the correlation ('c'), a tuple containing the points returned by
+          convert_to_points at index 0, and the line of best fit of the SSTA of every row of
+          the dataset at index 1 (which is None for a region whose rows do not have at least
+          two different SSTAs)
+        - for the frequency and severity ('fs'), the dictionary returned by
+          get_freq_and_severity
+        - for the map ('m'), the DataFrame returned by convert_dates
 
+    The correlation ('c') and the frequency and severity ('fs') results are computed by the
+    given engine, and are the same no matter which engine is used:
+        - 'python' computes them from Python lists of every value in the dataset
+        - 'streaming' computes them from running aggregates while the csv file is read in
+          chunks, so the whole dataset is never held in memory
+        - 'incremental' computes them from running aggregates that are saved in a json file
+          next to the csv file, so only the rows appended to the csv file since the last run
+          are read
+        - 'numpy' computes them as grouped reductions over the typed columns of the dataset
+        - 'compact' computes them like 'python', but from compact GroupedValues mappings that
+          store every value in a single array of floats instead of in Python lists
+        - 'cube' computes the frequency and severity by rolling up the cube of the rollup
+          module by year (so the average severities may differ in their last digits), and the
+          correlation like 'numpy'
 
-def display_results(result: str) -> None:
+    If region is not None, every result is computed from the rows of a region only, which are
+    selected with a SpatialIndex (and the engine is not used):
+        - ('bbox', [min_lon, min_lat, max_lon, max_lat]) selects the rows inside a bounding box
+        - ('near', [lat, lon, radius_km]) selects the rows within radius_km kilometres of a
+          point
+
+    Preconditions:
+        - result == 'c' or result == 'fs' or result == 'm'
+        - engine in {'python', 'streaming', 'incremental', 'numpy', 'compact', 'cube'}
+        - data_file refers to a csv file in the format of data/coral_bleaching_data.csv
+        - region is None or region[0] in {'bbox', 'near'}
+    """
+    if region is not None:
+        return _compute_regional_result(result, data_file, region)
+
+    read_data = _load_module('read_data')
+    compute_on_data = _load_module('compute_on_data')
+
+    if result == 'c':
+        regression = _load_module('regression')
+
+        if engine == 'streaming':
+            aggregates = read_data.stream_aggregates(data_file)
+            refined_data = compute_on_data.average_sstas_from_aggregates(aggregates)
+            raw_stats = aggregates.regression
+        elif engine == 'incremental':
+            aggregates = read_data.update_aggregates(data_file, state_file(data_file))
+            refined_data = compute_on_data.average_sstas_from_aggregates(aggregates)
+            raw_stats = aggregates.regression
+        elif engine in {'numpy', 'cube'}:
+            dataset = read_data.load_dataset(data_file)
+            severities = dataset.column('Average_Bleaching')
+            sstas = dataset.column('SSTA')
+            refined_data = compute_on_data.determine_average_sstas_vectorized(severities, sstas)
+            raw_stats = regression.stats_from_columns(sstas, severities)
+        else:
+            raw_data = read_data.read_csv_data_ssta(data_file, engine == 'compact')
+            refined_data = compute_on_data.determine_average_sstas(raw_data)
+            raw_stats = regression.stats_from_ssta_data(raw_data)
+
+        return (compute_on_data.convert_to_points(refined_data), raw_stats.fit())
+
+    elif result == 'fs':
+        if engine == 'streaming':
+            aggregates = read_data.stream_aggregates(data_file)
+            return compute_on_data.freq_and_severity_from_aggregates(aggregates)
+        elif engine == 'incremental':
+            aggregates = read_data.update_aggregates(data_file, state_file(data_file))
+            return compute_on_data.freq_and_severity_from_aggregates(aggregates)
+        elif engine == 'numpy':
+            dataset = read_data.load_dataset(data_file)
+            return compute_on_data.get_freq_and_severity_vectorized(
+                dataset.years(), dataset.column('Average_Bleaching'))
+        elif engine == 'cube':
+            cube = _load_module('rollup').load_cube(data_file)
+            return compute_on_data.freq_and_severity_from_cube(cube)
+        else:
+            raw_data = read_data.read_csv_data_frequency(data_file, engine == 'compact')
+            return compute_on_data.get_freq_and_severity(raw_data)
+
+    else:
+        # Note: pandas is loaded here, rather than by read_data, so that the time it takes to
+        # import is measured
+        _load_module('pandas')
+        raw_dataframe = read_data.csv_to_dataframe(data_file)
+        return compute_on_data.convert_dates(raw_dataframe)
+
+
+def display_results(result: str, engine: str = 'python',
+                    map_resolution: Optional[float] = None, output_dir: Optional[str] = None,
+                    output_format: str = 'html', data_file: str = DATA_FILE,
+                    region: Optional[Tuple[str, List[float]]] = None,
+                    memo_dir: Optional[str] = None, map_mode: str = 'traces',
+                    num_resamples: int = 2000, seed: int = 0) -> None:
     """Display the results of this project. Which results are displayed
     depends on result.
 
+    The correlation ('c') result shows a line of best fit of the average SSTAs, along with a
+    line of best fit of the SSTA of every row of the dataset. See compute_result for how the
+    given engine computes the results, and how region restricts them to a region.
+
+    If map_resolution is not None, the map ('m') shows one marker per cell of a
+    latitude/longitude grid whose cells are map_resolution degrees wide and high, instead of
+    one marker per coral bleaching event.
+
+    The map_mode decides how the map switches between years:
+        - 'traces' draws every year as its own trace, and shows only the trace of the chosen
+          year (see generate_map)
+        - 'frames' draws a single trace, and animates it to the frame of the chosen year
+        - 'lazy' draws a single trace, and loads the points of the chosen year from a separate
+          json file when it is first chosen (see generate_animated_map)
+
+    If output_dir is None, the results are shown in a browser. Otherwise, they are written to
+    output_dir as HTML files or figure JSON (depending on output_format), and a result is only
+    rendered again if the data it shows has changed since it was last written.
+
+    If memo_dir is not None, the results of the stages that read and compute on the data are
+    memoized in memo_dir (see build_pipeline).
+
+    Unless num_resamples is 0, the correlation and frequency and severity results are drawn
+    with error bars, which are the bootstrap confidence intervals of num_resamples resamples
+    drawn from the given seed.
+
     Preconditions:
         - result == 'c' or result == 'fs' or result == 'm'
+        - engine in {'python', 'streaming', 'incremental', 'numpy', 'compact', 'cube'}
+        - map_resolution is None or map_resolution > 0
+        - output_format in {'html', 'json'}
+        - data_file refers to a csv file in the format of data/coral_bleaching_data.csv
+        - region is None or region[0] in {'bbox', 'near'}
+        - map_mode in {'traces', 'frames', 'lazy'}
+        - map_mode != 'lazy' or (output_dir is not None and output_format == 'html')
+        - num_resamples >= 0
+    """
+    pipeline = build_pipeline(engine, data_file, region, map_resolution, output_dir,
+                              output_format, memo_dir, map_mode=map_mode,
+                              num_resamples=num_resamples, seed=seed)
+    pipeline.run(['show_' + result])
+
+
+def build_pipeline(engine: str = 'python', data_file: str = DATA_FILE,
+                   region: Optional[Tuple[str, List[float]]] = None,
+                   map_resolution: Optional[float] = None, output_dir: Optional[str] = None,
+                   output_format: str = 'html', memo_dir: Optional[str] = None,
+                   max_workers: int = 4, map_mode: str = 'traces', num_resamples: int = 2000,
+                   seed: int = 0) -> 'Pipeline':
+    """Return the pipeline of stages that produces the results of this project, where:
+        - the stages 'c', 'fs' and 'm' compute the same data as compute_result for each result
+        - the stages 'c_ci' and 'fs_ci' compute the confidence intervals of the 'c' and 'fs'
+          results (see _correlation_intervals and _freq_and_severity_intervals), unless
+          num_resamples is 0
+        - the stages 'show_c', 'show_fs' and 'show_m' display each result like display_results
+
+    For the 'python', 'compact', 'streaming' and 'incremental' engines, reading the data of a
+    result and each step of computing on it are separate stages, so a step is only run again
+    when its code or its input changes (and the 'streaming' and 'incremental' engines read the
+    running aggregates of both results once). The other engines are computed by a single stage
+    per result. The results of a region are each selected by a single stage from the spatial
+    index of the dataset, which is built once by the 'spatial_index' stage.
+
+    The confidence intervals are always computed from the data of each group (each severity,
+    or each year) read by read_csv_data_ssta and read_csv_data_frequency, or from the rows of
+    the region, since the running aggregates of the other engines do not keep the rows that
+    are resampled.
+
+    The results of every stage except the ones that display results (and the DataFrame of the
+    whole dataset, which is quick to load from the column cache) are memoized in memo_dir,
+    unless memo_dir is None.
+
+    The stages run on up to max_workers threads, except while instrumentation is enabled, when
+    they run one at a time so that each record only measures its own stage.
+
+    Preconditions:
+        - engine in {'python', 'streaming', 'incremental', 'numpy', 'compact', 'cube'}
+        - data_file refers to a csv file in the format of data/coral_bleaching_data.csv
+        - region is None or region[0] in {'bbox', 'near'}
+        - map_resolution is None or map_resolution > 0
+        - output_format in {'html', 'json'}
+        - max_workers >= 1
+        - map_mode in {'traces', 'frames', 'lazy'}
+        - map_mode != 'lazy' or (output_dir is not None and output_format == 'html')
+        - num_resamples >= 0
     """
+    pipeline = _load_module('pipeline')
+    stage = pipeline.Stage
+    stages = []
+
+    # Note: The stages run one at a time while they are instrumented, so that the record of
+    # each stage only measures that stage (see the instrumentation module)
+    if _load_module('instrumentation').is_enabled():
+        max_workers = 1
+
+    if engine in {'python', 'compact'} and region is None:
+        compact = engine == 'compact'
+        stages.extend([
+            stage('ssta_data', _read_ssta_data, [], {'data_file': data_file, 'compact': compact},
+                  [data_file], ['read_data', 'grouped_values']),
+            stage('average_sstas', _average_sstas, ['ssta_data'], modules=['compute_on_data']),
+            stage('points', _points, ['average_sstas'], modules=['compute_on_data']),
+            stage('raw_fit', _raw_fit, ['ssta_data'], modules=['regression']),
+            stage('c', _correlation, ['points', 'raw_fit'], memoize=False),
+            stage('frequency_data', _read_frequency_data, [],
+                  {'data_file': data_file, 'compact': compact}, [data_file],
+                  ['read_data', 'grouped_values']),
+            stage('fs', _freq_and_severity, ['frequency_data'], modules=['compute_on_data'])
+        ])
+    elif engine in {'streaming', 'incremental'} and region is None:
+        # Note: Both results are computed from the same running aggregates, so the csv file is
+        # only read (and the state file of the 'incremental' engine only updated) once
+        stages.extend([
+            stage('aggregates', _aggregates, [],
+                  {'data_file': data_file, 'incremental': engine == 'incremental'},
+                  [data_file], ['read_data', 'aggregates']),
+            stage('average_sstas', _average_sstas_from_aggregates, ['aggregates'],
+                  modules=['compute_on_data']),
+            stage('points', _points, ['average_sstas'], modules=['compute_on_data']),
+            stage('raw_fit', _raw_fit_from_aggregates, ['aggregates'],
+                  modules=['regression']),
+            stage('c', _correlation, ['points', 'raw_fit'], memoize=False),
+            stage('fs', _freq_and_severity_from_aggregates, ['aggregates'],
+                  modules=['compute_on_data'])
+        ])
+    elif region is None:
+        for result in ['c', 'fs']:
+            stages.append(stage(result, compute_result, [],
+                                {'result': result, 'engine': engine, 'data_file': data_file,
+                                 'region': region}, [data_file], _DATA_MODULES))
+    else:
+        # Note: The spatial index of the dataset is built once, by a single stage, and every
+        # result of the region is selected from it
+        stages.append(stage('spatial_index', _spatial_index, ['dataframe'],
+                            modules=['compute_on_data'], memoize=False))
+        stages.extend([stage(result, _regional_result, ['spatial_index'],
+                             {'result': result, 'region': region},
+                             modules=['compute_on_data', 'regression'])
+                       for result in ['c', 'fs', 'm']])
+
+    if num_resamples > 0:
+        if region is not None:
+            stages.extend([stage(name, _regional_groups, ['spatial_index'],
+                                 {'result': result, 'region': region},
+                                 modules=['compute_on_data'])
+                           for name, result in [('ssta_data', 'c'), ('frequency_data', 'fs')]])
+        elif engine not in {'python', 'compact'}:
+            stages.extend([
+                stage('ssta_data', _read_ssta_data, [],
+                      {'data_file': data_file, 'compact': True}, [data_file],
+                      ['read_data', 'grouped_values']),
+                stage('frequency_data', _read_frequency_data, [],
+                      {'data_file': data_file, 'compact': True}, [data_file],
+                      ['read_data', 'grouped_values'])
+            ])
+
+        resampling = {'num_resamples': num_resamples, 'seed': seed}
+        stages.extend([
+            stage('c_ci', _correlation_intervals, ['ssta_data'], resampling,
+                  modules=_INTERVAL_MODULES),
+            stage('fs_ci', _freq_and_severity_intervals, ['frequency_data'], resampling,
+                  modules=_INTERVAL_MODULES)
+        ])
+        intervals = {'c': ['c_ci'], 'fs': ['fs_ci']}
+    else:
+        intervals = {'c': [], 'fs': []}
+
+    stages.append(stage('dataframe', _dataframe, [], {'data_file': data_file}, [data_file],
+                        ['read_data'], memoize=False))
+    if region is None:
+        stages.append(stage('m', _map_data, ['dataframe'], modules=['compute_on_data']))
+
+    display = {'output_dir': output_dir, 'output_format': output_format}
+    stages.extend([
+        stage('show_c', _show_correlation, ['c'] + intervals['c'], display, memoize=False),
+        stage('show_fs', _show_freq_and_severity, ['fs'] + intervals['fs'], display,
+              memoize=False),
+        stage('show_m', _show_map, ['m'],
+              {'resolution': map_resolution, 'map_mode': map_mode, **display},
+              memoize=False)
+    ])
+    return pipeline.Pipeline(stages, memo_dir, max_workers)
+
+
+# Functions that are run by the stages of the pipeline returned by build_pipeline.
+
+def _read_ssta_data(data_file: str, compact: bool) -> object:
+    """Return the data returned by read_csv_data_ssta for data_file."""
+    return _load_module('read_data').read_csv_data_ssta(data_file, compact)
+
+
+def _read_frequency_data(data_file: str, compact: bool) -> object:
+    """Return the data returned by read_csv_data_frequency for data_file."""
+    return _load_module('read_data').read_csv_data_frequency(data_file, compact)
+
+
+def _aggregates(data_file: str, incremental: bool) -> Any:
+    """Return the running aggregates of data_file, updated from its state file if incremental
+    is True, or read from the whole csv file otherwise.
+    """
+    read_data = _load_module('read_data')
+    if incremental:
+        return read_data.update_aggregates(data_file, state_file(data_file))
+    return read_data.stream_aggregates(data_file)
+
+
+def _average_sstas_from_aggregates(aggregates: Any) -> Dict[float, float]:
+    """Return the average SSTA of each severity in aggregates."""
+    return _load_module('compute_on_data').average_sstas_from_aggregates(aggregates)
+
+
+def _raw_fit_from_aggregates(aggregates: Any) -> Any:
+    """Return the line of best fit of the SSTA of every row in aggregates."""
+    return aggregates.regression.fit()
+
+
+def _freq_and_severity_from_aggregates(aggregates: Any) -> Dict[int, Tuple[int, float]]:
+    """Return the frequency and average severity of each year in aggregates."""
+    return _load_module('compute_on_data').freq_and_severity_from_aggregates(aggregates)
+
+
+def _average_sstas(ssta_data: Dict[float, List[float]]) -> Dict[float, float]:
+    """Return the average SSTA of each severity in ssta_data."""
+    return _load_module('compute_on_data').determine_average_sstas(ssta_data)
+
+
+def _points(average_sstas: Dict[float, float]) -> Tuple[List[float], List[float]]:
+    """Return the points of the average SSTA of each severity."""
+    return _load_module('compute_on_data').convert_to_points(average_sstas)
+
+
+def _raw_fit(ssta_data: Dict[float, List[float]]) -> Any:
+    """Return the line of best fit of the SSTA of every row in ssta_data."""
+    return _load_module('regression').stats_from_ssta_data(ssta_data).fit()
+
+
+def _correlation(points: Tuple[List[float], List[float]], raw_fit: Any) -> tuple:
+    """Return the data of the correlation result, as compute_result returns it."""
+    return (points, raw_fit)
+
+
+def _freq_and_severity(frequency_data: Dict[int, List[float]]) -> Dict[int, Tuple[int, float]]:
+    """Return the frequency and average severity of each year in frequency_data."""
+    return _load_module('compute_on_data').get_freq_and_severity(frequency_data)
+
+
+def _correlation_intervals(ssta_data: Dict[float, List[float]], num_resamples: int,
+                           seed: int) -> tuple:
+    """Return a tuple containing the confidence intervals of the average SSTA of each
+    severity in ssta_data at index 0, and of the line of best fit of the SSTA of every row in
+    ssta_data at index 1.
+    """
+    bootstrap = _load_module('bootstrap')
+    return (bootstrap.average_ssta_intervals(ssta_data, num_resamples, seed=seed),
+            bootstrap.line_fit_intervals(ssta_data, num_resamples, seed=seed))
+
+
+def _freq_and_severity_intervals(frequency_data: Dict[int, List[float]], num_resamples: int,
+                                 seed: int) -> Dict[int, tuple]:
+    """Return the confidence intervals of the frequency and average severity of each year in
+    frequency_data.
+    """
+    return _load_module('bootstrap').freq_and_severity_intervals(frequency_data, num_resamples,
+                                                                 seed=seed)
+
+
+def _dataframe(data_file: str) -> Any:
+    """Return the DataFrame of every row of data_file."""
+    # Note: pandas is loaded here, rather than by read_data, so that the time it takes to
+    # import is measured
+    _load_module('pandas')
+    return _load_module('read_data').csv_to_dataframe(data_file)
+
+
+def _map_data(dataframe: Any) -> Any:
+    """Return the DataFrame that the map is generated from."""
+    return _load_module('compute_on_data').convert_dates(dataframe)
+
+
+def _show_correlation(refined_data: tuple, intervals: Optional[tuple] = None,
+                      output_dir: Optional[str] = None, output_format: str = 'html') -> None:
+    """Display the correlation result, with the given confidence intervals."""
+    points, raw_fit = refined_data
+    _load_module('visualize_results').show_correlation(points[0], points[1], raw_fit,
+                                                       output_dir, output_format, intervals)
+
+
+def _show_freq_and_severity(refined_data: Dict[int, Tuple[int, float]],
+                            intervals: Optional[Dict[int, tuple]] = None,
+                            output_dir: Optional[str] = None,
+                            output_format: str = 'html') -> None:
+    """Display the frequency and severity result, with the given confidence intervals."""
+    _load_module('visualize_results').show_freq_and_severity(refined_data, output_dir,
+                                                             output_format, intervals)
+
+
+def _show_map(refined_data: Any, resolution: Optional[float], map_mode: str,
+              output_dir: Optional[str], output_format: str) -> None:
+    """Display the map result in the given map_mode."""
+    visualize_results = _load_module('visualize_results')
+    if map_mode == 'traces':
+        visualize_results.generate_map(refined_data, resolution=resolution,
+                                       output_dir=output_dir, output_format=output_format)
+    else:
+        visualize_results.generate_animated_map(refined_data, resolution=resolution,
+                                                output_dir=output_dir,
+                                                output_format=output_format,
+                                                lazy=map_mode == 'lazy')
+
+
+def _compute_regional_result(result: str, data_file: str,
+                             region: Tuple[str, List[float]]) -> object:
+    """Return the same data as compute_result for result, computed from the rows of the
+    region of the csv file that data_file refers to.
+
+    Preconditions:
+        - This function is only meant to be called by compute_result as a helper function.
+    """
+    return _regional_result(_spatial_index(_dataframe(data_file)), result, region)
+
+
+def _spatial_index(dataframe: Any) -> Any:
+    """Return the SpatialIndex of the rows of dataframe, with the years of their dates (see
+    convert_dates).
+    """
+    compute_on_data = _load_module('compute_on_data')
+    return compute_on_data.SpatialIndex(compute_on_data.convert_dates(dataframe))
+
+
+def _regional_result(spatial_index: Any, result: str, region: Tuple[str, List[float]]) -> object:
+    """Return the same data as compute_result for result, computed from the rows of the
+    region that spatial_index selects.
+
+    The line of best fit of the correlation result is None if it cannot be fit, since the
+    region has fewer than two rows with different SSTAs.
+
+    Preconditions:
+        - spatial_index was returned by _spatial_index
+        - result == 'c' or result == 'fs' or result == 'm'
+
+    >>> import pandas as pd
+    >>> df = pd.DataFrame({'Date2': [2005], 'Latitude_Degrees': [-18.0],
+    ...                    'Longitude_Degrees': [147.0], 'Average_Bleaching': [10.0],
+    ...                    'SSTA': [0.5]})
+    >>> spatial_index = _load_module('compute_on_data').SpatialIndex(df)
+    >>> _regional_result(spatial_index, 'c', ('bbox', [0.0, 0.0, 1.0, 1.0]))
+    (([], []), None)
+    >>> _regional_result(spatial_index, 'fs', ('bbox', [0.0, 0.0, 1.0, 1.0]))
+    {}
+    >>> _regional_result(spatial_index, 'c', ('near', [-18.0, 147.0, 5.0]))
+    (([0.5], [10.0]), None)
+    >>> df = pd.DataFrame({'Date2': [2006] * 71, 'Latitude_Degrees': [10.0] * 71,
+    ...                    'Longitude_Degrees': [105.0] * 71, 'Average_Bleaching': [0.0] * 71,
+    ...                    'SSTA': [0.5] * 71})
+    >>> spatial_index = _load_module('compute_on_data').SpatialIndex(df)
+    >>> _regional_result(spatial_index, 'fs', ('bbox', [103.0, 9.0, 110.0, 13.0]))
+    {2006: (0, nan)}
+    """
+    compute_on_data = _load_module('compute_on_data')
+    rows = _region_rows(spatial_index, region)
+
+    severities = rows['Average_Bleaching'].to_numpy()
+    if result == 'c':
+        sstas = rows['SSTA'].to_numpy()
+        refined_data = compute_on_data.determine_average_sstas_vectorized(severities, sstas)
+        raw_stats = _load_module('regression').stats_from_columns(sstas, severities)
+        raw_fit = raw_stats.fit() if raw_stats.can_fit() else None
+        return (compute_on_data.convert_to_points(refined_data), raw_fit)
+    elif result == 'fs':
+        return compute_on_data.get_freq_and_severity_vectorized(rows['Date2'].to_numpy(),
+                                                                severities)
+    else:
+        return rows
+
+
+def _regional_groups(spatial_index: Any, result: str,
+                     region: Tuple[str, List[float]]) -> Dict[float, List[float]]:
+    """Return the same data as read_csv_data_ssta (if result is 'c') or
+    read_csv_data_frequency (if result is 'fs') for the rows of the region that
+    spatial_index selects.
+
+    Preconditions:
+        - spatial_index was returned by _spatial_index
+        - result == 'c' or result == 'fs'
+    """
+    rows = _region_rows(spatial_index, region)
     if result == 'c':
-        raw_data = read_data.read_csv_data_ssta('data/coral_bleaching_data.csv')
-        refined_data = compute_on_data.determine_average_sstas(raw_data)
-        points = compute_on_data.convert_to_points(refined_data)
+        rows = rows[rows['SSTA'].notna()]
+        keys, values = rows['Average_Bleaching'], rows['SSTA']
+    else:
+        keys, values = rows['Date2'], rows['Average_Bleaching']
+
+    groups = {}
+    for key, value in zip(keys.tolist(), values.tolist()):
+        if key not in groups:
+            groups[key] = []
+        groups[key].append(value)
+    return groups
+
+
+def _region_rows(spatial_index: Any, region: Tuple[str, List[float]]) -> Any:
+    """Return the DataFrame of the rows of the region that spatial_index selects."""
+    if region[0] == 'bbox':
+        return spatial_index.bbox(*region[1])
+    else:
+        return spatial_index.radius(*region[1])
+
+
+def result_to_json(result: str, refined_data: object, intervals: object = None) -> object:
+    """Return the data returned by compute_result for result in a form that can be written
+    as json.
+
+    If intervals is not None, the confidence intervals it contains are included as lists
+    [low, high].
+
+    Preconditions:
+        - refined_data was returned by compute_result(result, ...)
+        - intervals is None or intervals is the result of the stage result + '_ci' of the
+          pipeline returned by build_pipeline
 
-        visualize_results.show_correlation(points[0], points[1])
+    >>> result_to_json('fs', {2005: (12, 30.5)})
+    {'2005': {'frequency': 12, 'average_severity': 30.5}}
+    >>> result_to_json('c', (([], []), None))
+    {'average_sstas': [], 'severities': [], 'raw_fit': None}
+    >>> result_to_json('fs', {2005: (12, 30.5)}, {2005: ((9.0, 15.0), (25.0, 36.0))})
+    {'2005': {'frequency': 12, 'average_severity': 30.5, 'frequency_ci': [9.0, 15.0], \
+'average_severity_ci': [25.0, 36.0]}}
+    """
+    if result == 'c':
+        points, raw_fit = refined_data
+        data = {'average_sstas': points[0],
+                'severities': points[1],
+                'raw_fit': None}
+        if raw_fit is not None:
+            data['raw_fit'] = {'n': raw_fit.n,
+                               'slope': raw_fit.slope,
+                               'intercept': raw_fit.intercept,
+                               'r_squared': raw_fit.r_squared,
+                               'slope_stderr': raw_fit.slope_stderr,
+                               'intercept_stderr': raw_fit.intercept_stderr}
+        if intervals is not None:
+            ssta_intervals, fit_intervals = intervals
+            data['average_ssta_cis'] = [list(ssta_intervals[severity])
+                                        for severity in points[1]]
+            if raw_fit is not None:
+                for name in ['slope', 'intercept', 'r_squared']:
+                    data['raw_fit'][name + '_ci'] = list(fit_intervals[name])
+        return data
 
     elif result == 'fs':
-        raw_data = read_data.read_csv_data_frequency('data/coral_bleaching_data.csv')
-        refined_data = compute_on_data.get_freq_and_severity(raw_data)
+        data = {str(year): {'frequency': refined_data[year][0],
+                            'average_severity': refined_data[year][1]}
+                for year in refined_data}
+        if intervals is not None:
+            for year in refined_data:
+                data[str(year)]['frequency_ci'] = list(intervals[year][0])
+                data[str(year)]['average_severity_ci'] = list(intervals[year][1])
+        return data
+
+    else:
+        # The map points of each year are its coral bleaching events, as lists
+        # [latitude, longitude, severity]
+        year_index = _load_module('compute_on_data').YearIndex(refined_data)
+        map_points = {}
+        for year in year_index.years():
+            events = year_index.events_in_year(year)
+            map_points[str(year)] = events[['Latitude_Degrees', 'Longitude_Degrees',
+                                            'Average_Bleaching']].to_numpy().tolist()
+        return map_points
 
-        visualize_results.show_freq_and_severity(refined_data)
 
+def run_cli(argv: Optional[List[str]] = None) -> int:
+    """Run the command line interface of this project with the arguments in argv (or the
+    arguments this program was run with, if argv is None). Return the exit status.
+    """
+    parser = argparse.ArgumentParser(
+        description='Display the results of my investigation into coral bleaching.')
+    parser.add_argument('--result', nargs='+', choices=['c', 'fs', 'm'],
+                        default=['c', 'fs', 'm'],
+                        help='the results to produce: the correlation between SSTAs and '
+                             'bleaching (c), the frequency and severity of bleaching per year '
+                             '(fs), and/or the map of bleaching events (m)')
+    parser.add_argument('--data', default=DATA_FILE,
+                        help='the csv file to read the data from')
+    parser.add_argument('--format', choices=['show', 'html', 'figure', 'json'], default='show',
+                        help='show each result in a browser, write it as an HTML file or as '
+                             'figure JSON, or write the data it shows as json')
+    parser.add_argument('--output-dir', default=None,
+                        help='the directory to write the results to (json results are printed '
+                             'if this is not given; html and figure results default to output)')
+    parser.add_argument('--engine',
+                        choices=['python', 'streaming', 'incremental', 'numpy', 'compact',
+                                 'cube'],
+                        default='python',
+                        help='how the c and fs results are computed')
+    parser.add_argument('--map-resolution', type=float, default=None,
+                        help='aggregate the map into grid cells this many degrees wide')
+    parser.add_argument('--map-mode', choices=['traces', 'frames', 'lazy'], default='traces',
+                        help='draw the map as one trace per year (traces), or as a single trace '
+                             'that is animated to each year (frames) or that loads each year '
+                             'from its own json file when it is chosen (lazy, html only)')
+    region_group = parser.add_mutually_exclusive_group()
+    region_group.add_argument('--bbox', nargs=4, type=float, default=None,
+                              metavar=('MIN_LON', 'MIN_LAT', 'MAX_LON', 'MAX_LAT'),
+                              help='only use the rows inside this bounding box')
+    region_group.add_argument('--near', nargs=3, type=float, default=None,
+                              metavar=('LAT', 'LON', 'KM'),
+                              help='only use the rows within KM kilometres of this point')
+    parser.add_argument('--resamples', type=int, default=2000,
+                        help='the number of bootstrap resamples that the confidence intervals '
+                             'of the c and fs results are computed from (0 to not compute '
+                             'them)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='the seed that the bootstrap resamples are drawn from')
+    parser.add_argument('--memo-dir', default=MEMO_DIR,
+                        help='the directory to memoize the results of reading and computing on '
+                             'the data in')
+    parser.add_argument('--no-memo', action='store_true',
+                        help='read and compute on the data again without using or writing '
+                             'memoized results')
+    parser.add_argument('--import-budget', type=float, default=None,
+                        help='fail if importing modules takes longer than this many seconds')
+    parser.add_argument('--profile', choices=['time', 'memory'], default=None,
+                        help='report the duration and rows of every stage (and the memory it '
+                             'allocated, for memory) once the results have been produced')
+    parser.add_argument('--profile-stage', default=None,
+                        help='dump a cProfile profile and a tracemalloc snapshot of every call '
+                             'to the stage with this name')
+    parser.add_argument('--profile-dir', default='.',
+                        help='the directory to dump the profiles of --profile-stage into')
+    args = parser.parse_args(argv)
+    if args.resamples < 0:
+        parser.error('--resamples must not be negative')
+    if args.map_mode == 'lazy' and args.format != 'html':
+        parser.error('--map-mode lazy can only be used with --format html')
+
+    instrumentation = _load_module('instrumentation')
+    if args.profile is not None or args.profile_stage is not None:
+        instrumentation.enable(args.profile == 'memory', args.profile_stage, args.profile_dir)
+
+    region = None
+    if args.bbox is not None:
+        region = ('bbox', args.bbox)
+    elif args.near is not None:
+        region = ('near', args.near)
+
+    if args.format == 'show':
+        output_dir = None
+    else:
+        output_dir = args.output_dir or 'output'
+
+    pipeline = build_pipeline(args.engine, args.data, region, args.map_resolution, output_dir,
+                              'json' if args.format == 'figure' else 'html',
+                              None if args.no_memo else args.memo_dir, 4, args.map_mode,
+                              args.resamples, args.seed)
+
+    if args.format == 'json':
+        interval_stages = []
+        if args.resamples > 0:
+            interval_stages = [result + '_ci' for result in args.result if result != 'm']
+        refined_data = pipeline.run(args.result + interval_stages)
+        for result in args.result:
+            data = result_to_json(result, refined_data[result],
+                                  refined_data.get(result + '_ci'))
+            _write_json_result(result, data, args.output_dir)
     else:
-        raw_dataframe = read_data.csv_to_dataframe('data/coral_bleaching_data.csv')
-        refined_dataframe = compute_on_data.convert_dates(raw_dataframe)
+        pipeline.run(['show_' + result for result in args.result])
+
+    _warn_rejected_rows(args.data)
+    if instrumentation.is_enabled():
+        print(instrumentation.report(), file=sys.stderr)
+    return _check_import_budget(args.import_budget)
+
+
+def _write_json_result(result: str, data: object, output_dir: Optional[str]) -> None:
+    """Write data, the json form of result, to a file in output_dir named after result, or
+    print it if output_dir is None.
+    """
+    if output_dir is None:
+        print(json.dumps({result: data}))
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, f'{result}.json'), 'w') as file:
+            json.dump(data, file)
+
+
+def _warn_rejected_rows(data_file: str) -> None:
+    """Print a warning if rows of the csv file that data_file refers to were rejected when it
+    was parsed during this run. Nothing is printed if it was not parsed (for example, if every
+    stage that reads it was memoized), since read_data is then never imported.
+    """
+    read_data = sys.modules.get('read_data')
+    if read_data is None:
+        return
+
+    report = read_data.loaded_validation_report(data_file)
+    if report is not None and report.num_rejected() > 0:
+        print(f'Warning: {data_file}: {report.summary()}; the rejected rows were written to '
+              f'{read_data.validation.quarantine_paths(data_file)[0]}', file=sys.stderr)
+
+
+def _check_import_budget(budget: Optional[float]) -> int:
+    """Report the time spent importing modules, and return 1 if it took longer than budget
+    seconds, or 0 otherwise. Nothing is reported if budget is None.
+    """
+    if budget is None:
+        return 0
 
-        visualize_results.generate_map(refined_dataframe)
+    import_time = sum(IMPORT_TIMES.values())
+    times = ', '.join(f'{name} {IMPORT_TIMES[name]:.3f}s' for name in IMPORT_TIMES)
+    print(f'Imported modules in {import_time:.3f}s ({times}); budget {budget:.3f}s',
+          file=sys.stderr)
+    if import_time > budget:
+        print('Import time budget exceeded', file=sys.stderr)
+        return 1
+    return 0
 
 
 if __name__ == '__main__':
-    # Visualize the correlation between the severity of a coral bleaching event
-    # and the average of the sea surface temperature anomalies of the ocean at that
-    # time.
-    display_results('c')
-
-    # Visualize the frequency and average severity of coral bleaching events
-    # per year.
-    display_results('fs')
-
-    # Display an interactive map of the world that demonstrates the coral bleaching
-    # at specific locations for each year between 2003-2017 inclusive.
-    display_results('m')
+    # By default, this will visualize the correlation between the severity of a coral
+    # bleaching event and the average of the sea surface temperature anomalies of the ocean
+    # at that time; the frequency and average severity of coral bleaching events per year;
+    # and an interactive map of the world that demonstrates the coral bleaching at specific
+    # locations for each year between 2003-2017 inclusive.
+    sys.exit(run_cli())
@@ -0,0 +1,450 @@
+"""CSC110 Fall 2020 Final Project: A Memoized Pipeline of Stages
+
+Information
+===============================
+This Python module contains the classes that will be used to run the stages of reading,
+computing on and visualizing the data as a pipeline. Each stage declares the stages whose
+results it takes as inputs, so the stages form a directed acyclic graph, and stages that do not
+depend on each other (such as reading the data of the correlation and of the map) run at the
+same time in a pool of threads.
+
+The result of each stage can be memoized on disk, keyed by a hash of:
+    - the name and parameters of the stage
+    - the contents of the files the stage reads (such as the csv file of the dataset)
+    - the code of the stage, which is the source of its function along with the source of the
+      modules that function uses, and of the modules of this project that they import
+      (directly or not), since those can change what the stage computes
+    - the keys of the stages it takes as inputs
+Since the key of a stage only depends on the keys of its inputs, and not their results, a
+stage whose result is memoized is never run, and neither are the stages before it (unless
+another stage needs them). For example, changing only how the map is drawn only changes the
+key of the stage that draws it, so the stages that read and compute on the data are skipped.
+
+Since every change to a stage memoizes its result under a new key, the memo directory is
+pruned after every run: the results that were least recently used are deleted until the
+memoized results take up at most max_memo_bytes (the results used by the run are kept).
+
+Copyright Information
+===============================
+This file is Copyright (c) 2020 Anis Singh.
+"""
+import ast
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+import pickle
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Set
+
+
+# The name of the file in a memo directory that the hashes of the files read by stages are
+# kept in, so that a file is only hashed again once its size or modification time changes
+_FILE_HASHES = 'files.json'
+
+# The default for the most bytes that the memoized results in a memo directory take up
+MAX_MEMO_BYTES = 1 << 30
+
+
+class Stage:
+    """A stage of a pipeline, which is run by calling func with the results of its inputs (in
+    order) as positional arguments and its parameters as keyword arguments.
+
+    Instance Attributes:
+        - name: the name of the stage, which is unique in its pipeline
+        - func: the function that computes the result of the stage
+        - inputs: the names of the stages whose results this stage takes as inputs
+        - params: the keyword arguments func is called with, which must be able to be written
+          as json
+        - files: the paths of the files that func reads
+        - modules: the names of the modules whose code func uses
+        - memoize: whether the result of this stage is memoized on disk (which should be False
+          for stages that are run for what they do, such as showing a plot, rather than for
+          what they return)
+
+    Representation Invariants:
+        - self.name not in self.inputs
+    """
+    name: str
+    func: Callable
+    inputs: List[str]
+    params: Dict[str, Any]
+    files: List[str]
+    modules: List[str]
+    memoize: bool
+
+    def __init__(self, name: str, func: Callable, inputs: Optional[List[str]] = None,
+                 params: Optional[Dict[str, Any]] = None, files: Optional[List[str]] = None,
+                 modules: Optional[List[str]] = None, memoize: bool = True) -> None:
+        """Initialize a new stage called name."""
+        self.name = name
+        self.func = func
+        self.inputs = inputs if inputs is not None else []
+        self.params = params if params is not None else {}
+        self.files = files if files is not None else []
+        self.modules = modules if modules is not None else []
+        self.memoize = memoize
+
+
+class Pipeline:
+    """A directed acyclic graph of stages, whose results are memoized in memo_dir.
+
+    Instance Attributes:
+        - stages: a dictionary mapping the name of each stage to that stage
+        - memo_dir: the directory the results of the stages are memoized in, or None if they
+          are not memoized
+        - max_workers: the most stages that are run at the same time
+        - max_memo_bytes: the most bytes that the memoized results in memo_dir are pruned to
+          after each call to run
+        - statuses: a dictionary mapping the name of each stage used by the last call to run to
+          'memoized' if its result was read from memo_dir, or 'ran' if it was run
+
+    Representation Invariants:
+        - all(name == self.stages[name].name for name in self.stages)
+        - all(all(stage_input in self.stages for stage_input in self.stages[name].inputs)
+              for name in self.stages)
+        - self.max_workers >= 1
+        - self.max_memo_bytes >= 0
+
+    >>> pipeline = Pipeline([Stage('x', lambda: 2), Stage('y', lambda x, n: x * n, ['x'],
+    ...                                                   {'n': 3})])
+    >>> pipeline.run(['y'])
+    {'y': 6}
+    >>> pipeline.statuses
+    {'y': 'ran', 'x': 'ran'}
+    """
+    stages: Dict[str, Stage]
+    memo_dir: Optional[str]
+    max_workers: int
+    max_memo_bytes: int
+    statuses: Dict[str, str]
+    # A dictionary mapping the name of each stage whose key has been computed during the
+    # current call to run to its key
+    _keys: Dict[str, str]
+    # A dictionary mapping the name of each module to the hash of its source
+    _module_hashes: Dict[str, str]
+
+    def __init__(self, stages: List[Stage], memo_dir: Optional[str] = None,
+                 max_workers: int = 4, max_memo_bytes: int = MAX_MEMO_BYTES) -> None:
+        """Initialize a new pipeline of the given stages.
+
+        Preconditions:
+            - the stages have unique names, and every input of a stage is in stages
+            - the inputs of the stages do not form a cycle
+            - max_workers >= 1
+            - max_memo_bytes >= 0
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        self.memo_dir = memo_dir
+        self.max_workers = max_workers
+        self.max_memo_bytes = max_memo_bytes
+        self.statuses = {}
+        self._keys = {}
+        self._module_hashes = {}
+
+    def run(self, targets: List[str]) -> Dict[str, Any]:
+        """Return a dictionary mapping the name of each stage in targets to its result, running
+        only the stages (in targets or before them) whose results are not memoized.
+
+        Preconditions:
+            - all(target in self.stages for target in targets)
+        """
+        self.statuses = {}
+        self._keys = {}
+        results = {}
+        to_run = set()
+        for target in targets:
+            self._plan(target, results, to_run)
+
+        self._run_stages(to_run, results)
+        if self.memo_dir is not None:
+            self.prune(self.max_memo_bytes)
+        return {target: results[target] for target in targets}
+
+    def prune(self, max_bytes: int) -> List[str]:
+        """Delete the memoized results in memo_dir that were least recently used (read or
+        written) until the ones that are left take up at most max_bytes, and return the paths
+        of the deleted files. The results used by the last call to run are never deleted.
+
+        Preconditions:
+            - self.memo_dir is not None
+            - max_bytes >= 0
+        """
+        kept = {self._memo_path(name) for name in self.statuses if self.stages[name].memoize}
+        memos = []
+        total = 0
+        try:
+            filenames = os.listdir(self.memo_dir)
+        except OSError:
+            return []
+        for filename in filenames:
+            if not filename.endswith('.pickle'):
+                continue
+            path = os.path.join(self.memo_dir, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            total += stat.st_size
+            if path not in kept:
+                memos.append((stat.st_mtime_ns, stat.st_size, path))
+
+        deleted = []
+        for _, size, path in sorted(memos):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            deleted.append(path)
+        return deleted
+
+    def key(self, name: str) -> str:
+        """Return the key that the result of the stage called name is memoized under.
+
+        Preconditions:
+            - name in self.stages
+        """
+        if name not in self._keys:
+            stage = self.stages[name]
+            description = {'name': name,
+                           'code': self._code_hash(stage),
+                           'params': stage.params,
+                           'files': [self._file_hash(path) for path in stage.files],
+                           'inputs': [self.key(stage_input) for stage_input in stage.inputs]}
+            encoded = json.dumps(description, sort_keys=True, default=repr).encode('utf-8')
+            self._keys[name] = hashlib.sha256(encoded).hexdigest()
+        return self._keys[name]
+
+    def _plan(self, name: str, results: Dict[str, Any], to_run: Set[str]) -> None:
+        """Read the result of the stage called name into results if it is memoized, or add the
+        stage to to_run (along with the stages before it whose results are not memoized)
+        otherwise.
+        """
+        if name in self.statuses:
+            return
+
+        stage = self.stages[name]
+        if stage.memoize and self.memo_dir is not None:
+            memoized = _read_memo(self._memo_path(name))
+            if memoized is not None:
+                results[name] = memoized[0]
+                self.statuses[name] = 'memoized'
+                return
+
+        self.statuses[name] = 'ran'
+        to_run.add(name)
+        for stage_input in stage.inputs:
+            self._plan(stage_input, results, to_run)
+
+    def _run_stages(self, to_run: Set[str], results: Dict[str, Any]) -> None:
+        """Run every stage in to_run once the results of all of its inputs are in results,
+        adding its result to results, and memoizing it.
+
+        Raise a ValueError if the inputs of the stages in to_run form a cycle.
+        """
+        pending = set(to_run)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending != set() or running != {}:
+                for name in sorted(pending):
+                    stage = self.stages[name]
+                    if all(stage_input in results for stage_input in stage.inputs):
+                        pending.remove(name)
+                        args = [results[stage_input] for stage_input in stage.inputs]
+                        running[executor.submit(stage.func, *args, **stage.params)] = name
+
+                if running == {}:
+                    raise ValueError(f'the inputs of the stages {sorted(pending)} form a cycle')
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._finish(running.pop(future), future, results)
+
+    def _finish(self, name: str, future: Future, results: Dict[str, Any]) -> None:
+        """Add the result of the finished stage called name to results, and memoize it.
+
+        If the stage raised an exception, it is raised again here.
+        """
+        results[name] = future.result()
+        if self.stages[name].memoize and self.memo_dir is not None:
+            _write_memo(self._memo_path(name), results[name])
+
+    def _memo_path(self, name: str) -> str:
+        """Return the path of the file the result of the stage called name is memoized in.
+
+        Preconditions:
+            - self.memo_dir is not None
+        """
+        return os.path.join(self.memo_dir, f'{name}-{self.key(name)[:32]}.pickle')
+
+    def _code_hash(self, stage: Stage) -> str:
+        """Return the hash of the code of stage."""
+        digest = hashlib.sha256()
+        try:
+            digest.update(inspect.getsource(stage.func).encode('utf-8'))
+        except (OSError, TypeError):
+            digest.update(getattr(stage.func, '__qualname__', repr(stage.func)).encode('utf-8'))
+
+        for module in stage.modules:
+            if module not in self._module_hashes:
+                self._module_hashes[module] = _module_hash(module)
+            digest.update(self._module_hashes[module].encode('utf-8'))
+        return digest.hexdigest()
+
+    def _file_hash(self, filepath: str) -> str:
+        """Return the hash of the contents of the file that filepath refers to.
+
+        The hash is kept in the memo directory, and is only recomputed if the size or the
+        modification time of the file differs from when it was hashed.
+        """
+        path = os.path.abspath(filepath)
+        stat = os.stat(path)
+        hashes_path = None if self.memo_dir is None else os.path.join(self.memo_dir,
+                                                                      _FILE_HASHES)
+        hashes = {}
+        if hashes_path is not None:
+            try:
+                with open(hashes_path) as file:
+                    hashes = json.load(file)
+            except (OSError, ValueError):
+                hashes = {}
+
+        if path in hashes and hashes[path][:2] == [stat.st_size, stat.st_mtime_ns]:
+            return hashes[path][2]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        hashes[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+
+        if hashes_path is not None:
+            try:
+                os.makedirs(self.memo_dir, exist_ok=True)
+                _write_atomically(hashes_path, json.dumps(hashes).encode('utf-8'))
+            except OSError:
+                pass
+        return hashes[path][2]
+
+
+def _module_hash(module: str) -> str:
+    """Return the hash of the source of the module called module, along with the source of
+    every module in the same directory that it imports (directly or not), without importing
+    them, or the name of the module if its source cannot be found (such as for a module
+    written in C).
+
+    >>> _module_hash('no_such_module')
+    'no_such_module'
+    """
+    sources = _module_sources(module, {})
+    if sources == {}:
+        return module
+
+    digest = hashlib.sha256()
+    for name in sorted(sources):
+        digest.update(name.encode('utf-8'))
+        digest.update(hashlib.sha256(sources[name]).digest())
+    return digest.hexdigest()
+
+
+def _module_sources(module: str, sources: Dict[str, bytes]) -> Dict[str, bytes]:
+    """Add the source of the module called module, and of every module in the same directory
+    that it imports (directly or not), to sources, and return sources. A module whose source
+    cannot be found is not added.
+    """
+    spec = importlib.util.find_spec(module)
+    if spec is None or spec.origin is None or not spec.origin.endswith('.py'):
+        return sources
+
+    with open(spec.origin, 'rb') as file:
+        sources[module] = file.read()
+
+    directory = os.path.dirname(spec.origin)
+    for name in _imported_modules(sources[module]):
+        if name not in sources and os.path.isfile(os.path.join(directory, name + '.py')):
+            _module_sources(name, sources)
+    return sources
+
+
+def _imported_modules(source: bytes) -> Set[str]:
+    """Return the names of the top-level modules that the Python source imports (including
+    imports inside functions), not counting relative imports. Return an empty set if source
+    cannot be parsed.
+
+    >>> sorted(_imported_modules(b'import os.path\\nfrom read_data import load_dataset'))
+    ['os', 'read_data']
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return set()
+
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module is not None:
+            names.add(node.module.split('.')[0])
+    return names
+
+
+def _read_memo(filepath: str) -> Optional[tuple]:
+    """Return a tuple containing the result memoized in the file that filepath refers to, or
+    None if there is no such file or it cannot be read.
+    """
+    try:
+        with open(filepath, 'rb') as file:
+            result = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None
+
+    # Note: The modification time of a memoized result is when it was last used, so that the
+    # results that were least recently used are the first to be pruned
+    try:
+        os.utime(filepath)
+    except OSError:
+        pass
+    return (result,)
+
+
+def _write_memo(filepath: str, result: Any) -> None:
+    """Memoize result in the file that filepath refers to. Nothing is memoized if result
+    cannot be pickled or the file cannot be written.
+    """
+    try:
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        _write_atomically(filepath, data)
+    except (OSError, pickle.PicklingError, TypeError, AttributeError):
+        return
+
+
+def _write_atomically(filepath: str, data: bytes) -> None:
+    """Atomically replace the contents of the file that filepath refers to with data."""
+    temp_path = f'{filepath}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(data)
+    os.replace(temp_path, filepath)
+
+
+if __name__ == '__main__':
+    import python_ta
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    python_ta.check_all(config={
+        'extra-imports': ['ast', 'concurrent.futures', 'hashlib', 'importlib.util', 'inspect',
+                          'json', 'os', 'pickle', 'python_ta.contracts'],
+        'allowed-io': ['_file_hash', '_module_sources', '_read_memo', '_write_atomically'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import doctest
+    doctest.testmod(verbose=True)
@@ -10,74 +10,1034 @@ Copyright Information
 ===============================
 This file is Copyright (c) 2020 Anis Singh.
 """
+from __future__ import annotations
 
 import csv
-from typing import Dict, List
-import pandas as pd
+import glob
+import hashlib
+import itertools
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import threading
+from typing import TYPE_CHECKING, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+import numpy as np
+from aggregates import BleachingAggregates, aggregates_from_dict
+from grouped_values import GroupedValues, group_values
+import instrumentation
+import validation
 
+# Note: pandas takes a long time to import, so it is only imported by the functions that
+# create a DataFrame, rather than every time this module is imported.
+if TYPE_CHECKING:
+    import pandas as pd
 
-def read_csv_data_ssta(filepath: str) -> Dict[float, List[float]]:
-    """Return a dictionary mapping the severity of a coral bleaching event
-    (represented numerically) to a list of SSTAs (Sea Surface Temperature Anomalies)
-    (in degrees Celsius) that were present when such a severe bleaching event occurred.
 
-    Preconditions:
-        - filepath refers to a csv file in the format of
-          data/coral_bleaching_data.csv
+# A cache of the datasets that have already been parsed in this process, keyed by the
+# absolute path of the csv file they were parsed from, and a lock held while a dataset is
+# loaded into it, so that threads loading the same dataset load it only once.
+_LOADED_DATASETS = {}
+_LOADED_DATASETS_LOCK = threading.Lock()
+
+# The typed columns of a csv file are cached on disk in a directory next to the csv file,
+# which contains one .npy file per column and a json file describing the cached csv file.
+# Other modules may save .npz files derived from the columns (such as the cube of the rollup
+# module) in the same directory, which are removed along with the columns. The version of the
+# cache is increased whenever the cached columns change, such as when the rows that fail
+# validation started being left out of them.
+_CACHE_SUFFIX = '.cache'
+_CACHE_META = 'meta.json'
+_CACHE_VALIDATION = 'validation.json'
+_CACHE_VERSION = 2
+
+# The number of bytes of a csv file that parse_csv_columns splits into fields at a time
+_PARSE_BLOCK_SIZE = 1 << 24
+
+# Lookup tables of whether each byte can appear in an integer, and in a float or 'nd', in a
+# column of a csv file (where 0 is the padding after the end of a field)
+_INTEGER_CHARS = np.zeros(256, dtype=bool)
+_INTEGER_CHARS[list(b'0123456789+- \x00')] = True
+_FLOAT_CHARS = _INTEGER_CHARS.copy()
+_FLOAT_CHARS[list(b'.eEinfatyINFATYd_')] = True
+
+# The number of bytes at the start of a csv file, and right before the last byte that was
+# read from it, that are used to check whether it has only been appended to since.
+_FINGERPRINT_SIZE = 4096
+
+
+class BleachingDataset:
+    """A coral bleaching dataset that has been parsed once into typed columns.
+
+    Every column that only contains numbers is stored as a numpy array of integers or floats,
+    where the 'nd' (no data) entries of a numeric column are stored as NaN. Every other column
+    is stored as a numpy array of strings.
+
+    Every column is only decoded the first time it is used, so the columns that are never used
+    are never decoded. If the dataset has a column cache, a column is read (memory-mapped) from
+    the cache if it has been cached, and is otherwise parsed from the csv file by
+    parse_csv_columns and then written to the cache.
+
+    The rows that fail validation (see the validation module) are left out of every column.
+    They are found the first time the csv file is parsed, which also writes them to the
+    quarantine files next to the csv file.
+
+    Instance Attributes:
+        - filepath: the absolute path of the csv file this dataset was parsed from
+        - mtime: the modification time (in nanoseconds) of the csv file when it was parsed
+        - column_names: the names of the columns, in the order they appear in the csv file
+        - cache_dir: the directory the columns of this dataset are cached in, or None if the
+          columns are not cached
+        - validation_report: the report of the rows of the csv file that were rejected, or
+          None if the csv file has not been parsed yet
+
+    Representation Invariants:
+        - all(len(self.column(name)) == self.num_rows() for name in self.column_names)
     """
-    with open(filepath) as file:
-        reader = csv.reader(file)
+    filepath: str
+    mtime: int
+    column_names: List[str]
+    cache_dir: Optional[str]
+    validation_report: Optional[validation.ValidationReport]
+    _columns: Dict[str, np.ndarray]
+    # A lock held while columns are decoded, so that threads using the same column decode (and
+    # cache) it only once
+    _lock: threading.Lock
 
-        # Skip header row
-        next(reader)
+    def __init__(self, filepath: str, mtime: int, column_names: List[str],
+                 columns: Dict[str, np.ndarray], cache_dir: Optional[str] = None,
+                 report: Optional[validation.ValidationReport] = None) -> None:
+        """Initialize a new dataset from the typed columns of the csv file at filepath, whose
+        rows were checked into report.
+
+        Preconditions:
+            - all(name in columns for name in column_names) or cache_dir is not None
+        """
+        self.filepath = filepath
+        self.mtime = mtime
+        self.column_names = column_names
+        self.cache_dir = cache_dir
+        self.validation_report = report
+        self._columns = columns
+        self._lock = threading.Lock()
+
+    def num_rows(self) -> int:
+        """Return the number of rows in this dataset."""
+        if self.column_names == []:
+            return 0
+        for name in self._columns:
+            return len(self._columns[name])
+        return len(self.column(self.column_names[0]))
+
+    def column(self, name: str) -> np.ndarray:
+        """Return the typed values of the column called name.
+
+        Preconditions:
+            - name in self.column_names
+        """
+        if name not in self._columns:
+            self.load_columns([name])
+        return self._columns[name]
+
+    def load_columns(self, names: List[str]) -> None:
+        """Decode every column in names that has not been decoded yet, reading the csv file at
+        most once.
+
+        Preconditions:
+            - all(name in self.column_names for name in names)
+        """
+        with self._lock:
+            missing = [name for name in names
+                       if name not in self._columns and not self._load_cached_column(name)]
+            if missing == []:
+                return
+
+            self._check_mtime()
+            _, columns, report = parse_csv_columns(self.filepath, missing)
+            if self.validation_report is None:
+                self._record_validation(report)
+            for name in missing:
+                self._columns[name] = columns[name]
+                if self.cache_dir is not None:
+                    _write_cached_column(self.cache_dir, self.column_names.index(name),
+                                         columns[name])
+
+    def validate(self) -> validation.ValidationReport:
+        """Return the report of the rows of the csv file that were rejected, parsing the
+        csv file if it has not been parsed yet.
+        """
+        with self._lock:
+            if self.validation_report is None:
+                self._check_mtime()
+                self._record_validation(parse_csv_columns(self.filepath,
+                                                          self.column_names[:1])[2])
+            return self.validation_report
+
+    def _check_mtime(self) -> None:
+        """Raise a ValueError if the csv file has been modified since it was loaded."""
+        if os.stat(self.filepath).st_mtime_ns != self.mtime:
+            raise ValueError(f'{self.filepath} has been modified since it was loaded')
+
+    def _record_validation(self, report: validation.ValidationReport) -> None:
+        """Set the validation report of this dataset to report, the report of every row of
+        the csv file, and write it to the quarantine files and the column cache.
+        """
+        self.validation_report = report
+        validation.write_quarantine(self.filepath, report)
+        if self.cache_dir is not None:
+            try:
+                _write_json(os.path.join(self.cache_dir, _CACHE_VALIDATION), report.to_dict())
+            except OSError:
+                return
+
+    def _load_cached_column(self, name: str) -> bool:
+        """Read (memory-map) the column called name from the column cache of this dataset,
+        and return whether it was cached.
+        """
+        if self.cache_dir is None:
+            return False
+
+        index = self.column_names.index(name)
+        try:
+            self._columns[name] = np.load(os.path.join(self.cache_dir, f'{index}.npy'),
+                                          mmap_mode='r')
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def years(self) -> np.ndarray:
+        """Return the year each row of this dataset was recorded in."""
+        # Note: The Date2 column has dates in the form of yyyymmdd. Thus, by dividing each
+        # integer by 10000 and flooring the result, only the year remains.
+        return self.column('Date2') // 10000
+
+    def ssta_by_severity(self, compact: bool = False) \
+            -> Union[Dict[float, List[float]], GroupedValues]:
+        """Return the same dictionary as read_csv_data_ssta for this dataset, or the same
+        mapping stored compactly as a GroupedValues object if compact is True.
+        """
+        self.load_columns(['Average_Bleaching', 'SSTA'])
+        if compact:
+            sstas = self.column('SSTA')
+            has_ssta = ~np.isnan(sstas)
+            return group_values(self.column('Average_Bleaching')[has_ssta], sstas[has_ssta])
 
         bleaching_data = {}
+        severities = self.column('Average_Bleaching').tolist()
+        sstas = self.column('SSTA').tolist()
 
-        for row in reader:
+        for severity, ssta in zip(severities, sstas):
             # Skip the row if there is no SSTA data for a coral bleaching event
-            if row[22] == 'nd':
+            if math.isnan(ssta):
                 continue
-            key = float(row[14])
+            key = float(severity)
             if key not in bleaching_data:
-                bleaching_data[key] = [float(row[22])]
+                bleaching_data[key] = [float(ssta)]
             else:
-                bleaching_data[key].append(float(row[22]))
-    return bleaching_data
+                bleaching_data[key].append(float(ssta))
+        return bleaching_data
+
+    def severities_by_year(self, compact: bool = False) \
+            -> Union[Dict[int, List[float]], GroupedValues]:
+        """Return the same dictionary as read_csv_data_frequency for this dataset, or the same
+        mapping stored compactly as a GroupedValues object if compact is True.
+        """
+        self.load_columns(['Date2', 'Average_Bleaching'])
+        if compact:
+            return group_values(self.years(), self.column('Average_Bleaching'))
+
+        bleaching_data = {}
+        years = self.years().tolist()
+        severities = self.column('Average_Bleaching').tolist()
+
+        for year, severity in zip(years, severities):
+            key = int(year)
+            if key not in bleaching_data:
+                bleaching_data[key] = [float(severity)]
+            else:
+                bleaching_data[key].append(float(severity))
+        return bleaching_data
+
+    def to_dataframe(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Return a new DataFrame object containing the given columns of this dataset, or
+        every column of this dataset if columns is None.
+
+        Preconditions:
+            - columns is None or all(name in self.column_names for name in columns)
+        """
+        import pandas as pd
+
+        if columns is None:
+            columns = self.column_names
+        self.load_columns(columns)
+        return pd.DataFrame({name: self.column(name) for name in columns})
+
+
+@instrumentation.stage
+def load_dataset(filepath: str, use_cache: bool = True) -> BleachingDataset:
+    """Return the dataset stored in the csv file that filepath refers to.
+
+    The dataset is only loaded the first time it is loaded in this process. Later calls
+    return the same dataset, unless the csv file has been modified since it was loaded. Its
+    columns are only parsed from the csv file when they are first used.
+
+    If use_cache is True, the typed columns of the csv file are also cached on disk the
+    first time they are parsed, and later processes read the columns they use from that cache
+    instead of parsing the csv file again, for as long as the contents of the csv file
+    stay the same.
+
+    Preconditions:
+        - filepath refers to a csv file in the format of
+          data/coral_bleaching_data.csv
+    """
+    path = os.path.abspath(filepath)
+    mtime = os.stat(path).st_mtime_ns
+
+    with _LOADED_DATASETS_LOCK:
+        if path not in _LOADED_DATASETS or _LOADED_DATASETS[path].mtime != mtime:
+            dataset = None
+            if use_cache:
+                dataset = _load_cached_dataset(path)
+            if dataset is None:
+                header = parse_csv_columns(path, [])[0]
+                cache_dir = _create_column_cache(path, mtime, header) if use_cache else None
+                dataset = BleachingDataset(path, mtime, header, {}, cache_dir)
+            _LOADED_DATASETS[path] = dataset
+        return _LOADED_DATASETS[path]
+
+
+def loaded_validation_report(filepath: str) -> Optional[validation.ValidationReport]:
+    """Return the validation report of the dataset stored in the csv file that filepath refers
+    to, or None if that dataset has not been loaded and parsed in this process.
+    """
+    with _LOADED_DATASETS_LOCK:
+        dataset = _LOADED_DATASETS.get(os.path.abspath(filepath))
+    return None if dataset is None else dataset.validation_report
+
+
+def _hash_file(filepath: str) -> str:
+    """Return the SHA-256 hash of the contents of the file that filepath refers to."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_cached_dataset(filepath: str) -> Optional[BleachingDataset]:
+    """Return the dataset stored in the column cache of the csv file that filepath refers
+    to, or None if there is no cache or the csv file has changed since it was cached.
+
+    The hash of the csv file is only recomputed if its size or modification time differs
+    from when it was cached.
+
+    Preconditions:
+        - This function is only meant to be called by load_dataset as a helper function.
+    """
+    cache_dir = filepath + _CACHE_SUFFIX
+    meta_path = os.path.join(cache_dir, _CACHE_META)
+    try:
+        with open(meta_path) as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    stat = os.stat(filepath)
+    if meta.get('version') != _CACHE_VERSION or meta['size'] != stat.st_size:
+        return None
+
+    if meta['mtime'] != stat.st_mtime_ns:
+        if meta['sha256'] != _hash_file(filepath):
+            return None
+
+        # The csv file was touched but its contents are the same, so the cache is still
+        # valid and only its modification time has to be updated
+        meta['mtime'] = stat.st_mtime_ns
+        _write_json(meta_path, meta)
+
+    report = None
+    try:
+        with open(os.path.join(cache_dir, _CACHE_VALIDATION)) as file:
+            report = validation.report_from_dict(json.load(file))
+    except (OSError, ValueError, KeyError):
+        # The csv file has not been parsed since the cache was created
+        report = None
+
+    return BleachingDataset(filepath, stat.st_mtime_ns, meta['columns'], {}, cache_dir, report)
+
+
+def _create_column_cache(filepath: str, mtime: int, column_names: List[str]) -> Optional[str]:
+    """Create an empty column cache for the csv file that filepath refers to, removing any
+    columns cached for an older version of the csv file, and return the directory of the
+    cache. Return None if the cache cannot be created (for example, if the directory
+    containing the csv file is read-only).
+
+    Preconditions:
+        - This function is only meant to be called by load_dataset as a helper function.
+    """
+    cache_dir = filepath + _CACHE_SUFFIX
+    meta_path = os.path.join(cache_dir, _CACHE_META)
+    meta = {'version': _CACHE_VERSION,
+            'size': os.stat(filepath).st_size,
+            'mtime': mtime,
+            'sha256': _hash_file(filepath),
+            'columns': column_names}
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # Remove the description of the old cache first, so that the old columns are never
+        # mistaken for columns of the new csv file
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        for path in glob.glob(os.path.join(cache_dir, '*.np[yz]')) + \
+                glob.glob(os.path.join(cache_dir, _CACHE_VALIDATION)):
+            os.remove(path)
+        _write_json(meta_path, meta)
+    except OSError:
+        return None
+    return cache_dir
+
+
+def _write_cached_column(cache_dir: str, index: int, column: np.ndarray) -> None:
+    """Atomically write column, the column at index in the csv file, to the column cache in
+    cache_dir. The cache is left unchanged if the column cannot be written.
+    """
+    path = os.path.join(cache_dir, f'{index}.npy')
+    temp_path = path + '.tmp'
+    try:
+        with open(temp_path, 'wb') as file:
+            np.save(file, column)
+        os.replace(temp_path, path)
+    except OSError:
+        return
+
+
+def _write_json(filepath: str, data: dict) -> None:
+    """Atomically replace the contents of the file that filepath refers to with data,
+    written as json.
+    """
+    temp_path = filepath + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(data, file)
+    os.replace(temp_path, filepath)
+
+
+# Functions to parse the columns of a csv file straight into typed numpy arrays.
+#
+# The csv file is memory-mapped and split into blocks of whole rows. The commas and newlines
+# of each block are found with numpy (skipping the ones inside quoted fields, which are the
+# ones with an odd number of quotes before them), and only the bytes of the requested
+# columns are gathered and converted, so no Python objects are created per row or per field.
+#
+# Each block is validated as soon as it is split, so the rows that fail validation are
+# quarantined in the same pass over the csv file, and are left out of every column.
+
+@instrumentation.stage
+def parse_csv_columns(filepath: str, names: Optional[List[str]] = None) \
+        -> Tuple[List[str], Dict[str, np.ndarray], validation.ValidationReport]:
+    """Return a tuple containing the names of the columns of the csv file that filepath
+    refers to at index 0, a dictionary mapping each name in names (or every column, if
+    names is None) to a numpy array of the typed values of that column at index 1, and the
+    report of the rows that failed validation at index 2.
+
+    A column checked by the validation module contains integers (for dates) or floats (where
+    'nd' becomes NaN). Any other column contains integers if every value is an integer, and
+    floats if every value is a number or 'nd'. Otherwise, the column contains its values as
+    strings. The rows that failed validation are left out of every column. The other columns
+    of the csv file are never decoded, except for the columns that are checked.
+
+    If names is empty, only the header is read, and the report is empty.
+
+    Preconditions:
+        - filepath refers to a csv file whose first row contains the names of its columns
+        - names is None or every name in names is the name of a column of the csv file
+    """
+    with open(filepath, 'rb') as file:
+        header_line = file.readline()
+        header = next(csv.reader([header_line.decode()]), [])
+        if names is None:
+            names = header
+        checked = _checked_indices(header)
+        unchecked = [name for name in names if name not in checked]
+
+        size = os.fstat(file.fileno()).st_size
+        raw_columns = [[] for _ in unchecked]
+        values = {name: [] for name in checked}
+        report = validation.ValidationReport(list(checked))
+        if names != [] and size > len(header_line):
+            raw_columns, values, report = _parse_byte_range(
+                file, len(header_line), size, len(header),
+                [header.index(name) for name in unchecked], checked)
+
+    columns = {unchecked[i]: _to_typed_bytes(raw_columns[i]) for i in range(len(unchecked))}
+    for name in names:
+        if name in checked:
+            columns[name] = _concatenate_checked(values[name], name)
+    return (header, {name: columns[name] for name in names}, report)
+
+
+def _checked_indices(header: List[str]) -> Dict[str, int]:
+    """Return a dictionary mapping the name of each column checked by the validation module
+    that is in header to its index in header.
+
+    >>> _checked_indices(['ID', 'SSTA', 'Date2'])
+    {'Date2': 2, 'SSTA': 1}
+    """
+    return {name: header.index(name) for name in validation.COLUMN_RULES if name in header}
+
+
+def _concatenate_checked(blocks: List[np.ndarray], name: str) -> np.ndarray:
+    """Return the typed values of the column called name, which is checked by the
+    validation module, whose values have been checked into the arrays in blocks.
+
+    >>> _concatenate_checked([], 'Date2').dtype
+    dtype('int64')
+    """
+    if blocks != []:
+        return np.concatenate(blocks)
+    elif validation.COLUMN_RULES[name].kind == 'date':
+        return np.array([], dtype=np.int64)
+    else:
+        return np.array([], dtype=np.float64)
+
+
+def _parse_byte_range(file: BinaryIO, start: int, end: int, num_columns: int,
+                      indices: List[int], checked: Dict[str, int]) \
+        -> Tuple[List[List[np.ndarray]], Dict[str, List[np.ndarray]],
+                 validation.ValidationReport]:
+    """Return a tuple containing a list with, for the column at each index in indices, a
+    list of numpy arrays of the raw bytes of its fields at index 0, a dictionary mapping the
+    name of each checked column to a list of numpy arrays of its typed values at index 1, and
+    the report of the rows that failed validation at index 2, for the whole rows of file from
+    start (inclusive) to end (exclusive).
+
+    checked maps the name of each column to check to its index. The rows are memory-mapped,
+    split into fields and validated one block at a time, and the rows that failed validation
+    are left out of every array.
+
+    Preconditions:
+        - file was opened in binary mode, and start and end are at the start of a row or at
+          the end of file
+        - the csv file has num_columns columns
+        - all(name in validation.COLUMN_RULES for name in checked)
+    """
+    raw_columns = [[] for _ in indices]
+    values = {name: [] for name in checked}
+    report = validation.ValidationReport(list(checked))
+    used = sorted(set(indices) | set(checked.values()))
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        while start < end:
+            block_end = _find_block_end(buffer, start, end)
+            fields, row_bounds, malformed = _split_block(buffer, start, block_end, num_columns,
+                                                         used)
+            fields_by_index = {used[i]: fields[i] for i in range(len(used))}
+            checks = {name: validation.check_column(fields_by_index[checked[name]],
+                                                    validation.COLUMN_RULES[name])
+                      for name in checked}
+            is_valid = report.add_block(malformed, {name: checks[name][1] for name in checks},
+                                        (row_bounds[0] + start, row_bounds[1] + start))
+            # Only copy the fields of a block if some of its rows were rejected
+            keep = slice(None) if is_valid.all() else is_valid
+
+            for i in range(len(indices)):
+                raw_columns[i].append(fields_by_index[indices[i]][keep])
+            for name in checked:
+                values[name].append(checks[name][0][keep])
+            start = block_end
+    return (raw_columns, values, report)
+
+
+def _find_block_end(buffer: mmap.mmap, start: int, end: int) -> int:
+    """Return the index right after the end of the block of whole rows of buffer that starts
+    at start, which is right after the first newline at least _PARSE_BLOCK_SIZE bytes after
+    start that is not inside a quoted field (or end).
+    """
+    newline = buffer.find(b'\n', start + _PARSE_BLOCK_SIZE, end)
+    while newline != -1 and buffer[start:newline].count(b'"') % 2 == 1:
+        newline = buffer.find(b'\n', newline + 1, end)
+    return end if newline == -1 else newline + 1
+
+
+def _split_block(buffer: mmap.mmap, start: int, end: int, num_columns: int,
+                 indices: List[int]) \
+        -> Tuple[List[np.ndarray], Tuple[np.ndarray, np.ndarray], np.ndarray]:
+    """Return a tuple containing a list with a numpy array of the raw bytes of each field of
+    the column at each index in indices at index 0, a tuple of arrays of the start and end
+    (relative to start) of each row at index 1, and an array of whether each row does not
+    have num_columns fields at index 2, for the rows of buffer between start and end.
+
+    The fields of a row that does not have num_columns fields are empty, and blank rows are
+    skipped.
+
+    Preconditions:
+        - This function is only meant to be called by _parse_byte_range as a helper function.
+
+    >>> fields, bounds, malformed = _split_block(b'1,"a\\nb"\\n\\n2\\n3,c', 0, 14, 2, [1])
+    >>> (fields[0].tolist(), bounds[0].tolist(), malformed.tolist())
+    ([b'a\\nb', b'', b'c'], [0, 9, 11], [False, True, False])
+    """
+    block = np.frombuffer(buffer, dtype=np.uint8, count=end - start, offset=start)
+    try:
+        is_delimiter = (block == ord(',')) | (block == ord('\n'))
+        positions = np.flatnonzero(is_delimiter)
+        quotes = np.flatnonzero(block == ord('"'))
+        if len(quotes) > 0:
+            positions = positions[np.searchsorted(quotes, positions) % 2 == 0]
+
+        # Every row ends at a newline, except possibly the last row of the csv file
+        is_newline = block[positions] == ord('\n')
+        if len(block) > 0 and block[-1] != ord('\n'):
+            positions = np.append(positions, len(block))
+            is_newline = np.append(is_newline, True)
+
+        # The index in positions of the end of each row, and the number of fields in each row
+        row_last = np.flatnonzero(is_newline)
+        num_fields = np.diff(row_last, prepend=-1)
+        row_ends = positions[row_last]
+        row_starts = np.concatenate(([0], row_ends[:-1] + 1)).astype(row_ends.dtype)
+
+        # A row is blank if it is empty, or only contains a carriage return
+        lengths = row_ends - row_starts
+        is_blank = (num_fields == 1) & ((lengths == 0) | (
+            (lengths == 1) & (block[np.minimum(row_starts, len(block) - 1)] == ord('\r'))))
+        is_complete = (num_fields == num_columns) & ~is_blank
 
+        field_ends = positions[np.repeat(is_complete, num_fields)].reshape(-1, num_columns)
+        field_starts = np.empty_like(field_ends)
+        field_starts[:, 1:] = field_ends[:, :-1] + 1
+        field_starts[:, 0] = row_starts[is_complete]
 
-def read_csv_data_frequency(filepath: str) -> Dict[int, List[float]]:
+        # Remove the carriage return of a row that ends with \r\n
+        last_ends = field_ends[:, -1]
+        has_return = (last_ends > field_starts[:, -1]) & \
+            (block[np.maximum(last_ends - 1, 0)] == ord('\r'))
+        field_ends[:, -1] = last_ends - has_return
+
+        fields = [_gather_fields(block, field_starts[:, i], field_ends[:, i]) for i in indices]
+        malformed = ~is_complete[~is_blank]
+        if malformed.any():
+            # Leave the fields of the rows that do not have num_columns fields empty
+            for i in range(len(fields)):
+                all_fields = np.zeros(len(malformed), dtype=fields[i].dtype)
+                all_fields[~malformed] = fields[i]
+                fields[i] = all_fields
+
+        return (fields, (row_starts[~is_blank], row_ends[~is_blank]), malformed)
+    finally:
+        # The block must not refer to the memory-mapped file once the file is closed
+        del block
+
+
+def _gather_fields(block: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Return a numpy array of fixed-width byte strings containing the fields of block that
+    start and end at starts and ends, with the quotes of quoted fields removed.
+
+    >>> block = np.frombuffer(b'12,"a, b",nd', dtype=np.uint8)
+    >>> _gather_fields(block, np.array([0, 3, 10]), np.array([2, 9, 12])).tolist()
+    [b'12', b'a, b', b'nd']
+    """
+    lengths = ends - starts
+    width = max(int(lengths.max(initial=0)), 1)
+    chars = np.zeros((len(starts), width), dtype=np.uint8)
+
+    # The index in block of every byte of every field, and its index in chars
+    row_starts = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    sources = np.arange(int(lengths.sum())) + row_starts
+    targets = sources + np.repeat(np.arange(len(starts)) * width - starts, lengths)
+    chars.ravel()[targets] = block[sources]
+    fields = chars.view(f'S{width}').ravel()
+
+    is_quoted = (lengths > 0) & (block[np.minimum(starts, len(block) - 1)] == ord('"'))
+    for i in np.flatnonzero(is_quoted):
+        field = block[starts[i]:ends[i]].tobytes()
+        fields[i] = field[1:-1].replace(b'""', b'"')
+    return fields
+
+
+def _to_typed_bytes(blocks: List[np.ndarray]) -> np.ndarray:
+    """Return a numpy array containing the values of a single column of the csv file, whose
+    raw bytes have been gathered into the arrays in blocks.
+
+    The array contains integers if every value is an integer, and floats if every value is
+    a number or 'nd' (which becomes NaN). Otherwise, the array contains the values as strings.
+
+    >>> _to_typed_bytes([np.array([b'1', b'2']), np.array([b'3'])]).tolist()
+    [1, 2, 3]
+    >>> _to_typed_bytes([np.array([b'1.5', b'nd', b'3'])]).tolist()
+    [1.5, nan, 3.0]
+    >>> _to_typed_bytes([np.array([b'Pacific', b'nd'])]).tolist()
+    ['Pacific', 'nd']
+    """
+    raw = np.concatenate(blocks) if blocks != [] else np.array([], dtype=bytes)
+    chars = raw.view(np.uint8)
+
+    # Only try to convert the column to numbers if it only contains the characters of numbers,
+    # since a failed conversion takes as long as a successful one
+    if _INTEGER_CHARS[chars].all():
+        try:
+            return raw.astype(np.int64)
+        except ValueError:
+            pass
+
+    missing = raw == b'nd'
+    if not missing.all() and _FLOAT_CHARS[chars].all():
+        try:
+            return np.where(missing, b'nan', raw).astype(np.float64)
+        except ValueError:
+            pass
+
+    if (chars < 128).all():
+        return raw.astype(f'U{raw.itemsize}')
+    return np.char.decode(raw, 'utf-8')
+
+
+@instrumentation.stage
+def read_csv_data_ssta(filepath: str, compact: bool = False) \
+        -> Union[Dict[float, List[float]], GroupedValues]:
+    """Return a dictionary mapping the severity of a coral bleaching event
+    (represented numerically) to a list of SSTAs (Sea Surface Temperature Anomalies)
+    (in degrees Celsius) that were present when such a severe bleaching event occurred.
+
+    If compact is True, the same mapping is returned as a GroupedValues object, which stores
+    every SSTA in a single array of floats instead of in lists of Python floats.
+
+    Preconditions:
+        - filepath refers to a csv file in the format of
+          data/coral_bleaching_data.csv
+    """
+    return load_dataset(filepath).ssta_by_severity(compact)
+
+
+@instrumentation.stage
+def read_csv_data_frequency(filepath: str, compact: bool = False) \
+        -> Union[Dict[int, List[float]], GroupedValues]:
     """Return a dictionary mapping each year to a list containing the severities of the
     coral bleaching events that occurred that year.
 
+    If compact is True, the same mapping is returned as a GroupedValues object, which stores
+    every severity in a single array of floats instead of in lists of Python floats.
+
     Preconditions:
         - filepath refers to a csv file in the format of
           data/coral_bleaching_data.csv
     """
+    return load_dataset(filepath).severities_by_year(compact)
+
+
+@instrumentation.stage
+def csv_to_dataframe(filepath: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Return a DataFrame object from the data in the csv file that filepath refers to.
+    If columns is not None, the DataFrame only contains the columns in columns, and the
+    other columns are never decoded.
+
+    Preconditions:
+        - filepath refers to a csv file in the format of
+          data/coral_bleaching_data.csv
+    """
+    return load_dataset(filepath).to_dataframe(columns)
+
+
+@instrumentation.stage
+def stream_aggregates(filepath: str, chunk_size: int = 10000) -> BleachingAggregates:
+    """Return the running aggregates of every row in the csv file that filepath refers to.
+
+    The csv file is read chunk_size rows at a time, and only the running aggregates are
+    kept between chunks, so the memory used does not grow with the size of the csv file.
+    The rows that fail validation are skipped.
+
+    Preconditions:
+        - filepath refers to a csv file in the format of
+          data/coral_bleaching_data.csv
+        - chunk_size > 0
+    """
+    aggregates = BleachingAggregates()
     with open(filepath) as file:
         reader = csv.reader(file)
+        header = next(reader)
+        indices = _row_indices(header)
+        checked = _checked_indices(header)
 
-        # Skip header row
-        next(reader)
-
-        bleaching_data = {}
+        for chunk in _read_chunks(_skip_csv_errors(reader), chunk_size):
+            for row in chunk:
+                _add_row(aggregates, row, len(header), indices, checked)
+    return aggregates
 
-        for row in reader:
-            key = int(row[12][:4])
-            if key not in bleaching_data:
-                bleaching_data[key] = [float(row[14])]
-            else:
-                bleaching_data[key].append(float(row[14]))
-    return bleaching_data
 
+@instrumentation.stage
+def update_aggregates(filepath: str, state_path: str) -> BleachingAggregates:
+    """Return the running aggregates of every row in the csv file that filepath refers to,
+    where the aggregates of the rows that were already read are loaded from the json file
+    that state_path refers to. Only the rows appended to the csv file since the last call
+    are read, and the updated aggregates are then saved back to state_path.
 
-def csv_to_dataframe(filepath: str) -> pd.DataFrame:
-    """Return a DataFrame object from the data in the csv file that filepath refers to.
+    The aggregates are computed from scratch if state_path does not exist, or if the csv
+    file has been changed in any way other than by appending rows to it. The rows that fail
+    validation are skipped.
 
     Preconditions:
         - filepath refers to a csv file in the format of
           data/coral_bleaching_data.csv
+        - rows are only ever appended to the csv file whole
+    """
+    path = os.path.abspath(filepath)
+    size = os.path.getsize(path)
+
+    with open(path, 'rb') as file:
+        header = _read_header(file)
+        indices = _row_indices(header)
+        checked = _checked_indices(header)
+        state = _load_state(state_path, path, file, size)
+        if state is None:
+            _read_header(file)
+            state = {'offset': file.tell(), 'aggregates': BleachingAggregates()}
+
+        aggregates = state['aggregates']
+        file.seek(state['offset'])
+        for row in _skip_csv_errors(csv.reader(_read_lines(file, size))):
+            # Skip the empty row left over if the last row was read before it had a
+            # line break after it
+            if row != []:
+                _add_row(aggregates, row, len(header), indices, checked)
+
+        new_state = {'source': path,
+                     'offset': size,
+                     'fingerprint': _fingerprint(file, size),
+                     'aggregates': aggregates.to_dict()}
+    _write_json(state_path, new_state)
+    return aggregates
+
+
+def _load_state(state_path: str, filepath: str, file: BinaryIO, size: int) -> Optional[dict]:
+    """Return a dictionary containing the aggregates saved in the json file that state_path
+    refers to and the offset of the first byte of file that was not read into them, or None
+    if there is no saved state for the csv file that filepath refers to, or if file has been
+    changed in any way other than by appending rows to it.
+
+    Preconditions:
+        - This function is only meant to be called by update_aggregates as a helper function.
+    """
+    try:
+        with open(state_path) as state_file:
+            state = json.load(state_file)
+        aggregates = aggregates_from_dict(state['aggregates'])
+    except (OSError, ValueError, KeyError):
+        # The saved state is missing, unreadable, or was saved in an older format
+        return None
+
+    if state['source'] != filepath or state['offset'] > size \
+            or state['fingerprint'] != _fingerprint(file, state['offset']):
+        return None
+    return {'offset': state['offset'], 'aggregates': aggregates}
+
+
+def _fingerprint(file: BinaryIO, offset: int) -> str:
+    """Return a hash of the bytes at the start of file and the bytes right before offset in
+    file, which is used to check that the bytes of file before offset have not changed.
+    """
+    digest = hashlib.sha256()
+    file.seek(0)
+    digest.update(file.read(min(offset, _FINGERPRINT_SIZE)))
+    file.seek(max(offset - _FINGERPRINT_SIZE, 0))
+    digest.update(file.read(offset - file.tell()))
+    return digest.hexdigest()
+
+
+def _add_row(aggregates: BleachingAggregates, row: List[str], num_columns: int,
+             indices: Tuple[int, int, int], checked: Dict[str, int]) -> None:
+    """Add a row of a csv file in the format of data/coral_bleaching_data.csv with
+    num_columns columns to aggregates, where indices and checked are the tuple returned by
+    _row_indices and the dictionary returned by _checked_indices for the header of the csv file.
+
+    The row is skipped if it fails validation, just like parse_csv_columns leaves it out.
+
+    >>> aggregates = BleachingAggregates()
+    >>> _add_row(aggregates, ['20160326', '150', 'nd'], 3, (0, 1, 2), {'Average_Bleaching': 1})
+    >>> aggregates.severities
+    {}
+    """
+    if validation.check_row(row, num_columns, checked) != []:
+        return
+    date_index, severity_index, ssta_index = indices
+
+    # The SSTA of a row is None if there is no SSTA data for that row
+    ssta = None if row[ssta_index] == 'nd' else float(row[ssta_index])
+    aggregates.add_row(int(row[date_index][:4]), float(row[severity_index]), ssta)
+
+
+def _row_indices(header: List[str]) -> Tuple[int, int, int]:
+    """Return a tuple containing the index of the Date2, Average_Bleaching and SSTA columns
+    of a csv file whose header is header, in that order.
+
+    >>> _row_indices(['SSTA', 'Date2', 'Average_Bleaching'])
+    (1, 2, 0)
+    """
+    return (header.index('Date2'), header.index('Average_Bleaching'), header.index('SSTA'))
+
+
+def _read_header(file: BinaryIO) -> List[str]:
+    """Return the names of the columns of the csv file that file (opened in binary mode)
+    refers to, and leave file positioned at the start of its first row.
+    """
+    file.seek(0)
+    return next(csv.reader([file.readline().decode()]), [])
+
+
+def _skip_csv_errors(reader: Iterator[List[str]]) -> Iterator[List[str]]:
+    """Yield the rows that remain in reader, where a row that the csv module cannot read
+    becomes a row with no fields, which fails validation instead of stopping the reader.
+
+    >>> list(_skip_csv_errors(csv.reader(['a,b', 'c\\rd,e', 'f,g'])))
+    [['a', 'b'], [], ['f', 'g']]
+    """
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error:
+            row = []
+        yield row
+
+
+def _read_chunks(reader: Iterator[List[str]], chunk_size: int) -> Iterator[List[List[str]]]:
+    """Yield the rows that remain in reader, chunk_size rows at a time.
+
+    >>> list(_read_chunks(iter([['a'], ['b'], ['c']]), 2))
+    [[['a'], ['b']], [['c']]]
+    """
+    chunk = list(itertools.islice(reader, chunk_size))
+    while chunk != []:
+        yield chunk
+        chunk = list(itertools.islice(reader, chunk_size))
+
+
+@instrumentation.stage
+def read_csv_data_parallel(sources: Union[str, List[str]], processes: Optional[int] = None) \
+        -> Tuple[Dict[float, List[float]], Dict[int, List[float]]]:
+    """Return a tuple containing the dictionary returned by read_csv_data_ssta at index 0 and
+    the dictionary returned by read_csv_data_frequency at index 1, for all the rows of every
+    csv file in sources, in the order the files are given.
+
+    sources is either a list of paths or a glob pattern (whose matches are read in sorted
+    order). Every csv file is split into byte ranges, so that the rows are parsed (and
+    validated, skipping the rows that fail validation) by a pool of processes, and the partial
+    dictionaries parsed by each process are then merged together. If processes is None, one
+    process is used per core.
+
+    Preconditions:
+        - every file in sources is a csv file in the format of
+          data/coral_bleaching_data.csv, and none of its fields contain a line break
+        - processes is None or processes > 0
+    """
+    if isinstance(sources, str):
+        paths = sorted(glob.glob(sources))
+    else:
+        paths = list(sources)
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    # Split each file into enough byte ranges that every process has a range to parse
+    shards_per_file = max(1, processes // max(1, len(paths)))
+    shards = [shard for path in paths for shard in split_csv_file(path, shards_per_file)]
+
+    with multiprocessing.Pool(processes) as pool:
+        partials = pool.map(_read_shard, shards)
+
+    ssta_data = {}
+    frequency_data = {}
+    # The partial dictionaries are merged in the same order as the shards, so each list
+    # ends up in the same order as if the files had been read one row at a time
+    for partial_ssta_data, partial_frequency_data in partials:
+        _merge_lists(ssta_data, partial_ssta_data)
+        _merge_lists(frequency_data, partial_frequency_data)
+    return (ssta_data, frequency_data)
+
+
+@instrumentation.stage
+def split_csv_file(filepath: str, n: int) -> List[Tuple[str, int, int]]:
+    """Return a list of at most n tuples (filepath, start, end), where the bytes from start
+    (inclusive) to end (exclusive) of the csv file that filepath refers to are a range of
+    whole rows. Together, the ranges cover every row of the csv file except the header, in
+    order.
+
+    Preconditions:
+        - filepath refers to a csv file in the format of
+          data/coral_bleaching_data.csv, and none of its fields contain a line break
+        - n > 0
+    """
+    size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as file:
+        # Skip header row
+        file.readline()
+        first_row = file.tell()
+
+        boundaries = [first_row]
+        for i in range(1, n):
+            # Move each boundary forward to the start of the next row
+            file.seek(first_row + (size - first_row) * i // n)
+            file.readline()
+            boundaries.append(max(file.tell(), boundaries[-1]))
+        boundaries.append(size)
+
+    return [(filepath, boundaries[i], boundaries[i + 1]) for i in range(n)
+            if boundaries[i] < boundaries[i + 1]]
+
+
+def _read_shard(shard: Tuple[str, int, int]) \
+        -> Tuple[Dict[float, List[float]], Dict[int, List[float]]]:
+    """Return the partial dictionaries of read_csv_data_parallel for the rows of shard, which
+    is a tuple returned by split_csv_file.
+
+    Preconditions:
+        - This function is only meant to be called by read_csv_data_parallel as a helper
+          function.
+    """
+    filepath, start, end = shard
+    with open(filepath, 'rb') as file:
+        header = _read_header(file)
+        values = _parse_byte_range(file, start, end, len(header), [],
+                                   _checked_indices(header))[1]
+    years, severities, sstas = [_concatenate_checked(values[name], name)
+                                for name in ['Date2', 'Average_Bleaching', 'SSTA']]
+    years = years // 10000
+
+    # Skip the rows with no SSTA data when grouping the SSTAs by severity
+    has_ssta = ~np.isnan(sstas)
+    return (group_values(severities[has_ssta], sstas[has_ssta]).to_dict(),
+            group_values(years, severities).to_dict())
+
+
+def _read_lines(file: BinaryIO, end: int) -> Iterator[str]:
+    """Yield the lines of file from its current position until the byte at end is reached.
+
+    Preconditions:
+        - This function is only meant to be called by update_aggregates as a helper function.
+    """
+    position = file.tell()
+    while position < end:
+        line = file.readline()
+        if line == b'':
+            return
+        position += len(line)
+        yield line.decode()
+
+
+def _merge_lists(merged: dict, partial: dict) -> None:
+    """Mutate merged by extending the list in merged for each key in partial with the list
+    for that key in partial.
+
+    >>> merged = {1: [1.0], 2: [2.0]}
+    >>> _merge_lists(merged, {2: [3.0], 4: [4.0]})
+    >>> merged
+    {1: [1.0], 2: [2.0, 3.0], 4: [4.0]}
     """
-    return pd.read_csv(filepath)
+    for key in partial:
+        if key not in merged:
+            merged[key] = partial[key]
+        else:
+            merged[key].extend(partial[key])
 
 
 if __name__ == '__main__':
@@ -88,8 +1048,14 @@ if __name__ == '__main__':
     python_ta.contracts.check_all_contracts()
 
     python_ta.check_all(config={
-        'extra-imports': ['csv', 'python_ta.contracts', 'pandas'],
-        'allowed-io': ['read_csv_data_ssta', 'read_csv_data_frequency'],
+        'extra-imports': ['csv', 'glob', 'hashlib', 'itertools', 'json', 'math', 'mmap',
+                          'multiprocessing', 'os', 'threading', 'python_ta.contracts', 'numpy',
+                          'pandas', 'aggregates', 'grouped_values', 'instrumentation',
+                          'validation'],
+        'allowed-io': ['parse_csv_columns', '_hash_file', '_load_cached_dataset',
+                       '_create_column_cache', '_write_cached_column', '_write_json',
+                       'stream_aggregates', 'split_csv_file', '_read_shard',
+                       'update_aggregates', '_load_state'],
         'max-line-length': 100,
         'disable': ['R1705', 'C0200']
     })
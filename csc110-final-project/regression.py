@@ -0,0 +1,274 @@
+"""CSC110 Fall 2020 Final Project: Simple Linear Regression
+
+Information
+===============================
+This Python module contains the functions that will be used to fit a line of best fit
+(using ordinary least squares) to a set of points, in closed form. The fit is computed from
+running sums of the points instead of from the points themselves, so points can be added one
+at a time, or in chunks that are read by different processes and then merged together.
+
+Copyright Information
+===============================
+This file is Copyright (c) 2020 Anis Singh.
+"""
+import math
+from typing import Dict, List
+import numpy as np
+
+
+# How small the spread of the x coordinates of the points can be, relative to the sum of their
+# squares, before they are treated as all being the same
+_FIT_TOLERANCE = 1e-12
+
+
+class RegressionResult:
+    """A line of best fit y = slope * x + intercept, along with how well it fits its points.
+
+    Instance Attributes:
+        - n: the number of points the line was fit to
+        - slope: the slope of the line
+        - intercept: the y-intercept of the line
+        - r_squared: the coefficient of determination of the line
+        - slope_stderr: the standard error of the slope
+        - intercept_stderr: the standard error of the intercept
+
+    Representation Invariants:
+        - self.n >= 2
+        - 0.0 <= self.r_squared <= 1.0
+    """
+    n: int
+    slope: float
+    intercept: float
+    r_squared: float
+    slope_stderr: float
+    intercept_stderr: float
+
+    def __init__(self, n: int, slope: float, intercept: float, r_squared: float,
+                 slope_stderr: float, intercept_stderr: float) -> None:
+        """Initialize a new line of best fit."""
+        self.n = n
+        self.slope = slope
+        self.intercept = intercept
+        self.r_squared = r_squared
+        self.slope_stderr = slope_stderr
+        self.intercept_stderr = intercept_stderr
+
+    def predict(self, x: float) -> float:
+        """Return the y coordinate of the point on this line whose x coordinate is x.
+
+        >>> RegressionResult(3, 2.0, 1.0, 1.0, 0.0, 0.0).predict(4.0)
+        9.0
+        """
+        return self.slope * x + self.intercept
+
+    def __repr__(self) -> str:
+        """Return a string representation of this line of best fit."""
+        return (f'RegressionResult(n={self.n}, slope={self.slope}, intercept={self.intercept}, '
+                f'r_squared={self.r_squared}, slope_stderr={self.slope_stderr}, '
+                f'intercept_stderr={self.intercept_stderr})')
+
+
+class RegressionStats:
+    """The running sums of a set of points that are needed to fit a line of best fit to them.
+
+    Instance Attributes:
+        - n: the number of points
+        - sum_x: the sum of the x coordinates of the points
+        - sum_y: the sum of the y coordinates of the points
+        - sum_xy: the sum of the products of the x and y coordinates of the points
+        - sum_xx: the sum of the squares of the x coordinates of the points
+        - sum_yy: the sum of the squares of the y coordinates of the points
+
+    Representation Invariants:
+        - self.n >= 0
+
+    >>> stats = RegressionStats()
+    >>> stats.add_points([1.0, 2.0, 3.0], [3.0, 5.0, 7.0])
+    >>> result = stats.fit()
+    >>> (result.slope, result.intercept, result.r_squared)
+    (2.0, 1.0, 1.0)
+    """
+    n: int
+    sum_x: float
+    sum_y: float
+    sum_xy: float
+    sum_xx: float
+    sum_yy: float
+
+    def __init__(self) -> None:
+        """Initialize new running sums of an empty set of points."""
+        self.n = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.sum_xy = 0.0
+        self.sum_xx = 0.0
+        self.sum_yy = 0.0
+
+    def add(self, x: float, y: float) -> None:
+        """Add the point (x, y) to the points these running sums describe."""
+        self.n += 1
+        self.sum_x += x
+        self.sum_y += y
+        self.sum_xy += x * y
+        self.sum_xx += x * x
+        self.sum_yy += y * y
+
+    def add_points(self, x_coords: List[float], y_coords: List[float]) -> None:
+        """Add the points whose x and y coordinates are in x_coords and y_coords respectively
+        to the points these running sums describe.
+
+        Preconditions:
+            - len(x_coords) == len(y_coords)
+        """
+        for i in range(len(x_coords)):
+            self.add(x_coords[i], y_coords[i])
+
+    def add_arrays(self, x_coords: np.ndarray, y_coords: np.ndarray) -> None:
+        """Add the points whose x and y coordinates are in the arrays x_coords and y_coords
+        respectively to the points these running sums describe, using vectorized sums.
+
+        Preconditions:
+            - len(x_coords) == len(y_coords)
+        """
+        x_coords = np.asarray(x_coords, dtype=np.float64)
+        y_coords = np.asarray(y_coords, dtype=np.float64)
+        self.n += len(x_coords)
+        self.sum_x += float(x_coords.sum())
+        self.sum_y += float(y_coords.sum())
+        self.sum_xy += float(np.dot(x_coords, y_coords))
+        self.sum_xx += float(np.dot(x_coords, x_coords))
+        self.sum_yy += float(np.dot(y_coords, y_coords))
+
+    def merge(self, other: 'RegressionStats') -> None:
+        """Add every point described by other to the points these running sums describe."""
+        self.n += other.n
+        self.sum_x += other.sum_x
+        self.sum_y += other.sum_y
+        self.sum_xy += other.sum_xy
+        self.sum_xx += other.sum_xx
+        self.sum_yy += other.sum_yy
+
+    def can_fit(self) -> bool:
+        """Return whether a line of best fit can be fit to the points these running sums
+        describe, which needs at least two points whose x coordinates are not all the same.
+
+        >>> stats = RegressionStats()
+        >>> stats.add_points([0.1, 0.1, 0.1], [1.0, 2.0, 3.0])
+        >>> stats.can_fit()
+        False
+        >>> stats.add(0.2, 1.0)
+        >>> stats.can_fit()
+        True
+        """
+        if self.n < 2:
+            return False
+
+        # Note: The sum of squares of the deviations of the x coordinates from their mean is
+        # only zero up to rounding when they are all the same, so it is compared to a
+        # tolerance relative to the sum of their squares
+        s_xx = self.sum_xx - self.sum_x * self.sum_x / self.n
+        return s_xx > _FIT_TOLERANCE * self.sum_xx
+
+    def fit(self) -> RegressionResult:
+        """Return the line of best fit of the points these running sums describe, computed
+        using ordinary least squares.
+
+        Preconditions:
+            - self.can_fit()
+        """
+        # The sums of squares and products of the deviations of the points from their means
+        s_xx = self.sum_xx - self.sum_x * self.sum_x / self.n
+        s_yy = self.sum_yy - self.sum_y * self.sum_y / self.n
+        s_xy = self.sum_xy - self.sum_x * self.sum_y / self.n
+
+        slope = s_xy / s_xx
+        intercept = (self.sum_y - slope * self.sum_x) / self.n
+
+        if s_yy > 0:
+            r_squared = min(max(s_xy * s_xy / (s_xx * s_yy), 0.0), 1.0)
+        else:
+            r_squared = 1.0
+
+        # The standard errors are undefined for 2 points, since a line always fits them exactly
+        if self.n > 2:
+            residual_variance = max(s_yy - slope * s_xy, 0.0) / (self.n - 2)
+            mean_x = self.sum_x / self.n
+            slope_stderr = math.sqrt(residual_variance / s_xx)
+            intercept_stderr = math.sqrt(residual_variance * (1 / self.n + mean_x * mean_x / s_xx))
+        else:
+            slope_stderr = math.nan
+            intercept_stderr = math.nan
+
+        return RegressionResult(self.n, slope, intercept, r_squared, slope_stderr,
+                                intercept_stderr)
+
+    def to_list(self) -> List[float]:
+        """Return a list of these running sums that can be written as json."""
+        return [self.n, self.sum_x, self.sum_y, self.sum_xy, self.sum_xx, self.sum_yy]
+
+
+def stats_from_list(sums: List[float]) -> RegressionStats:
+    """Return the running sums described by sums.
+
+    Preconditions:
+        - sums was returned by the to_list method of a RegressionStats object
+    """
+    stats = RegressionStats()
+    stats.n = int(sums[0])
+    stats.sum_x, stats.sum_y, stats.sum_xy, stats.sum_xx, stats.sum_yy = sums[1:]
+    return stats
+
+
+def stats_from_ssta_data(data: Dict[float, List[float]]) -> RegressionStats:
+    """Return the running sums of the points (SSTA, severity) for every SSTA in data, which
+    fit a line of best fit to every row of the dataset instead of to the average SSTA of each
+    severity.
+
+    Preconditions:
+        - data is the return value of the function read_csv_data_ssta from the read_data
+          module
+
+    >>> round(stats_from_ssta_data({0.0: [1.0], 10.0: [2.0, 2.0]}).fit().slope, 6)
+    10.0
+    """
+    stats = RegressionStats()
+    for severity in data:
+        for ssta in data[severity]:
+            stats.add(ssta, severity)
+    return stats
+
+
+def stats_from_columns(sstas: np.ndarray, severities: np.ndarray) -> RegressionStats:
+    """Return the same running sums as stats_from_ssta_data, where sstas[i] and severities[i]
+    are the SSTA and the severity of the i-th row of a dataset. An SSTA of NaN means there is
+    no SSTA data for that row.
+
+    Preconditions:
+        - sstas and severities are columns of a dataset returned by the function load_dataset
+          from the read_data module
+        - len(sstas) == len(severities)
+    """
+    sstas = np.asarray(sstas, dtype=np.float64)
+    has_ssta = ~np.isnan(sstas)
+
+    stats = RegressionStats()
+    stats.add_arrays(sstas[has_ssta], np.asarray(severities)[has_ssta])
+    return stats
+
+
+if __name__ == '__main__':
+    import python_ta
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    python_ta.check_all(config={
+        'extra-imports': ['math', 'python_ta.contracts', 'numpy'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,346 @@
+"""CSC110 Fall 2020 Final Project: Rolling Up the Dataset
+
+Information
+===============================
+This Python module contains the class and functions that will be used to summarize the
+dataset by year, ocean, realm, ecoregion and country all at once. A RollupCube stores, for
+every combination of those dimensions that appears in the dataset (a cell of the cube), the
+number of rows, the number of coral bleaching events, the sum of the severities and the sum of
+the SSTAs of the rows of that combination.
+
+The cube is built from the typed columns of the dataset in a single pass, and is much smaller
+than the dataset, so any breakdown of the dataset (such as the bleaching events per country,
+or per ecoregion of the Pacific in 2016) is answered by summing the cells of the cube instead
+of reading the csv file again. The frequency and average severity per year shown by the
+visualize_results module is just the cube rolled up by year.
+
+The cube of a csv file is saved in the column cache of the csv file (see load_dataset in the
+read_data module), so it is only rebuilt when the contents of the csv file change.
+
+Copyright Information
+===============================
+This file is Copyright (c) 2020 Anis Singh.
+"""
+import os
+from typing import Dict, List, Optional
+import numpy as np
+from grouped_values import group_by_first_appearance
+import read_data
+import instrumentation
+
+
+# The dimensions of a cube built from a dataset, where the Year dimension is the year of the
+# Date2 column and the other dimensions are the columns of the same name
+DIMENSIONS = ['Year', 'Ocean', 'Realm', 'Ecoregion', 'Country_Name']
+
+# The measures stored for each cell of a cube, which are all sums, so that the measures of
+# any group of cells are the sums of the measures of those cells
+MEASURES = ['count', 'events', 'severity_sum', 'ssta_count', 'ssta_sum']
+
+# The name of the file a cube is saved to in the column cache of a csv file, and the version of
+# the format it is saved in, which is increased whenever a cube saved by an older version of
+# this module can no longer be read.
+_CUBE_FILE = 'cube.npz'
+_CUBE_VERSION = 1
+
+
+class RollupCube:
+    """The measures of every combination of the values of some dimensions of a dataset.
+
+    The cells of a cube are in the order their combinations first appear in the dataset, and
+    the labels of each dimension are in the order they first appear in the dataset.
+
+    Instance Attributes:
+        - dimensions: the names of the dimensions of this cube
+        - labels: a dictionary mapping each dimension to an array of its distinct values
+        - codes: a dictionary mapping each dimension to an array containing, for each cell of
+          this cube, the index of the value of that dimension in labels
+        - measures: a dictionary mapping each name in MEASURES to an array of the value of
+          that measure for each cell of this cube:
+            - count: the number of rows in the cell
+            - events: the number of rows in the cell with a severity above 0
+            - severity_sum: the sum of the severities of the rows in the cell
+            - ssta_count: the number of rows in the cell that have SSTA data
+            - ssta_sum: the sum of the SSTAs of the rows in the cell that have SSTA data
+
+    Representation Invariants:
+        - all(dimension in self.labels and dimension in self.codes
+              for dimension in self.dimensions)
+        - all(name in self.measures for name in MEASURES)
+        - all(len(self.codes[dimension]) == self.num_cells() for dimension in self.dimensions)
+        - all(len(self.measures[name]) == self.num_cells() for name in MEASURES)
+
+    >>> cube = build_cube({'Year': np.array([2005, 2005, 2006]),
+    ...                    'Ocean': np.array(['Pacific', 'Atlantic', 'Pacific'])},
+    ...                   np.array([10.0, 0.0, 30.0]), np.array([0.5, np.nan, 1.5]))
+    >>> cube.rollup(['Ocean']).totals()[('Pacific',)]['mean_severity']
+    20.0
+    >>> cube.where({'Year': [2005]}).totals()
+    {(2005, 'Pacific'): {'count': 1, 'events': 1, 'severity_sum': 10.0, 'ssta_count': 1, \
+'ssta_sum': 0.5, 'mean_severity': 10.0, 'mean_event_severity': 10.0, 'mean_ssta': 0.5}, \
+(2005, 'Atlantic'): {'count': 1, 'events': 0, 'severity_sum': 0.0, 'ssta_count': 0, \
+'ssta_sum': 0.0, 'mean_severity': 0.0, 'mean_event_severity': nan, 'mean_ssta': nan}}
+    """
+    dimensions: List[str]
+    labels: Dict[str, np.ndarray]
+    codes: Dict[str, np.ndarray]
+    measures: Dict[str, np.ndarray]
+
+    def __init__(self, dimensions: List[str], labels: Dict[str, np.ndarray],
+                 codes: Dict[str, np.ndarray], measures: Dict[str, np.ndarray]) -> None:
+        """Initialize a new cube with the given cells.
+
+        Preconditions:
+            - all(dimension in labels and dimension in codes for dimension in dimensions)
+            - all(name in measures for name in MEASURES)
+        """
+        self.dimensions = dimensions
+        self.labels = labels
+        self.codes = codes
+        self.measures = measures
+
+    def num_cells(self) -> int:
+        """Return the number of cells of this cube."""
+        return len(self.measures['count'])
+
+    def num_rows(self) -> int:
+        """Return the number of rows of the dataset that the cells of this cube summarize."""
+        return int(self.measures['count'].sum())
+
+    def where(self, filters: Dict[str, list]) -> 'RollupCube':
+        """Return a new cube containing only the cells of this cube whose value of each
+        dimension in filters is one of the values that dimension is mapped to.
+
+        Preconditions:
+            - all(dimension in self.dimensions for dimension in filters)
+        """
+        keep = np.ones(self.num_cells(), dtype=bool)
+        for dimension in filters:
+            allowed = np.isin(self.labels[dimension], np.asarray(filters[dimension]))
+            keep &= allowed[self.codes[dimension]]
+
+        return RollupCube(self.dimensions, self.labels,
+                          {dimension: self.codes[dimension][keep]
+                           for dimension in self.dimensions},
+                          {name: self.measures[name][keep] for name in MEASURES})
+
+    def rollup(self, dimensions: List[str]) -> 'RollupCube':
+        """Return a new cube with only the given dimensions, where each cell is the sum of the
+        cells of this cube with the same values of those dimensions.
+
+        Rolling up by every dimension of this cube (in a different order, to drill down)
+        returns the same cells, and rolling up by no dimensions returns a single cell with the
+        totals of this cube.
+
+        Preconditions:
+            - all(dimension in self.dimensions for dimension in dimensions)
+        """
+        if self.num_cells() == 0:
+            cells = np.zeros(0, dtype=np.intp)
+        else:
+            sizes = [len(self.labels[dimension]) for dimension in dimensions]
+            keys = np.ravel_multi_index([self.codes[dimension] for dimension in dimensions],
+                                        sizes) if dimensions != [] \
+                else np.zeros(self.num_cells(), dtype=np.intp)
+            cells = group_by_first_appearance(keys)[1]
+
+        first_cell = np.unique(cells, return_index=True)[1]
+        num_cells = len(first_cell)
+
+        measures = {}
+        for name in MEASURES:
+            totals = np.bincount(cells, weights=self.measures[name], minlength=num_cells)
+            measures[name] = totals.astype(self.measures[name].dtype)
+
+        return RollupCube(dimensions, {dimension: self.labels[dimension]
+                                       for dimension in dimensions},
+                          {dimension: self.codes[dimension][first_cell]
+                           for dimension in dimensions},
+                          measures)
+
+    def totals(self) -> Dict[tuple, Dict[str, float]]:
+        """Return a dictionary mapping the values of the dimensions of each cell of this cube
+        (as a tuple, in the order of self.dimensions) to the measures of that cell, along with:
+            - mean_severity: the average severity of the rows of the cell
+            - mean_event_severity: the average severity of the coral bleaching events of the
+              cell (which is what get_freq_and_severity calls the average severity)
+            - mean_ssta: the average SSTA of the rows of the cell that have SSTA data
+        A mean is NaN if there are no values to average.
+        """
+        values = [self.labels[dimension][self.codes[dimension]].tolist()
+                  for dimension in self.dimensions]
+        measures = {name: self.measures[name].tolist() for name in MEASURES}
+
+        cells = {}
+        for i in range(self.num_cells()):
+            cell = {name: measures[name][i] for name in MEASURES}
+            cell['mean_severity'] = _mean(cell['severity_sum'], cell['count'])
+            cell['mean_event_severity'] = _mean(cell['severity_sum'], cell['events'])
+            cell['mean_ssta'] = _mean(cell['ssta_sum'], cell['ssta_count'])
+            cells[tuple(column[i] for column in values)] = cell
+        return cells
+
+    def save(self, filepath: str) -> None:
+        """Atomically write this cube to the .npz file that filepath refers to."""
+        arrays = {'version': np.array(_CUBE_VERSION),
+                  'dimensions': np.array(self.dimensions)}
+        for dimension in self.dimensions:
+            arrays['labels_' + dimension] = self.labels[dimension]
+            arrays['codes_' + dimension] = self.codes[dimension]
+        for name in MEASURES:
+            arrays['measure_' + name] = self.measures[name]
+
+        temp_path = filepath + '.tmp'
+        with open(temp_path, 'wb') as file:
+            np.savez(file, **arrays)
+        os.replace(temp_path, filepath)
+
+
+def _mean(total: float, count: int) -> float:
+    """Return total / count, or NaN if count is 0.
+
+    >>> _mean(3.0, 2)
+    1.5
+    """
+    return total / count if count > 0 else float('nan')
+
+
+# Functions to build a cube from a dataset, and to save and read cubes.
+
+@instrumentation.stage
+def build_cube(dimension_columns: Dict[str, np.ndarray], severities: np.ndarray,
+               sstas: np.ndarray) -> RollupCube:
+    """Return the cube of the rows of a dataset, where dimension_columns maps each dimension
+    to the value of that dimension for each row, and severities[i] and sstas[i] are the
+    severity and the SSTA of the i-th row. An SSTA of NaN means there is no SSTA data for that
+    row.
+
+    Preconditions:
+        - dimension_columns != {}
+        - all(len(dimension_columns[dimension]) == len(severities)
+              for dimension in dimension_columns)
+        - len(severities) == len(sstas)
+    """
+    dimensions = list(dimension_columns)
+    severities = np.asarray(severities, dtype=np.float64)
+    sstas = np.asarray(sstas, dtype=np.float64)
+
+    labels = {}
+    row_codes = []
+    for dimension in dimensions:
+        labels[dimension], codes = group_by_first_appearance(dimension_columns[dimension])
+        row_codes.append(codes)
+
+    # The cell of each row is found from the codes of its values, in a single pass over the rows
+    if len(severities) == 0:
+        cells = np.zeros(0, dtype=np.intp)
+    else:
+        keys = np.ravel_multi_index(row_codes, [len(labels[dimension])
+                                                for dimension in dimensions])
+        cells = group_by_first_appearance(keys)[1]
+    first_row = np.unique(cells, return_index=True)[1]
+    num_cells = len(first_row)
+    has_ssta = ~np.isnan(sstas)
+
+    measures = {'count': np.bincount(cells, minlength=num_cells),
+                'events': np.bincount(cells[severities > 0.0], minlength=num_cells),
+                'severity_sum': np.bincount(cells, weights=severities, minlength=num_cells),
+                'ssta_count': np.bincount(cells[has_ssta], minlength=num_cells),
+                'ssta_sum': np.bincount(cells[has_ssta], weights=sstas[has_ssta],
+                                        minlength=num_cells)}
+
+    return RollupCube(dimensions, labels,
+                      {dimensions[i]: row_codes[i][first_row].astype(np.int32)
+                       for i in range(len(dimensions))},
+                      {name: measures[name].astype(np.int64 if name in {'count', 'events',
+                                                                         'ssta_count'}
+                                                   else np.float64)
+                       for name in MEASURES})
+
+
+@instrumentation.stage
+def load_cube(filepath: str, use_cache: bool = True) -> RollupCube:
+    """Return the cube of the dataset stored in the csv file that filepath refers to, with the
+    dimensions in DIMENSIONS.
+
+    If use_cache is True, the cube is read from the column cache of the csv file if it was
+    saved there for the current contents of the csv file, and is saved there otherwise.
+
+    Preconditions:
+        - filepath refers to a csv file in the format of data/coral_bleaching_data.csv
+    """
+    dataset = read_data.load_dataset(filepath, use_cache)
+    cube_path = None if dataset.cache_dir is None else os.path.join(dataset.cache_dir,
+                                                                    _CUBE_FILE)
+    if cube_path is not None:
+        cube = read_cube(cube_path)
+        if cube is not None:
+            return cube
+
+    dataset.load_columns(['Date2', 'Average_Bleaching', 'SSTA'] + DIMENSIONS[1:])
+    cube = build_cube({'Year': dataset.years(),
+                       **{dimension: dataset.column(dimension) for dimension in DIMENSIONS[1:]}},
+                      dataset.column('Average_Bleaching'), dataset.column('SSTA'))
+
+    if cube_path is not None:
+        try:
+            cube.save(cube_path)
+        except OSError:
+            pass
+    return cube
+
+
+def read_cube(filepath: str) -> Optional[RollupCube]:
+    """Return the cube saved to the .npz file that filepath refers to, or None if there is no
+    such file or it was saved in an older format.
+    """
+    try:
+        with np.load(filepath, allow_pickle=False) as arrays:
+            if int(arrays['version']) != _CUBE_VERSION:
+                return None
+            dimensions = arrays['dimensions'].tolist()
+            return RollupCube(dimensions,
+                              {dimension: arrays['labels_' + dimension]
+                               for dimension in dimensions},
+                              {dimension: arrays['codes_' + dimension]
+                               for dimension in dimensions},
+                              {name: arrays['measure_' + name] for name in MEASURES})
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def parse_filters(filters: List[str]) -> Dict[str, list]:
+    """Return a dictionary mapping each dimension to the values it is filtered to by filters,
+    where each filter is in the form dimension=value. The values of the Year dimension are
+    integers.
+
+    Preconditions:
+        - all('=' in item for item in filters)
+
+    >>> parse_filters(['Year=2016', 'Ocean=Pacific', 'Ocean=Indian'])
+    {'Year': [2016], 'Ocean': ['Pacific', 'Indian']}
+    """
+    parsed = {}
+    for item in filters:
+        dimension, value = item.split('=', 1)
+        parsed.setdefault(dimension, []).append(int(value) if dimension == 'Year' else value)
+    return parsed
+
+
+if __name__ == '__main__':
+    import python_ta
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    python_ta.check_all(config={
+        'extra-imports': ['os', 'numpy', 'grouped_values', 'read_data', 'instrumentation',
+                          'python_ta.contracts'],
+        'allowed-io': ['save', 'read_cube'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,543 @@
+"""CSC110 Fall 2020 Final Project: A Local Query Service
+
+Information
+===============================
+This Python module contains a small HTTP service (built on asyncio) that serves the results of
+my project as json, so that they can be used without running main.py and reading them off the
+plots. For example, running
+
+    python service.py --port 8110
+
+serves the results on http://127.0.0.1:8110 with the following endpoints:
+    - /freq-severity: the frequency and average severity of the coral bleaching events per
+      year, in the same form as python main.py --result fs --format json
+    - /ssta-points: the average SSTA of each severity and the line of best fit of the SSTA of
+      every row, in the same form as python main.py --result c --format json
+    - /map-points?year=2005&bbox=min_lon,min_lat,max_lon,max_lat: the coral bleaching events
+      of a year as lists [latitude, longitude, severity], optionally only the ones inside a
+      bounding box (which crosses the antimeridian if min_lon > max_lon), or only the ones
+      within a distance of a point (with near=lat,lon,radius_km instead of bbox)
+    - /rollup?by=Year,Ocean&Country_Name=Australia: the number of rows, the number of coral
+      bleaching events, the severity and the SSTA of every combination of the dimensions in by
+      (any of Year, Ocean, Realm, Ecoregion and Country_Name, or none for the totals), rolled
+      up from the cube of the rollup module, optionally only for the rows whose dimensions have
+      the given values (a dimension can be given more than once to allow several values)
+    - /health: whether the service is up, and how many results are cached
+
+The dataset is loaded once when the service starts. Every result is computed at most once
+while it is cached: concurrent requests for the same result wait for the same computation,
+which runs in a thread so that the service keeps answering other requests. Results are kept
+in a cache that evicts the least recently used result once it is full, and any result older
+than its time to live. When a result is computed, the dataset is reloaded first if the csv
+file has changed since it was loaded.
+
+Copyright Information
+===============================
+This file is Copyright (c) 2020 Anis Singh.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import read_data
+import compute_on_data
+import regression
+import rollup
+from main import result_to_json
+
+
+DATA_FILE = 'data/coral_bleaching_data.csv'
+
+# The columns of the dataset that the endpoints use
+_SERVICE_COLUMNS = ['Date2', 'Average_Bleaching', 'SSTA', 'Latitude_Degrees',
+                    'Longitude_Degrees']
+
+_STATUS_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+                   405: 'Method Not Allowed', 500: 'Internal Server Error',
+                   503: 'Service Unavailable'}
+
+
+class RequestError(Exception):
+    """Raised when a request cannot be answered, along with the HTTP status to answer it
+    with.
+
+    Instance Attributes:
+        - status: the HTTP status code of the response
+    """
+    status: int
+
+    def __init__(self, status: int, message: str) -> None:
+        """Initialize a new error with the given HTTP status and message."""
+        super().__init__(message)
+        self.status = status
+
+
+class ResultCache:
+    """A cache of at most max_size results, where the least recently used result is evicted
+    when the cache is full, and a result is evicted once it is older than ttl seconds.
+
+    Instance Attributes:
+        - max_size: the most results the cache holds
+        - ttl: how long (in seconds) a result stays in the cache after it is added
+        - clock: a function returning the current time (in seconds)
+
+    Representation Invariants:
+        - self.max_size > 0
+        - self.ttl > 0
+        - len(self._entries) <= self.max_size
+
+    >>> now = [0.0]
+    >>> cache = ResultCache(2, 10.0, lambda: now[0])
+    >>> cache.put('a', 1)
+    >>> cache.put('b', 2)
+    >>> cache.get('a')
+    1
+    >>> cache.put('c', 3)
+    >>> cache.get('b') is None
+    True
+    >>> now[0] = 11.0
+    >>> cache.get('a') is None
+    True
+    """
+    max_size: int
+    ttl: float
+    clock: Callable[[], float]
+    # A dictionary mapping each key to a tuple containing the time its result was added at
+    # index 0 and its result at index 1, ordered from least to most recently used
+    _entries: OrderedDict
+
+    def __init__(self, max_size: int = 128, ttl: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """Initialize a new, empty cache."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+
+    def get(self, key: Any) -> Optional[Any]:
+        """Return the result cached for key, or None if it is not cached (or has expired)."""
+        if key not in self._entries:
+            return None
+
+        added, result = self._entries[key]
+        if self.clock() - added > self.ttl:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return result
+
+    def put(self, key: Any, result: Any) -> None:
+        """Cache result for key, evicting the least recently used result if the cache is
+        full.
+        """
+        self._entries[key] = (self.clock(), result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove every result from the cache."""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        """Return the number of results in the cache, including expired ones that have not
+        been evicted yet.
+        """
+        return len(self._entries)
+
+
+class BleachingService:
+    """The results of my project for a single csv file, computed on request and cached.
+
+    Instance Attributes:
+        - data_file: the csv file the results are computed from
+        - cache: the cache of the results that have been computed
+        - dataset: the dataset loaded from data_file
+        - year_index: the rows of the dataset, indexed by year
+        - spatial_index: the rows of the dataset, indexed by location and year
+        - cube: the cube of the dataset
+
+    Representation Invariants:
+        - self.dataset.filepath == os.path.abspath(self.data_file)
+    """
+    data_file: str
+    cache: ResultCache
+    dataset: read_data.BleachingDataset
+    year_index: compute_on_data.YearIndex
+    spatial_index: compute_on_data.SpatialIndex
+    cube: rollup.RollupCube
+    # A dictionary mapping the key of each result that is being computed to the future that
+    # will be set to it, so that concurrent requests for it wait for the same computation
+    _pending: Dict[Tuple, asyncio.Future]
+    # A lock held while a result is computed, so that the dataset is never reloaded while
+    # another thread is computing a result from it
+    _lock: threading.Lock
+
+    def __init__(self, data_file: str = DATA_FILE, cache: Optional[ResultCache] = None) -> None:
+        """Initialize a new service for data_file, loading its dataset.
+
+        Preconditions:
+            - data_file refers to a csv file in the format of data/coral_bleaching_data.csv
+        """
+        self.data_file = data_file
+        self.cache = cache if cache is not None else ResultCache()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        """Load the dataset of the csv file and its cube, and index its rows by year and by
+        location.
+        """
+        self.dataset = read_data.load_dataset(self.data_file)
+        self.dataset.load_columns(_SERVICE_COLUMNS)
+        df = compute_on_data.convert_dates(self.dataset.to_dataframe(_SERVICE_COLUMNS))
+        self.year_index = compute_on_data.YearIndex(df)
+        self.spatial_index = compute_on_data.SpatialIndex(df)
+        self.cube = rollup.load_cube(self.data_file)
+
+    def _reload_if_changed(self) -> None:
+        """Load the dataset again (and empty the cache) if the csv file has changed since the
+        dataset was loaded.
+        """
+        if read_data.load_dataset(self.data_file) is not self.dataset:
+            self._load()
+            self.cache.clear()
+
+    async def query(self, path: str, params: Dict[str, List[str]]) -> Any:
+        """Return the result of the endpoint at path for the query parameters in params,
+        from the cache if it is cached, or computed in a thread otherwise.
+
+        Raise a RequestError if there is no endpoint at path or if params are invalid.
+        """
+        if path not in _ENDPOINTS:
+            raise RequestError(404, f'no endpoint at {path}')
+        if path == '/health':
+            return {'status': 'ok', 'cached_results': len(self.cache)}
+
+        endpoint = _ENDPOINTS[path]
+        key = (path,) + tuple(sorted((name, tuple(params[name])) for name in params))
+
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+        if key in self._pending:
+            return await asyncio.shield(self._pending[key])
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending[key] = future
+        try:
+            result = await loop.run_in_executor(None, self._compute, endpoint, params)
+            self.cache.put(key, result)
+            future.set_result(result)
+            return result
+        except Exception as error:
+            future.set_exception(error)
+            raise
+        finally:
+            del self._pending[key]
+            # Note: If this request was cancelled (such as when its client disconnected), the
+            # requests waiting for its result are answered with an error instead of waiting
+            # forever
+            if not future.done():
+                future.set_exception(RequestError(503, 'the request computing this result '
+                                                       'was cancelled, try again'))
+            # The exception is only retrieved if another request was waiting for it
+            future.exception()
+
+    def _compute(self, endpoint: Callable, params: Dict[str, List[str]]) -> Any:
+        """Return the result of endpoint for params, reloading the dataset first if the csv
+        file has changed.
+        """
+        with self._lock:
+            self._reload_if_changed()
+            return endpoint(self, params)
+
+    def freq_severity(self, params: Dict[str, List[str]]) -> Dict[str, dict]:
+        """Return the frequency and average severity of the coral bleaching events per year.
+        """
+        _check_params(params, [])
+        data = compute_on_data.get_freq_and_severity_vectorized(
+            self.dataset.years(), self.dataset.column('Average_Bleaching'))
+        return result_to_json('fs', data)
+
+    def ssta_points(self, params: Dict[str, List[str]]) -> Dict[str, Any]:
+        """Return the average SSTA of each severity, along with the line of best fit of the
+        SSTA of every row.
+        """
+        _check_params(params, [])
+        severities = self.dataset.column('Average_Bleaching')
+        sstas = self.dataset.column('SSTA')
+        averages = compute_on_data.determine_average_sstas_vectorized(severities, sstas)
+        points = compute_on_data.convert_to_points(averages)
+        raw_fit = regression.stats_from_columns(sstas, severities).fit()
+        return result_to_json('c', (points, raw_fit))
+
+    def map_points(self, params: Dict[str, List[str]]) -> Dict[str, Any]:
+        """Return the coral bleaching events of the year in params, optionally only the ones
+        inside the bounding box or near the point in params, in ascending order of severity.
+        """
+        _check_params(params, ['year', 'bbox', 'near'])
+        year = _int_param(params, 'year')
+        if year not in self.year_index.offsets:
+            return {'year': year, 'points': []}
+
+        if 'bbox' in params and 'near' in params:
+            raise RequestError(400, 'expected bbox or near, not both')
+        elif 'bbox' in params:
+            rows = self.spatial_index.bbox(*_bbox_param(params), year=year)
+        elif 'near' in params:
+            rows = self.spatial_index.radius(*_near_param(params), year=year)
+        else:
+            rows = self.year_index.events_in_year(year)
+
+        # Note: The rows of a region are in their original order, so they are sorted by
+        # severity the same way (stably) as the rows of a YearIndex
+        events = rows[rows['Average_Bleaching'] > 0.0]
+        events = events.sort_values('Average_Bleaching', kind='mergesort')
+        points = events[['Latitude_Degrees', 'Longitude_Degrees', 'Average_Bleaching']]
+        return {'year': year, 'points': points.to_numpy().tolist()}
+
+    def rollup_cells(self, params: Dict[str, List[str]]) -> Dict[str, Any]:
+        """Return the measures of every combination of the dimensions in the by parameter,
+        for the rows whose dimensions have the values in params.
+        """
+        for name in params:
+            if name != 'by' and name not in rollup.DIMENSIONS:
+                raise RequestError(400, f'unknown parameter {name}')
+        by = _dimensions_param(params)
+        try:
+            filters = rollup.parse_filters([f'{name}={value}' for name in params
+                                            if name != 'by' for value in params[name]])
+        except ValueError:
+            raise RequestError(400, 'Year must be an integer') from None
+
+        cells = []
+        totals = self.cube.where(filters).rollup(by).totals()
+        for key in totals:
+            cell = {by[i]: key[i] for i in range(len(by))}
+            for name in totals[key]:
+                # Note: The mean of a cell without any values is NaN, which is not valid json
+                value = totals[key][name]
+                cell[name] = None if isinstance(value, float) and value != value else value
+            cells.append(cell)
+        return {'by': by, 'cells': cells}
+
+
+# A dictionary mapping the path of each endpoint to the method of BleachingService that
+# computes its result (the /health endpoint is answered by BleachingService.query itself)
+_ENDPOINTS = {
+    '/freq-severity': BleachingService.freq_severity,
+    '/ssta-points': BleachingService.ssta_points,
+    '/map-points': BleachingService.map_points,
+    '/rollup': BleachingService.rollup_cells,
+    '/health': None
+}
+
+
+# Functions to validate the query parameters of a request.
+
+def _check_params(params: Dict[str, List[str]], allowed: List[str]) -> None:
+    """Raise a RequestError if params contains a parameter that is not in allowed, or more
+    than one value for a parameter.
+
+    >>> _check_params({'year': ['2005']}, ['year'])
+    >>> _check_params({'colour': ['red']}, ['year'])  # doctest: +IGNORE_EXCEPTION_DETAIL
+    Traceback (most recent call last):
+    RequestError: unknown parameter colour
+    """
+    for name in params:
+        if name not in allowed:
+            raise RequestError(400, f'unknown parameter {name}')
+        if len(params[name]) != 1:
+            raise RequestError(400, f'expected a single value for {name}')
+
+
+def _int_param(params: Dict[str, List[str]], name: str) -> int:
+    """Return the required integer parameter called name in params, or raise a RequestError
+    if it is missing or is not an integer.
+
+    >>> _int_param({'year': ['2005']}, 'year')
+    2005
+    """
+    if name not in params:
+        raise RequestError(400, f'missing parameter {name}')
+    try:
+        return int(params[name][0])
+    except ValueError:
+        raise RequestError(400, f'{name} must be an integer') from None
+
+
+def _bbox_param(params: Dict[str, List[str]]) -> Tuple[float, float, float, float]:
+    """Return the bounding box (min_lon, min_lat, max_lon, max_lat) in params, or raise a
+    RequestError if it is not four numbers, or its latitudes are out of order.
+
+    >>> _bbox_param({'bbox': ['140,-30,155,-10']})
+    (140.0, -30.0, 155.0, -10.0)
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = [float(value) for value in
+                                              params['bbox'][0].split(',')]
+    except ValueError:
+        raise RequestError(400, 'bbox must be four numbers min_lon,min_lat,max_lon,max_lat') \
+            from None
+    if min_lat > max_lat or not all(np.isfinite([min_lon, min_lat, max_lon, max_lat])):
+        raise RequestError(400, 'bbox must have min_lat <= max_lat')
+    return (min_lon, min_lat, max_lon, max_lat)
+
+
+def _near_param(params: Dict[str, List[str]]) -> Tuple[float, float, float]:
+    """Return the point and radius (lat, lon, radius_km) in params, or raise a RequestError if
+    it is not three numbers, or is not a valid point and radius.
+
+    >>> _near_param({'near': ['-18.3,147.7,200']})
+    (-18.3, 147.7, 200.0)
+    """
+    try:
+        lat, lon, radius_km = [float(value) for value in params['near'][0].split(',')]
+    except ValueError:
+        raise RequestError(400, 'near must be three numbers lat,lon,radius_km') from None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0 and radius_km >= 0.0):
+        raise RequestError(400, 'near must have -90 <= lat <= 90, -180 <= lon <= 180 and '
+                                'radius_km >= 0')
+    return (lat, lon, radius_km)
+
+
+def _dimensions_param(params: Dict[str, List[str]]) -> List[str]:
+    """Return the dimensions in the by parameter of params (which are separated by commas),
+    or raise a RequestError if one of them is not a dimension of a cube.
+
+    >>> _dimensions_param({'by': ['Year,Ocean']})
+    ['Year', 'Ocean']
+    >>> _dimensions_param({})
+    []
+    """
+    if 'by' not in params:
+        return []
+    if len(params['by']) != 1:
+        raise RequestError(400, 'expected a single value for by')
+
+    dimensions = [name for name in params['by'][0].split(',') if name != '']
+    for name in dimensions:
+        if name not in rollup.DIMENSIONS:
+            raise RequestError(400, f'by must only contain {", ".join(rollup.DIMENSIONS)}')
+    if len(set(dimensions)) != len(dimensions):
+        raise RequestError(400, 'by must not contain a dimension more than once')
+    return dimensions
+
+
+# Functions to serve the results of a BleachingService over HTTP.
+
+async def handle_connection(service: BleachingService, reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter) -> None:
+    """Answer the HTTP request read from reader with the result of service for it, as json
+    written to writer, and then close the connection.
+    """
+    try:
+        request_line = (await reader.readline()).decode('latin-1').split()
+
+        # Skip the headers of the request, which are not used
+        while (await reader.readline()).strip() != b'':
+            pass
+
+        if len(request_line) != 3:
+            raise RequestError(400, 'malformed request line')
+        method, target = request_line[0], request_line[1]
+        if method != 'GET':
+            raise RequestError(405, f'{method} is not supported')
+
+        url = urlsplit(target)
+        status, body = 200, await service.query(url.path, parse_qs(url.query))
+    except RequestError as error:
+        status, body = error.status, {'error': str(error)}
+    except (ConnectionError, asyncio.IncompleteReadError):
+        writer.close()
+        return
+    except Exception as error:
+        status, body = 500, {'error': f'{type(error).__name__}: {error}'}
+
+    data = json.dumps(body).encode()
+    writer.write(f'HTTP/1.1 {status} {_STATUS_REASONS[status]}\r\n'
+                 f'Content-Type: application/json\r\n'
+                 f'Content-Length: {len(data)}\r\n'
+                 f'Connection: close\r\n\r\n'.encode() + data)
+    try:
+        await writer.drain()
+    except ConnectionError:
+        pass
+    writer.close()
+
+
+async def start_server(service: BleachingService, host: str = '127.0.0.1',
+                       port: int = 8110) -> asyncio.AbstractServer:
+    """Return a server answering the HTTP requests made to host and port with the results of
+    service. If port is 0, any free port is used (see the sockets attribute of the server).
+    """
+    return await asyncio.start_server(
+        lambda reader, writer: handle_connection(service, reader, writer), host, port)
+
+
+def run_cli(argv: Optional[List[str]] = None) -> int:
+    """Run the command line interface of this module with the arguments in argv (or the
+    arguments this program was run with, if argv is None), serving requests until the
+    program is interrupted. Return the exit status.
+    """
+    parser = argparse.ArgumentParser(description='Serve the results of the project as json.')
+    parser.add_argument('--data', default=DATA_FILE,
+                        help='the csv file to read the data from')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='the address to listen on')
+    parser.add_argument('--port', type=int, default=8110,
+                        help='the port to listen on')
+    parser.add_argument('--cache-size', type=int, default=128,
+                        help='the most results to keep cached')
+    parser.add_argument('--ttl', type=float, default=60.0,
+                        help='how long (in seconds) a result stays cached')
+    args = parser.parse_args(argv)
+
+    service = BleachingService(args.data, ResultCache(args.cache_size, args.ttl))
+
+    async def serve() -> None:
+        server = await start_server(service, args.host, args.port)
+        print(f'Serving {os.path.abspath(args.data)} on http://{args.host}:{args.port}',
+              file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    import python_ta
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    python_ta.check_all(config={
+        'extra-imports': ['argparse', 'asyncio', 'json', 'os', 'threading', 'time',
+                          'collections', 'urllib.parse', 'numpy', 'read_data',
+                          'compute_on_data', 'regression', 'rollup', 'main',
+                          'python_ta.contracts'],
+        'allowed-io': ['run_cli'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import doctest
+    doctest.testmod(verbose=True)
+
+    sys.exit(run_cli())
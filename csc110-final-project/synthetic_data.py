@@ -0,0 +1,122 @@
+"""CSC110 Fall 2020 Final Project: Generating Synthetic Data
+
+Information
+===============================
+This Python module contains the functions that will be used to generate synthetic datasets in
+the exact format of data/coral_bleaching_data.csv, but with any number of rows, so that the
+time it takes to read, compute on and visualize much larger datasets can be measured.
+
+Every synthetic row is based on a random row of data/coral_bleaching_data.csv, so the
+synthetic datasets have the same years, locations and 'nd' (no data) entries as the real
+dataset, in the same proportions. The location, date and severity of each row are then
+randomly changed a little, so that the synthetic rows are not just copies of the real ones.
+
+Copyright Information
+===============================
+This file is Copyright (c) 2020 Anis Singh.
+"""
+import csv
+from typing import Dict, List, Tuple
+import numpy as np
+
+
+TEMPLATE_FILE = 'data/coral_bleaching_data.csv'
+
+# The number of rows that are generated and written at a time
+_CHUNK_SIZE = 100000
+
+
+def generate_csv(filepath: str, num_rows: int, seed: int = 0,
+                 template_file: str = TEMPLATE_FILE) -> None:
+    """Write a synthetic dataset with num_rows rows to the csv file that filepath refers to.
+
+    The same seed always generates the same dataset.
+
+    Preconditions:
+        - num_rows >= 0
+        - template_file refers to a csv file in the format of
+          data/coral_bleaching_data.csv
+    """
+    header, template = _read_template(template_file)
+    num_templates = len(template[header[0]])
+    rng = np.random.default_rng(seed)
+
+    with open(filepath, 'w', newline='') as file:
+        writer = csv.writer(file, lineterminator='\n')
+        writer.writerow(header)
+
+        for start in range(0, num_rows, _CHUNK_SIZE):
+            size = min(_CHUNK_SIZE, num_rows - start)
+            rows = rng.integers(0, num_templates, size)
+            columns = {name: template[name][rows] for name in header}
+            _vary_columns(columns, rng, start)
+            writer.writerows(zip(*[columns[name].tolist() for name in header]))
+
+
+def _read_template(template_file: str) -> Tuple[List[str], Dict[str, np.ndarray]]:
+    """Return a tuple containing the header of template_file at index 0, and a dictionary
+    mapping the name of each column of template_file to an array of its values at index 1.
+    """
+    with open(template_file) as file:
+        reader = csv.reader(file)
+        header = next(reader)
+        rows = list(reader)
+
+    return (header, {header[i]: np.array([row[i] for row in rows], dtype=object)
+                     for i in range(len(header))})
+
+
+def _vary_columns(columns: Dict[str, np.ndarray], rng: np.random.Generator,
+                  first_id: int) -> None:
+    """Mutate the columns of a chunk of synthetic rows copied from template rows, by giving
+    each row a new ID, and by randomly changing the location, date and severity of each row.
+
+    Preconditions:
+        - This function is only meant to be called by generate_csv as a helper function.
+    """
+    size = len(columns['ID'])
+    columns['ID'] = np.arange(first_id + 1, first_id + size + 1)
+
+    # Move each location up to about 1 km in every direction
+    for name, limit in [('Latitude_Degrees', 90.0), ('Longitude_Degrees', 180.0)]:
+        degrees = columns[name].astype(np.float64) + rng.uniform(-0.01, 0.01, size)
+        columns[name] = np.round(np.clip(degrees, -limit, limit), 5)
+
+    # Keep the year of each row, but pick a new month and day
+    years = (columns['Date2'].astype(np.int64) // 10000)
+    months = rng.integers(1, 13, size)
+    days = rng.integers(1, 29, size)
+    columns['Date2'] = years * 10000 + months * 100 + days
+    columns['Date'] = np.array([f'{months[i]}/{days[i]}/{years[i]}' for i in range(size)],
+                               dtype=object)
+
+    # Keep the rows with no bleaching unbleached, and change the severity of the rest by up
+    # to 10% of their value
+    severities = columns['Average_Bleaching'].astype(np.float64)
+    severities = severities * rng.uniform(0.9, 1.1, size)
+    columns['Average_Bleaching'] = np.round(np.clip(severities, 0.0, 100.0), 2)
+
+    # Change each SSTA by up to 0.05 degrees, keeping the 'nd' entries
+    sstas = columns['SSTA'].copy()
+    has_ssta = sstas != 'nd'
+    changes = rng.uniform(-0.05, 0.05, int(has_ssta.sum()))
+    sstas[has_ssta] = np.round(sstas[has_ssta].astype(np.float64) + changes, 2)
+    columns['SSTA'] = sstas
+
+
+if __name__ == '__main__':
+    import python_ta
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    python_ta.check_all(config={
+        'extra-imports': ['csv', 'python_ta.contracts', 'numpy'],
+        'allowed-io': ['generate_csv', '_read_template'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import doctest
+    doctest.testmod(verbose=True)
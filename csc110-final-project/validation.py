@@ -0,0 +1,445 @@
+"""CSC110 Fall 2020 Final Project: Validating the Data
+
+Information
+===============================
+This Python module contains the rules that the values of the dataset must follow, and the
+classes and functions that will be used to check the rows of the dataset against them while
+they are parsed, so that a bad row is quarantined instead of stopping (or silently skewing)
+the computations on the data.
+
+A row is rejected if it does not have the same number of fields as the header, or if any of
+the following columns has an invalid value in it:
+    - Date2: a date in the form yyyymmdd
+    - Latitude_Degrees: a number from -90 to 90
+    - Longitude_Degrees: a number from -180 to 180
+    - Average_Bleaching: a number from 0 to 100
+    - SSTA: a number, or 'nd' if there is no SSTA data for the row
+No other column may be 'nd'. Every number must be finite and may only contain digits, signs,
+decimal points and exponents.
+
+Copyright Information
+===============================
+This file is Copyright (c) 2020 Anis Singh.
+"""
+import csv
+import json
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+
+# The codes of the errors a value can have, where VALID means the value has no error
+VALID = 0
+INVALID = 1
+OUT_OF_RANGE = 2
+MISSING = 3
+
+# The key of error_counts in a ValidationReport for the rows that have the wrong number of
+# fields, which are rejected without checking their values
+MALFORMED_ROW = 'row'
+
+# Lookup tables of whether each byte can appear in a date, and in a number, checked by
+# check_column (where 0 is the padding after the end of a field)
+_DATE_CHARS = np.zeros(256, dtype=bool)
+_DATE_CHARS[list(b'0123456789\x00')] = True
+_NUMBER_CHARS = _DATE_CHARS.copy()
+_NUMBER_CHARS[list(b'+-.eE')] = True
+
+# The same characters, for checking a single value
+_DATE_CHAR_SET = frozenset('0123456789')
+_NUMBER_CHAR_SET = frozenset('0123456789+-.eE')
+
+# The number of days in each month of a year that is not a leap year (where index 0 is unused)
+_DAYS_IN_MONTH = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+# The suffixes of the quarantine files written next to a csv file with rejected rows, which
+# contain the rejected rows, and the number of errors found in each column
+_REJECTED_ROWS_SUFFIX = '.rejected.csv'
+_ERROR_COUNTS_SUFFIX = '.rejected.json'
+
+
+class ColumnRule:
+    """A rule that every value of a column of the dataset must follow.
+
+    Instance Attributes:
+        - kind: 'date' if every value must be a date in the form yyyymmdd, or 'number' if
+          every value must be a number
+        - minimum: the smallest number a value may be, or None if there is no such number
+        - maximum: the largest number a value may be, or None if there is no such number
+        - allows_missing: whether a value may be 'nd' (no data)
+
+    Representation Invariants:
+        - self.kind in {'date', 'number'}
+        - self.minimum is None or self.maximum is None or self.minimum <= self.maximum
+
+    >>> rule = ColumnRule('number', 0.0, 100.0)
+    >>> [check_value(text, rule) for text in ['12.5', '101', 'nd', 'abc']]
+    [0, 2, 3, 1]
+    """
+    kind: str
+    minimum: Optional[float]
+    maximum: Optional[float]
+    allows_missing: bool
+
+    def __init__(self, kind: str, minimum: Optional[float] = None,
+                 maximum: Optional[float] = None, allows_missing: bool = False) -> None:
+        """Initialize a new rule for the values of a column."""
+        self.kind = kind
+        self.minimum = minimum
+        self.maximum = maximum
+        self.allows_missing = allows_missing
+
+    def message(self, error: int) -> str:
+        """Return a description of the error whose code is error.
+
+        Preconditions:
+            - error in {INVALID, OUT_OF_RANGE, MISSING}
+
+        >>> ColumnRule('number', -90.0, 90.0).message(OUT_OF_RANGE)
+        'not between -90.0 and 90.0'
+        """
+        if error == MISSING:
+            return "'nd' is not allowed"
+        elif error == OUT_OF_RANGE:
+            return f'not between {self.minimum} and {self.maximum}'
+        elif self.kind == 'date':
+            return 'not a date in the form yyyymmdd'
+        else:
+            return 'not a number'
+
+
+# The rule of each column of the dataset that is checked
+COLUMN_RULES = {
+    'Date2': ColumnRule('date'),
+    'Latitude_Degrees': ColumnRule('number', -90.0, 90.0),
+    'Longitude_Degrees': ColumnRule('number', -180.0, 180.0),
+    'Average_Bleaching': ColumnRule('number', 0.0, 100.0),
+    'SSTA': ColumnRule('number', allows_missing=True)
+}
+
+
+class ValidationReport:
+    """A report of the rows of a csv file that were rejected, which is filled in one block of
+    rows at a time while the csv file is parsed.
+
+    Instance Attributes:
+        - num_rows: the number of rows (after the header) that have been checked
+        - error_counts: a dictionary mapping the name of each checked column to the number of
+          rows that have an invalid value in that column, and MALFORMED_ROW to the number of
+          rows that have the wrong number of fields
+        - rejected_rows: the index of each rejected row (where the row after the header is at
+          index 0), in order
+        - reasons: the reasons each row in rejected_rows was rejected, in the same order
+        - byte_ranges: the bytes (start inclusive, end exclusive) of the csv file that each row
+          in rejected_rows was read from, in the same order
+
+    Representation Invariants:
+        - len(self.rejected_rows) == len(self.reasons) == len(self.byte_ranges)
+        - len(self.rejected_rows) <= self.num_rows
+        - all(self.error_counts[name] >= 0 for name in self.error_counts)
+    """
+    num_rows: int
+    error_counts: Dict[str, int]
+    rejected_rows: List[int]
+    reasons: List[str]
+    byte_ranges: List[Tuple[int, int]]
+
+    def __init__(self, columns: List[str]) -> None:
+        """Initialize a new empty report for the checked columns in columns."""
+        self.num_rows = 0
+        self.error_counts = {name: 0 for name in columns}
+        self.error_counts[MALFORMED_ROW] = 0
+        self.rejected_rows = []
+        self.reasons = []
+        self.byte_ranges = []
+
+    def num_rejected(self) -> int:
+        """Return the number of rows that have been rejected."""
+        return len(self.rejected_rows)
+
+    def add_block(self, malformed: np.ndarray, errors: Dict[str, np.ndarray],
+                  row_bounds: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+        """Add the next block of rows of the csv file to this report, and return an array of
+        whether each of those rows is valid.
+
+        malformed is an array of whether each row has the wrong number of fields, errors maps
+        the name of each checked column to the error code of its value in each row (as
+        returned by check_column), and row_bounds contains the start and end bytes of each
+        row in the csv file.
+
+        Preconditions:
+            - all(name in self.error_counts for name in errors)
+            - all(len(errors[name]) == len(malformed) for name in errors)
+            - len(row_bounds[0]) == len(row_bounds[1]) == len(malformed)
+
+        >>> report = ValidationReport(['SSTA'])
+        >>> report.add_block(np.array([False, True, False]), {'SSTA': np.array([0, 1, 1])},
+        ...                  (np.array([0, 5, 9]), np.array([4, 8, 12]))).tolist()
+        [True, False, False]
+        >>> report.error_counts
+        {'SSTA': 1, 'row': 1}
+        >>> (report.rejected_rows, report.reasons)
+        ([1, 2], ['wrong number of fields', 'SSTA: not a number'])
+        """
+        invalid = malformed.copy()
+        for name in errors:
+            has_error = (errors[name] != VALID) & ~malformed
+            self.error_counts[name] += int(np.count_nonzero(has_error))
+            invalid |= has_error
+        self.error_counts[MALFORMED_ROW] += int(np.count_nonzero(malformed))
+
+        for i in np.flatnonzero(invalid).tolist():
+            if malformed[i]:
+                reason = 'wrong number of fields'
+            else:
+                reason = '; '.join(f'{name}: {COLUMN_RULES[name].message(int(errors[name][i]))}'
+                                   for name in errors if errors[name][i] != VALID)
+            self.rejected_rows.append(self.num_rows + i)
+            self.reasons.append(reason)
+            self.byte_ranges.append((int(row_bounds[0][i]), int(row_bounds[1][i])))
+
+        self.num_rows += len(malformed)
+        return ~invalid
+
+    def summary(self) -> str:
+        """Return a one-line summary of the rows that were rejected and why.
+
+        >>> report = ValidationReport(['Date2', 'SSTA'])
+        >>> report.num_rows = 10
+        >>> report.rejected_rows = [3]
+        >>> report.error_counts['Date2'] = 1
+        >>> report.summary()
+        'rejected 1 of 10 rows (Date2: 1)'
+        """
+        counts = ', '.join(f'{name}: {self.error_counts[name]}' for name in self.error_counts
+                           if self.error_counts[name] > 0)
+        return f'rejected {self.num_rejected()} of {self.num_rows} rows ({counts})'
+
+    def to_dict(self) -> dict:
+        """Return a dictionary containing this report, which can be written as json."""
+        return {'num_rows': self.num_rows,
+                'error_counts': self.error_counts,
+                'rejected_rows': self.rejected_rows,
+                'reasons': self.reasons,
+                'byte_ranges': [list(byte_range) for byte_range in self.byte_ranges]}
+
+
+def report_from_dict(data: dict) -> ValidationReport:
+    """Return the report stored in data, a dictionary returned by ValidationReport.to_dict.
+
+    >>> report = ValidationReport(['SSTA'])
+    >>> report.num_rows = 4
+    >>> report_from_dict(report.to_dict()).to_dict() == report.to_dict()
+    True
+    """
+    report = ValidationReport([])
+    report.num_rows = data['num_rows']
+    report.error_counts = dict(data['error_counts'])
+    report.rejected_rows = list(data['rejected_rows'])
+    report.reasons = list(data['reasons'])
+    report.byte_ranges = [(start, end) for start, end in data['byte_ranges']]
+    return report
+
+
+# Functions to check the values of a column or a row against the rules of its columns
+
+def check_column(raw: np.ndarray, rule: ColumnRule) -> Tuple[np.ndarray, np.ndarray]:
+    """Return a tuple containing the typed values of raw, an array of the raw bytes of every
+    field of a column, at index 0, and the error code of each value under rule at index 1.
+
+    The values of a date column are integers, and the values of a number column are floats,
+    where 'nd' becomes NaN. An invalid value becomes 0 or NaN.
+
+    >>> values, errors = check_column(np.array([b'20160326', b'20160231', b'nd']),
+    ...                               ColumnRule('date'))
+    >>> (values.tolist(), errors.tolist())
+    ([20160326, 0, 0], [0, 1, 3])
+    >>> values, errors = check_column(np.array([b'-1.5', b'nd', b'1e999', b'']),
+    ...                               ColumnRule('number', allows_missing=True))
+    >>> (values.tolist(), errors.tolist())
+    ([-1.5, nan, nan, nan], [0, 0, 1, 1])
+    """
+    chars = raw.view(np.uint8).reshape(len(raw), raw.itemsize)
+    lengths = np.count_nonzero(chars, axis=1)
+    missing = raw == b'nd'
+    errors = np.where(missing, 0 if rule.allows_missing else MISSING, VALID).astype(np.uint8)
+
+    if rule.kind == 'date':
+        is_valid = (lengths == 8) & _DATE_CHARS[chars].all(axis=1)
+        values = np.where(is_valid, raw, b'0').astype(np.int64)
+        year, month, day = values // 10000, values // 100 % 100, values % 100
+        is_leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+        days = _DAYS_IN_MONTH[np.clip(month, 0, 12)] + ((month == 2) & is_leap)
+        is_valid &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= days)
+        values[~is_valid] = 0
+    else:
+        is_valid = (lengths > 0) & _NUMBER_CHARS[chars].all(axis=1)
+        values = _to_checked_floats(np.where(is_valid, raw, b'nan'))
+        is_valid &= np.isfinite(values)
+        values[~is_valid] = math.nan
+        in_range = np.ones(len(raw), dtype=bool)
+        if rule.minimum is not None:
+            in_range &= ~(values < rule.minimum)
+        if rule.maximum is not None:
+            in_range &= ~(values > rule.maximum)
+        errors[is_valid & ~in_range] = OUT_OF_RANGE
+
+    errors[~is_valid & ~missing] = INVALID
+    return (values, errors)
+
+
+def _to_checked_floats(raw: np.ndarray) -> np.ndarray:
+    """Return the floats in raw, an array of the raw bytes of numbers, where a value that is
+    not a number becomes NaN.
+
+    >>> _to_checked_floats(np.array([b'1.5', b'1-2', b'-3'])).tolist()
+    [1.5, nan, -3.0]
+    """
+    try:
+        return raw.astype(np.float64)
+    except ValueError:
+        # Only some values are not numbers, so those are found one value at a time
+        return np.array([_parse_float(value) for value in raw.tolist()], dtype=np.float64)
+
+
+def _parse_float(text: bytes) -> float:
+    """Return the float in text, or NaN if text is not a number.
+
+    >>> _parse_float(b'2.5e1')
+    25.0
+    >>> _parse_float(b'1.2.3')
+    nan
+    """
+    try:
+        return float(text)
+    except ValueError:
+        return math.nan
+
+
+def check_value(text: str, rule: ColumnRule) -> int:
+    """Return the error code of text, a single value of a column, under rule.
+
+    This is the same check that check_column makes for every value of a column, without
+    the overhead of numpy for a single value.
+
+    >>> [check_value(text, ColumnRule('date')) for text in ['20000229', '19000229', '2000']]
+    [0, 1, 1]
+    """
+    if text == 'nd':
+        return VALID if rule.allows_missing else MISSING
+
+    if rule.kind == 'date':
+        if len(text) != 8 or not _DATE_CHAR_SET.issuperset(text):
+            return INVALID
+        year, month, day = int(text[:4]), int(text[4:6]), int(text[6:])
+        if not 1 <= month <= 12:
+            return INVALID
+        is_leap = year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+        days = int(_DAYS_IN_MONTH[month]) + (month == 2 and is_leap)
+        return VALID if 1 <= day <= days else INVALID
+
+    if text == '' or not _NUMBER_CHAR_SET.issuperset(text):
+        return INVALID
+    value = _parse_float(text.encode())
+    if not math.isfinite(value):
+        return INVALID
+    elif (rule.minimum is not None and value < rule.minimum) or \
+            (rule.maximum is not None and value > rule.maximum):
+        return OUT_OF_RANGE
+    return VALID
+
+
+def check_row(row: List[str], num_columns: int, indices: Dict[str, int]) -> List[str]:
+    """Return the reasons row, a row of a csv file with num_columns columns, is rejected,
+    where indices maps the name of each checked column to its index in the row. Return an
+    empty list if the row is valid.
+
+    >>> check_row(['20160326', '150', 'nd'], 3,
+    ...           {'Date2': 0, 'Average_Bleaching': 1, 'SSTA': 2})
+    ['Average_Bleaching: not between 0.0 and 100.0']
+    >>> check_row(['20160326', '50'], 3, {'Date2': 0})
+    ['wrong number of fields']
+    """
+    if len(row) != num_columns:
+        return ['wrong number of fields']
+
+    reasons = []
+    for name in indices:
+        error = check_value(row[indices[name]], COLUMN_RULES[name])
+        if error != VALID:
+            reasons.append(f'{name}: {COLUMN_RULES[name].message(error)}')
+    return reasons
+
+
+# Functions to write the quarantine files of a csv file with rejected rows
+
+def quarantine_paths(filepath: str) -> Tuple[str, str]:
+    """Return a tuple containing the path of the csv file the rejected rows of the csv file
+    that filepath refers to are quarantined in at index 0, and the path of the json file its
+    error counts are written to at index 1.
+
+    >>> quarantine_paths('data/coral_bleaching_data.csv')
+    ('data/coral_bleaching_data.rejected.csv', 'data/coral_bleaching_data.rejected.json')
+    """
+    stem = os.path.splitext(filepath)[0]
+    return (stem + _REJECTED_ROWS_SUFFIX, stem + _ERROR_COUNTS_SUFFIX)
+
+
+def write_quarantine(filepath: str, report: ValidationReport) -> None:
+    """Write the quarantine files of the csv file that filepath refers to from report, or
+    remove them if report has no rejected rows.
+
+    The rejected rows are copied as they appear in the csv file, along with their row number
+    (where the row after the header is row 1) and the reasons they were rejected. Nothing is
+    written if the quarantine files cannot be written (for example, if the directory
+    containing the csv file is read-only).
+
+    Preconditions:
+        - report is the report of every row of the csv file
+    """
+    rows_path, counts_path = quarantine_paths(filepath)
+    try:
+        if report.num_rejected() == 0:
+            for path in (rows_path, counts_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return
+
+        with open(filepath, 'rb') as csv_file, open(rows_path + '.tmp', 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['Row', 'Reasons', 'Raw_Row'])
+            for i in range(report.num_rejected()):
+                start, end = report.byte_ranges[i]
+                csv_file.seek(start)
+                raw_row = csv_file.read(end - start).decode('utf-8', errors='replace')
+                writer.writerow([report.rejected_rows[i] + 1, report.reasons[i],
+                                 raw_row.rstrip('\r\n')])
+        os.replace(rows_path + '.tmp', rows_path)
+
+        with open(counts_path + '.tmp', 'w') as file:
+            json.dump({'source': os.path.abspath(filepath),
+                       'num_rows': report.num_rows,
+                       'num_rejected': report.num_rejected(),
+                       'error_counts': report.error_counts}, file, indent=2)
+        os.replace(counts_path + '.tmp', counts_path)
+    except OSError:
+        return
+
+
+if __name__ == '__main__':
+    import python_ta
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    python_ta.check_all(config={
+        'extra-imports': ['csv', 'json', 'math', 'os', 'python_ta.contracts', 'numpy'],
+        'allowed-io': ['write_quarantine'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import doctest
+    doctest.testmod(verbose=True)
@@ -5,31 +5,96 @@ Information
 This Python module contains the functions that will be used to visually display the results
 of the computations that have been performed on the data.
 
+Every figure can either be shown in a browser, or written to an output directory as a
+self-contained HTML file or as figure JSON. The files written to an output directory are named
+after a hash of the data they show and of the code of this module, so a figure is not built
+again unless its data or the way it is drawn has changed since it was last written.
+
 Copyright Information
 ===============================
 This file is Copyright (c) 2020 Anis Singh.
 """
-from typing import List, Dict, Tuple
+import base64
+import glob
+import hashlib
+import json
+import math
+import os
+import shutil
+from typing import List, Dict, Optional, Tuple
 from plotly.subplots import make_subplots
-import plotly.express as px
 import plotly.graph_objects as go
+import numpy as np
 import pandas as pd
+from compute_on_data import YearIndex, bin_by_location
+from regression import RegressionResult, RegressionStats
+import instrumentation
 
 
 # Function to visualize the correlation between the severity of a coral bleaching event
 # and the average sea surface temperature anomaly at that time.
 
-def show_correlation(x_coords: List[float], y_coords: List[float]) -> None:
+@instrumentation.stage
+def show_correlation(x_coords: List[float], y_coords: List[float],
+                     raw_fit: Optional[RegressionResult] = None,
+                     output_dir: Optional[str] = None, output_format: str = 'html',
+                     intervals: Optional[Tuple[Dict[float, Tuple[float, float]],
+                                               Dict[str, Tuple[float, float]]]] = None) \
+        -> Optional[str]:
     """Plot the given x and y coordinates and plot a line of best fit for the points.
 
+    If raw_fit is not None, it is plotted as a second line of best fit, which was fit to the
+    SSTA of every row of the dataset instead of to the average SSTAs. The line of best fit of
+    the points is only plotted if there are at least two points with different x coordinates.
+
+    If intervals is not None, it contains the confidence intervals of the average SSTA of
+    each severity at index 0, which are drawn as error bars, and of the properties of raw_fit
+    at index 1, whose slope is shown in the legend (see the bootstrap module).
+
+    If output_dir is None, the figure is shown in a browser and None is returned. Otherwise,
+    the figure is written to output_dir in the given output_format, and the path of the file
+    it was written to is returned.
+
     Preconditions:
         - x_coords and y_coords are the return values of convert_to_points from the
           compute_on_data module
+        - output_format in {'html', 'json'}
+        - intervals is None or all(y in intervals[0] for y in y_coords)
     """
-    fig = px.scatter(x=x_coords,
-                     y=y_coords,
-                     trendline='ols',
-                     trendline_color_override='darkblue')
+    path = _figure_path('correlation', [repr(x_coords), repr(y_coords), repr(raw_fit),
+                                        repr(intervals)], output_dir, output_format)
+    if path is not None and os.path.exists(path):
+        return path
+
+    stats = RegressionStats()
+    stats.add_points(x_coords, y_coords)
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=x_coords, y=y_coords, mode='markers', name='Severities'))
+    if intervals is not None:
+        fig.update_traces(error_x=_error_bars(x_coords, [intervals[0][y] for y in y_coords]),
+                          selector=dict(name='Severities'))
+
+    # Note: A line of best fit is straight, so it is drawn as a line between only two points,
+    # at the smallest and the largest x coordinates. No line is drawn if there are no points
+    # (such as for a region without coral bleaching data), or if they cannot be fit.
+    line_x = [min(x_coords), max(x_coords)] if x_coords != [] else []
+    if stats.can_fit():
+        fit = stats.fit()
+        fig.add_trace(go.Scatter(x=line_x, y=[fit.predict(x) for x in line_x], mode='lines',
+                                 line=dict(color='darkblue'),
+                                 name=f'Line of best fit (R\N{SUPERSCRIPT TWO} = '
+                                      f'{fit.r_squared:.3f})'))
+    if raw_fit is not None:
+        slope_interval = ''
+        if intervals is not None:
+            low, high = intervals[1]['slope']
+            slope_interval = f', CI of slope {low:.3f} to {high:.3f}'
+        fig.add_trace(go.Scatter(x=line_x, y=[raw_fit.predict(x) for x in line_x],
+                                 mode='lines', line=dict(color='darkblue', dash='dash'),
+                                 name=f'Line of best fit of every row (R\N{SUPERSCRIPT TWO} = '
+                                      f'{raw_fit.r_squared:.3f}{slope_interval})'))
+
     fig.update_layout(
         title=dict(
             text='Relationship Between Change in Sea Surface Temperature and Coral Bleaching',
@@ -44,19 +109,38 @@ def show_correlation(x_coords: List[float], y_coords: List[float]) -> None:
         yaxis_title='Severity of Coral Bleaching (%)',
         font_size=14
     )
-    fig.show()
+    return _output_figure(fig, path, output_format)
 
 
 # Function to visualize the frequency and average severity of the coral bleaching events
 # per year.
 
-def show_freq_and_severity(data: Dict[int, Tuple[int, float]]) -> None:
+@instrumentation.stage
+def show_freq_and_severity(data: Dict[int, Tuple[int, float]],
+                           output_dir: Optional[str] = None, output_format: str = 'html',
+                           intervals: Optional[Dict[int, Tuple[Tuple[float, float],
+                                                               Tuple[float, float]]]] = None) \
+        -> Optional[str]:
     """Plot the values that correspond to each key in data as two bar charts.
 
+    If intervals is not None, it maps each key in data to the confidence intervals of its
+    frequency and average severity (see the bootstrap module), which are drawn as error bars.
+
+    If output_dir is None, the figure is shown in a browser and None is returned. Otherwise,
+    the figure is written to output_dir in the given output_format, and the path of the file
+    it was written to is returned.
+
     Preconditions:
         - data is the return value of get_freq_and_severity from the compute_on_data
           module
+        - output_format in {'html', 'json'}
+        - intervals is None or all(key in intervals for key in data)
     """
+    path = _figure_path('freq_and_severity', [repr(data), repr(intervals)], output_dir,
+                        output_format)
+    if path is not None and os.path.exists(path):
+        return path
+
     x_values = [str(key) for key in data]
     y1_values = [data[key][0] for key in data]
     y2_values = [data[key][1] for key in data]
@@ -68,6 +152,11 @@ def show_freq_and_severity(data: Dict[int, Tuple[int, float]]) -> None:
 
     fig.add_trace(go.Bar(name='Frequency', x=x_values, y=y1_values), row=1, col=1)
     fig.add_trace(go.Bar(name='Average Severity', x=x_values, y=y2_values), row=1, col=2)
+    if intervals is not None:
+        fig.update_traces(error_y=_error_bars(y1_values, [intervals[key][0] for key in data]),
+                          selector=dict(name='Frequency'))
+        fig.update_traces(error_y=_error_bars(y2_values, [intervals[key][1] for key in data]),
+                          selector=dict(name='Average Severity'))
 
     fig.update_layout(title=dict(
         text='Frequency and Average Severity of Coral Bleaching Per Year',
@@ -78,81 +167,122 @@ def show_freq_and_severity(data: Dict[int, Tuple[int, float]]) -> None:
             color='black'
         )
     ))
-    fig.show()
+    return _output_figure(fig, path, output_format)
+
+
+def _error_bars(values: List[float], intervals: List[Tuple[float, float]]) -> dict:
+    """Return the plotly error bars that reach from each value in values to the bounds of its
+    confidence interval in intervals. An undefined (NaN) bound has no error bar.
+
+    Preconditions:
+        - len(values) == len(intervals)
+
+    >>> _error_bars([2.0, 5.0], [(1.5, 3.0), (math.nan, 5.0)])
+    {'type': 'data', 'symmetric': False, 'array': [1.0, 0.0], 'arrayminus': [0.5, 0.0]}
+    """
+    above = [intervals[i][1] - values[i] for i in range(len(values))]
+    below = [values[i] - intervals[i][0] for i in range(len(values))]
+
+    # Note: A value can be slightly outside of its interval after it has been rounded
+    return {'type': 'data', 'symmetric': False,
+            'array': [0.0 if math.isnan(x) else max(x, 0.0) for x in above],
+            'arrayminus': [0.0 if math.isnan(x) else max(x, 0.0) for x in below]}
 
 
 # Function to generate an interactive map of the world that plots coral bleaching
 # events for every year and allows the user to choose which year they wish to view.
 
-def generate_map(df: pd.DataFrame) -> None:
+@instrumentation.stage
+def generate_map(df: pd.DataFrame, year_index: Optional[YearIndex] = None,
+                 resolution: Optional[float] = None, output_dir: Optional[str] = None,
+                 output_format: str = 'html') -> Optional[str]:
     """Generate an interactive map based on the data contained in the DataFrame
     object df.
 
+    If year_index is not None, it is used to select the rows of each year instead of
+    indexing df again.
+
+    If resolution is not None, the bleaching events of each year are aggregated into the cells
+    of a latitude/longitude grid whose cells are resolution degrees wide and high, and the map
+    shows one marker per cell (with the number of events in the cell and their maximum and mean
+    severity) instead of one marker per event. This bounds the number of markers on the map no
+    matter how many rows df has.
+
+    If output_dir is None, the map is shown in a browser and None is returned. Otherwise, the
+    map is written to output_dir in the given output_format, and the path of the file it was
+    written to is returned.
+
     Preconditions:
         - df is the DataFrame returned by the function convert_dates in the
           compute_on_data module
+        - year_index is None or year_index is a YearIndex of df
+        - resolution is None or resolution > 0
+        - output_format in {'html', 'json'}
     """
-    pd.set_option('mode.chained_assignment', None)
+    map_columns = ['Date2', 'Latitude_Degrees', 'Longitude_Degrees', 'Average_Bleaching']
+    map_data = pd.util.hash_pandas_object(df[map_columns], index=False).to_numpy()
+    path = _figure_path('map', [map_data.tobytes(), repr(resolution)], output_dir,
+                        output_format)
+    if path is not None and os.path.exists(path):
+        return path
+
+    if year_index is None:
+        # Note: The index sorts the rows of df once, by year and then by severity, so that the
+        # rows of every year are a contiguous slice of the sorted rows. Selecting the rows of a
+        # year is then a single slice, instead of a scan of every row of df.
+        year_index = YearIndex(df)
 
     data_slider = []
-    years = sorted(df.Date2.unique())
 
     # Remove the years with insufficient data
-    for i in range(1998, 2003):
-        # There was no data recorded in 1999, and so attempting to remove 1999 from years would
-        # throw an error because 1999 would not be in the list
-        if i == 1999:
-            continue
-        years.remove(i)
-
-    start_year = min(years)
+    years = _map_years(year_index)
 
     # Iterate through each year in years to get the necessary data
     for year in years:
-        # Select the year
-        # Uses '&' and not 'and' because bitwise operator is required
-        df_specific_year = df[(df['Date2'] == year) & (df['Average_Bleaching'] > 0.0)]
-
-        # Convert every column object type to a string
-        for col in df_specific_year.columns:
-            df_specific_year[col] = df_specific_year[col].astype('string')
-
-        # Note: This line of code is very subtle but powerful and necessary. If you read
-        # a little further down this file, you will notice that the opacity of a specific
-        # marker is determined by its average bleaching percentage. However, this presents
-        # a small bug if left unhandled, because multiple bleaching events can be recorded
-        # in the same year with the exact same longitude and latitude, and so the point
-        # that is added LAST will be the only point that shows up in that location on the
-        # map for that year. This will cause some points to appear much darker than they
-        # should be, because there is a point behind it that is more opaque, but it
-        # isn't showing up because it is in the exact same latitude and longitude position
-        # as the point with a lower opacity. This line of code ensures that the darkest
-        # opacity point is the one that will show up on the map by sorting df_specific_year in
-        # ascending order based on its Average_Bleaching column. As a side comment, points
-        # that are stacked on top of each other will always appear darker (since there are
-        # more of them), but you will only be able to see one point on the map. This WILL
-        # make some points appear darker than others that have the same (or slightly higher)
-        # bleaching values when a user hovers over the point, but this is fair because that
-        # area did experience more bleaching.
-        df_specific_year = df_specific_year.sort_values(['Average_Bleaching'])
-
-        # Create a new column for mouse-hovering text
-        df_specific_year['text'] = 'Bleaching %: ' + df_specific_year['Average_Bleaching']
-
-        # Create a new column for the opacity of the markers
+        # Select the coral bleaching events of the year
+        # Note: This is very subtle but powerful and necessary. If you read a little further
+        # down this file, you will notice that the opacity of a specific marker is determined
+        # by its average bleaching percentage. However, this presents a small bug if left
+        # unhandled, because multiple bleaching events can be recorded in the same year with
+        # the exact same longitude and latitude, and so the point that is added LAST will be
+        # the only point that shows up in that location on the map for that year. This will
+        # cause some points to appear much darker than they should be, because there is a
+        # point behind it that is more opaque, but it isn't showing up because it is in the
+        # exact same latitude and longitude position as the point with a lower opacity. The
+        # rows of each year in year_index are sorted in ascending order based on their
+        # Average_Bleaching column, which ensures that the darkest opacity point is the one
+        # that will show up on the map. As a side comment, points that are stacked on top of
+        # each other will always appear darker (since there are more of them), but you will
+        # only be able to see one point on the map. This WILL make some points appear darker
+        # than others that have the same (or slightly higher) bleaching values when a user
+        # hovers over the point, but this is fair because that area did experience more
+        # bleaching.
+        df_specific_year = year_index.events_in_year(year)
+
+        if resolution is None:
+            severities = df_specific_year['Average_Bleaching']
+
+            # Create the mouse-hovering text
+            text = 'Bleaching %: ' + severities.astype(str)
+        else:
+            # Note: Aggregating the events into cells also solves the problem described above,
+            # because all the events at the same location end up in the same cell, and the
+            # opacity of the cell's marker is determined by the most severe of them.
+            df_specific_year = bin_by_location(df_specific_year, resolution)
+            severities = df_specific_year['Max_Bleaching']
+
+            # Create the mouse-hovering text
+            mean_severities = df_specific_year['Mean_Bleaching'].round(2)
+            text = ('Max Bleaching %: ' + severities.astype(str)
+                    + '<br>Mean Bleaching %: ' + mean_severities.astype(str)
+                    + '<br>Events: ' + df_specific_year['Count'].astype(str))
+
+        # Create the opacity of the markers
         # Note: 10 is an arbitrary choice that was made to ensure the visibility of each
         # marker, while still accurately reflecting the severity of each bleaching
-        # event
-        df_specific_year['opac'] = df_specific_year['Average_Bleaching'].astype(float) / 10
-
-        # Ensure the maximum value for each opacity is less than or equal to 1.0
-        df_specific_year['opac'] = df_specific_year['opac'].where(
-            df_specific_year['opac'] <= 1.0, 1.0)
-
-        # Ensure every point is somewhat visible. It should be noted that 0.3 is an arbitrary
-        # choice.
-        df_specific_year['opac'] = df_specific_year['opac'].where(
-            df_specific_year['opac'] > 0.3, 0.3)
+        # event. The maximum value for each opacity is 1.0, and every point is made somewhat
+        # visible by a minimum opacity of 0.3, which is also an arbitrary choice.
+        opacity = (severities / 10).clip(0.3, 1.0)
 
         # Create the data for this year
         data_this_year = go.Scattergeo(
@@ -161,30 +291,29 @@ def generate_map(df: pd.DataFrame) -> None:
             mode='markers',
             marker=dict(
                 size=7.5,
-                opacity=df_specific_year['opac'],
+                opacity=opacity,
                 line=dict(
                     color='red',
                     width=2
                 )
             ),
-            text=df_specific_year['text'],
+            text=text,
             hoverinfo='text'
         )
 
         # Add this data to data slider
         data_slider.append(data_this_year)
 
-    # Make only the 2003 data visible when the map is first displayed
-    data_slider[0].visible = True
-    for i in range(1, len(data_slider)):
-        data_slider[i].visible = False
+    # Make only the data of the first year (2003) visible when the map is first displayed
+    for i in range(len(data_slider)):
+        data_slider[i].visible = i == 0
 
     # Create the steps for the slider
     steps = []
     for i in range(len(data_slider)):
         step = dict(method='restyle',
                     args=['visible', [False] * len(data_slider)],
-                    label='Year ' + str(i + start_year))
+                    label='Year ' + str(years[i]))
 
         # For a certain year, make only the data from that year visible
         step['args'][1][i] = True
@@ -221,8 +350,316 @@ def generate_map(df: pd.DataFrame) -> None:
         )
     ))
 
-    # Show the figure object
-    fig.show()
+    # Show the figure object, or write it to the output directory
+    return _output_figure(fig, path, output_format)
+
+
+# Functions to generate the same map as generate_map as a single trace that is animated from
+# year to year, instead of one trace per year.
+#
+# Note: generate_map adds a trace for every year and hides all but one of them, so the browser
+# holds the markers of every year and restyles every trace whenever the slider moves. Here the
+# map has a single trace, and moving the slider replaces the points of that trace with the
+# points of the chosen year, either from a frame of the figure or from a separate file of the
+# points of that year that is only loaded when the year is chosen.
+
+# The JavaScript that is added to an HTML map whose years are loaded lazily. It loads the file
+# of the points of a year (whose arrays are little-endian float64 arrays encoded in base64) the
+# first time the year is chosen with the slider, and replaces the points of the trace with them.
+_LAZY_MAP_SCRIPT = """
+var gd = document.getElementById('{plot_id}');
+var shardDir = %s;
+var binned = %s;
+var shards = {};
+var chosenYear = null;
+
+function decodeArray(encoded) {
+    var binary = atob(encoded);
+    var bytes = new Uint8Array(binary.length);
+    for (var i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    return new Float64Array(bytes.buffer);
+}
+
+function loadYear(year) {
+    if (!(year in shards)) {
+        shards[year] = fetch(shardDir + '/' + year + '.json').then(function (response) {
+            return response.json();
+        }).then(function (shard) {
+            var arrays = {};
+            for (var name in shard) {
+                arrays[name] = decodeArray(shard[name]);
+            }
+            return arrays;
+        });
+    }
+    return shards[year];
+}
+
+gd.on('plotly_sliderchange', function (event) {
+    var year = event.step.value;
+    chosenYear = year;
+    loadYear(year).then(function (points) {
+        // Ignore the points of a year that is no longer chosen
+        if (year !== chosenYear) {
+            return;
+        }
+        var opacity = points.severity.map(function (severity) {
+            return Math.min(Math.max(severity / 10, 0.3), 1.0);
+        });
+        var customdata = Array.from(points.severity, function (severity, i) {
+            return binned ? [severity, points.mean[i], points.count[i]] : [severity];
+        });
+        Plotly.restyle(gd, {'lat': [points.lat], 'lon': [points.lon],
+                            'marker.opacity': [opacity], 'customdata': [customdata]}, [0]);
+    });
+});
+"""
+
+
+@instrumentation.stage
+def generate_animated_map(df: pd.DataFrame, year_index: Optional[YearIndex] = None,
+                          resolution: Optional[float] = None, output_dir: Optional[str] = None,
+                          output_format: str = 'html', lazy: bool = False) -> Optional[str]:
+    """Generate the same interactive map as generate_map, but with a single trace whose points
+    are replaced by the points of the year chosen with the slider.
+
+    If lazy is False, the points of every year are stored in the figure as an animation frame
+    of that year. If lazy is True, the figure only contains the points of the first year, and
+    the points of every year are written to a separate json file (in a directory next to the
+    HTML file of the map) that the map loads the first time the year is chosen. The size of the
+    HTML file, and how long it takes to load, then do not depend on the number of years.
+
+    Note: Browsers do not load files from a page that was opened from a file, so a map whose
+    years are loaded lazily must be opened through a web server (for example, by running
+    python -m http.server in output_dir).
+
+    See generate_map for year_index, resolution, output_dir and output_format.
+
+    Preconditions:
+        - df is the DataFrame returned by the function convert_dates in the
+          compute_on_data module
+        - year_index is None or year_index is a YearIndex of df
+        - resolution is None or resolution > 0
+        - output_format in {'html', 'json'}
+        - not lazy or (output_dir is not None and output_format == 'html')
+    """
+    map_columns = ['Date2', 'Latitude_Degrees', 'Longitude_Degrees', 'Average_Bleaching']
+    map_data = pd.util.hash_pandas_object(df[map_columns], index=False).to_numpy()
+    name = 'map_lazy' if lazy else 'map_frames'
+    path = _figure_path(name, [map_data.tobytes(), repr(resolution)], output_dir,
+                        output_format)
+    if path is not None and os.path.exists(path):
+        return path
+
+    if year_index is None:
+        year_index = YearIndex(df)
+    years = _map_years(year_index)
+    points = {year: _map_points(year_index, year, resolution) for year in years}
+
+    if resolution is None:
+        hovertemplate = 'Bleaching %: %{customdata[0]}<extra></extra>'
+    else:
+        hovertemplate = ('Max Bleaching %: %{customdata[0]}<br>'
+                         'Mean Bleaching %: %{customdata[1]:.2f}<br>'
+                         'Events: %{customdata[2]}<extra></extra>')
+
+    first_points = points[years[0]] if years != [] else _map_points(None, None, resolution)
+    trace = go.Scattergeo(mode='markers', hovertemplate=hovertemplate,
+                          **_points_to_trace(first_points))
+    trace.update(marker=dict(size=7.5, line=dict(color='red', width=2)))
+
+    # Create the steps for the slider, which animate the trace to the frame of a year, or (if
+    # the years are loaded lazily) do nothing but tell the script of the map which year to load
+    steps = []
+    for year in years:
+        if lazy:
+            steps.append(dict(method='skip', value=str(year), label='Year ' + str(year)))
+        else:
+            steps.append(dict(method='animate', label='Year ' + str(year),
+                              args=[[str(year)], dict(mode='immediate',
+                                                      frame=dict(duration=0, redraw=True),
+                                                      transition=dict(duration=0))]))
+
+    frames = []
+    if not lazy:
+        frames = [go.Frame(name=str(year), traces=[0],
+                           data=[go.Scattergeo(**_points_to_trace(points[year]))])
+                  for year in years]
+
+    layout = dict(geo=dict(scope='world', showcoastlines=True, coastlinecolor='black',
+                           showland=True, landcolor='LightGreen',
+                           showocean=True, oceancolor='LightBlue',
+                           showlakes=True, lakecolor='Blue',
+                           showrivers=True, rivercolor='Blue',
+                           projection=dict(
+                               type='orthographic'
+                           )),
+                  sliders=[dict(active=0, pad={'t': 1}, steps=steps)],
+                  title=dict(text='Map of Coral Bleaching Events and their Severity', x=0.5,
+                             font=dict(size=28, color='black', family='Gravitas One')))
+
+    fig = go.Figure(data=[trace], layout=layout, frames=frames)
+
+    if not lazy:
+        return _output_figure(fig, path, output_format)
+
+    shard_dir = _write_map_shards(path, points)
+    script = _LAZY_MAP_SCRIPT % (json.dumps(os.path.basename(shard_dir)),
+                                 json.dumps(resolution is not None))
+    return _output_figure(fig, path, output_format, script)
+
+
+def _map_years(year_index: YearIndex) -> List[int]:
+    """Return the years of year_index that are shown on the map, in ascending order.
+
+    Note: There was no data recorded in 1999, and the years 1998 to 2002 have insufficient data,
+    so they are removed. The rows of a region of the map (such as the rows returned by a
+    SpatialIndex) may not have data for the other years either, so only the years that have
+    data are removed.
+    """
+    return [year for year in year_index.years() if not 1998 <= year <= 2002]
+
+
+def _map_points(year_index: Optional[YearIndex], year: Optional[int],
+                resolution: Optional[float]) -> Dict[str, np.ndarray]:
+    """Return a dictionary mapping the name of each array of the points that generate_map shows
+    for year to that array, or empty arrays if year_index is None:
+        - lat and lon: the latitude and longitude of each point
+        - severity: the severity of each point (the maximum severity of a cell, if resolution
+          is not None)
+        - mean and count: the mean severity, and the number of events, of each cell (only if
+          resolution is not None)
+    The points are in ascending order of severity, for the reason explained in generate_map.
+    """
+    if year_index is None:
+        events = pd.DataFrame({'Latitude_Degrees': [], 'Longitude_Degrees': [],
+                               'Average_Bleaching': []})
+    else:
+        events = year_index.events_in_year(year)
+
+    if resolution is None:
+        return {'lat': events['Latitude_Degrees'].to_numpy(dtype=np.float64),
+                'lon': events['Longitude_Degrees'].to_numpy(dtype=np.float64),
+                'severity': events['Average_Bleaching'].to_numpy(dtype=np.float64)}
+
+    cells = bin_by_location(events, resolution)
+    return {'lat': cells['Latitude_Degrees'].to_numpy(dtype=np.float64),
+            'lon': cells['Longitude_Degrees'].to_numpy(dtype=np.float64),
+            'severity': cells['Max_Bleaching'].to_numpy(dtype=np.float64),
+            'mean': cells['Mean_Bleaching'].to_numpy(dtype=np.float64),
+            'count': cells['Count'].to_numpy(dtype=np.float64)}
+
+
+def _points_to_trace(points: Dict[str, np.ndarray]) -> dict:
+    """Return the properties of a Scattergeo trace that shows points, as returned by
+    _map_points.
+
+    >>> trace = _points_to_trace({'lat': np.array([1.0]), 'lon': np.array([2.0]),
+    ...                           'severity': np.array([5.0])})
+    >>> trace['marker']['opacity'].tolist(), trace['customdata'].tolist()
+    ([0.5], [[5.0]])
+    """
+    # Note: See generate_map for how the opacity of each marker is chosen
+    opacity = np.clip(points['severity'] / 10, 0.3, 1.0)
+    if 'mean' in points:
+        customdata = np.column_stack([points['severity'], points['mean'], points['count']])
+    else:
+        customdata = points['severity'].reshape(-1, 1)
+    return dict(lat=points['lat'], lon=points['lon'], marker=dict(opacity=opacity),
+                customdata=customdata)
+
+
+def _write_map_shards(path: str, points: Dict[int, Dict[str, np.ndarray]]) -> str:
+    """Write the points of each year in points to its own json file in the directory of
+    the lazily loaded map at path, replacing the directories of any older versions of the map,
+    and return the directory.
+
+    Each array of the points is written as a little-endian float64 array encoded in base64,
+    which is both smaller and faster to decode than a json list of numbers.
+
+    Preconditions:
+        - path was returned by _figure_path
+    """
+    shard_dir = os.path.splitext(path)[0]
+    name = os.path.basename(shard_dir).rsplit('-', 1)[0]
+    for old_dir in glob.glob(os.path.join(glob.escape(os.path.dirname(path)),
+                                          f'{glob.escape(name)}-*')):
+        if os.path.isdir(old_dir):
+            shutil.rmtree(old_dir)
+
+    os.makedirs(shard_dir)
+    for year in points:
+        shard = {array_name: base64.b64encode(
+            points[year][array_name].astype('<f8').tobytes()).decode('ascii')
+            for array_name in points[year]}
+        with open(os.path.join(shard_dir, f'{year}.json'), 'w') as file:
+            json.dump(shard, file)
+    return shard_dir
+
+
+# Functions to write figures to an output directory, named after a hash of the data they show.
+
+def _figure_path(name: str, inputs: list, output_dir: Optional[str],
+                 output_format: str) -> Optional[str]:
+    """Return the path of the file in output_dir that the figure called name, which shows the
+    data in inputs, is written to in the given output_format, or None if output_dir is None.
+
+    The path also depends on the source of this module, so that a figure is written again
+    after the way it is drawn changes.
+
+    Preconditions:
+        - all(isinstance(item, str) or isinstance(item, bytes) for item in inputs)
+        - output_format in {'html', 'json'}
+    """
+    if output_dir is None:
+        return None
+
+    digest = hashlib.sha256()
+    with open(__file__, 'rb') as file:
+        digest.update(hashlib.sha256(file.read()).digest())
+    for item in inputs:
+        if isinstance(item, str):
+            item = item.encode()
+        # The length of each item is included so that different inputs cannot produce the same
+        # bytes when they are joined together
+        digest.update(str(len(item)).encode() + b':' + item)
+
+    return os.path.join(output_dir, f'{name}-{digest.hexdigest()[:16]}.{output_format}')
+
+
+def _output_figure(fig: go.Figure, path: Optional[str], output_format: str,
+                   post_script: Optional[str] = None) -> Optional[str]:
+    """Show fig in a browser if path is None, and otherwise write fig to path in the given
+    output_format, replacing any older version of the same figure. Return path.
+
+    If post_script is not None, it is JavaScript that is run after an HTML figure is drawn.
+
+    An HTML figure does not embed the plotly.js bundle. Instead, it refers to a plotly.min.js
+    file that is written once to the output directory and shared by every HTML figure in it.
+
+    Preconditions:
+        - path is None or path was returned by _figure_path
+        - output_format in {'html', 'json'}
+    """
+    if path is None:
+        fig.show()
+        return None
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    # Remove the files of the same figure that show older data
+    name = os.path.basename(path).rsplit('-', 1)[0]
+    for old_path in glob.glob(os.path.join(glob.escape(os.path.dirname(path)),
+                                           f'{glob.escape(name)}-*.{output_format}')):
+        os.remove(old_path)
+
+    if output_format == 'html':
+        fig.write_html(path, include_plotlyjs='directory', post_script=post_script)
+    else:
+        fig.write_json(path)
+    return path
 
 
 if __name__ == '__main__':
@@ -233,9 +670,11 @@ if __name__ == '__main__':
     python_ta.contracts.check_all_contracts()
 
     python_ta.check_all(config={
-        'extra-imports': ['python_ta.contracts', 'plotly.express', 'pandas',
-                          'plotly.graph_objects', 'plotly.subplots'],
-        'allowed-io': [],
+        'extra-imports': ['base64', 'glob', 'hashlib', 'json', 'math', 'os', 'shutil',
+                          'python_ta.contracts', 'numpy', 'pandas',
+                          'plotly.graph_objects', 'plotly.subplots', 'compute_on_data',
+                          'regression', 'instrumentation'],
+        'allowed-io': ['_figure_path', '_output_figure', '_write_map_shards'],
         'max-line-length': 100,
         'disable': ['R1705', 'C0200']
     })